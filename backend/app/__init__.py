@@ -3,10 +3,12 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from dotenv import load_dotenv
 from flask_cors import CORS
+from flask_caching import Cache
 import os
 
 db = SQLAlchemy()
 migrate = Migrate()
+cache = Cache()
 
 def create_app(config_name=None):
     load_dotenv()
@@ -25,7 +27,23 @@ def create_app(config_name=None):
     db.init_app(app)
     migrate.init_app(app, db)
 
+    from .caching import init_cache
+    init_cache(app)
+
     from .routes import main
     app.register_blueprint(main)
 
+    # DDL só em flask upgrade-db: aqui apenas avisa se o banco está atrasado
+    from .schema import pending_schema_changes
+    with app.app_context():
+        try:
+            with db.engine.connect() as connection:
+                pending = pending_schema_changes(connection)
+            if pending:
+                app.logger.warning(
+                    f'Database schema is missing {", ".join(pending)}; run "flask upgrade-db"'
+                )
+        except Exception as e:
+            app.logger.error(f'Failed to inspect database schema: {str(e)}')
+
     return app
@@ -0,0 +1,203 @@
+# analytics.py
+"""
+Análises vetorizadas sobre arrays NumPy.
+
+As funções de array (returns, rolling_mean, rolling_std, sharpe, sortino,
+max_drawdown) recebem e devolvem arrays float64 e usam somas acumuladas,
+então o histórico inteiro de um usuário custa O(n) qualquer que seja a
+janela.
+
+As funções calculate_* mantêm as assinaturas das equivalentes em utils.py
+(listas de Decimal na entrada, Decimal arredondado em centavos na saída) e
+aceitam exact=True para calcular com aritmética Decimal (delegando a
+utils.py quando a função existe lá), para relatórios em que o
+arredondamento de float não é aceitável.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+from . import utils
+
+CENTS = Decimal('0.01')
+
+
+def to_array(values):
+    """Converte uma sequência de Decimal/int/float em array float64"""
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float64, copy=False)
+    return np.fromiter((float(value) for value in values), dtype=np.float64, count=len(values))
+
+
+def _to_decimal(value):
+    # Arredondar antes em 8 casas absorve o erro do float nos empates de meio centavo (5.7549999... -> 5.755)
+    return Decimal(repr(round(float(value), 8))).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+# === FUNÇÕES DE ARRAY ===
+
+def returns(balances):
+    """Retornos simples entre saldos consecutivos (0 onde o saldo anterior não é positivo)"""
+    balances = to_array(balances)
+    if balances.size < 2:
+        return np.empty(0)
+
+    previous = balances[:-1]
+    changes = np.diff(balances)
+    return np.divide(changes, previous, out=np.zeros_like(changes), where=previous > 0)
+
+
+def rolling_mean(values, window):
+    """Média de cada janela completa (len(values) - window + 1 resultados) a partir de uma soma acumulada"""
+    values = to_array(values)
+    if window <= 0 or values.size < window:
+        return np.empty(0)
+
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    return (sums[window:] - sums[:-window]) / window
+
+
+def rolling_std(values, window, ddof=1):
+    """
+    Desvio padrão de cada janela completa a partir das somas acumuladas de x
+    e x². Os valores são centrados na média global antes, para limitar o
+    cancelamento numérico.
+    """
+    values = to_array(values)
+    if window <= ddof or values.size < window:
+        return np.empty(0)
+
+    centered = values - values.mean()
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+
+    window_sums = sums[window:] - sums[:-window]
+    window_squares = squares[window:] - squares[:-window]
+    variance = (window_squares - window_sums * window_sums / window) / (window - ddof)
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def sharpe(period_returns, risk_free_rate=0.02):
+    """Retorno médio excedente sobre o desvio padrão amostral (0 quando indefinido)"""
+    period_returns = to_array(period_returns)
+    if period_returns.size < 2:
+        return 0.0
+
+    std_dev = period_returns.std(ddof=1)
+    if std_dev == 0:
+        return 0.0
+    return float((period_returns.mean() - risk_free_rate) / std_dev)
+
+
+def sortino(period_returns, risk_free_rate=0.02):
+    """Retorno médio excedente sobre o desvio negativo (0 quando não há perdas)"""
+    period_returns = to_array(period_returns)
+    if period_returns.size < 2:
+        return 0.0
+
+    excess = period_returns - risk_free_rate
+    downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2))
+    if downside == 0:
+        return 0.0
+    return float(excess.mean() / downside)
+
+
+def max_drawdown(balances):
+    """
+    Maior queda de pico a vale de uma série de saldos: valor, percentual do
+    pico e os índices do pico e do vale.
+    """
+    balances = to_array(balances)
+    if balances.size == 0:
+        return {'amount': 0.0, 'percentage': 0.0, 'peak_index': None, 'trough_index': None}
+
+    peaks = np.maximum.accumulate(balances)
+    drawdowns = peaks - balances
+    trough = int(np.argmax(drawdowns))
+    amount = float(drawdowns[trough])
+    if amount <= 0:
+        return {'amount': 0.0, 'percentage': 0.0, 'peak_index': None, 'trough_index': None}
+
+    peak = int(np.argmax(balances[:trough + 1]))
+    peak_value = float(balances[peak])
+    return {
+        'amount': amount,
+        'percentage': amount / peak_value * 100 if peak_value > 0 else 0.0,
+        'peak_index': peak,
+        'trough_index': trough,
+    }
+
+
+# === INTERFACE DECIMAL (mesmas assinaturas de utils.py) ===
+
+def calculate_moving_average(values, window, exact=False):
+    """Média móvel de uma lista de valores"""
+    if len(values) < window:
+        return values
+
+    if exact:
+        return utils.calculate_moving_average(values, window)
+
+    return [_to_decimal(value) for value in rolling_mean(values, window)]
+
+
+def calculate_volatility(returns, exact=False):
+    """Volatilidade (desvio padrão) dos retornos"""
+    if len(returns) < 2:
+        return Decimal('0')
+
+    if exact:
+        return utils.calculate_volatility(returns)
+
+    return _to_decimal(to_array(returns).std(ddof=1))
+
+
+def calculate_sharpe_ratio(returns, risk_free_rate=Decimal('0.02'), exact=False):
+    """Índice de Sharpe (retorno ajustado ao risco)"""
+    if not returns or len(returns) < 2:
+        return Decimal('0')
+
+    if exact:
+        return utils.calculate_sharpe_ratio(returns, risk_free_rate)
+
+    return _to_decimal(sharpe(returns, float(risk_free_rate)))
+
+
+def calculate_sortino_ratio(returns, risk_free_rate=Decimal('0.02'), exact=False):
+    """Índice de Sortino (retorno excedente sobre o desvio negativo)"""
+    if not returns or len(returns) < 2:
+        return Decimal('0')
+
+    if exact:
+        excess = [r - risk_free_rate for r in returns]
+        downside_variance = sum(min(e, Decimal('0')) ** 2 for e in excess) / len(excess)
+        if downside_variance == 0:
+            return Decimal('0')
+        avg_excess = sum(excess) / len(excess)
+        return (avg_excess / downside_variance.sqrt()).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+    return _to_decimal(sortino(returns, float(risk_free_rate)))
+
+
+def calculate_max_drawdown(balances, exact=False):
+    """Valor e percentual da maior queda de pico a vale de um histórico de saldos"""
+    if exact:
+        peak = max_amount = Decimal('0')
+        max_peak = None
+        for index, balance in enumerate(balances):
+            if index == 0 or balance > peak:
+                peak = balance
+            if peak - balance > max_amount:
+                max_amount, max_peak = peak - balance, peak
+        percentage = (max_amount / max_peak * 100) if max_peak and max_peak > 0 else Decimal('0')
+        return {
+            'amount': max_amount.quantize(CENTS, rounding=ROUND_HALF_UP),
+            'percentage': percentage.quantize(CENTS, rounding=ROUND_HALF_UP),
+        }
+
+    result = max_drawdown(balances)
+    return {
+        'amount': _to_decimal(result['amount']),
+        'percentage': _to_decimal(result['percentage']),
+    }
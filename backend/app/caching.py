@@ -0,0 +1,153 @@
+# caching.py
+"""
+Cache de respostas por usuário (Flask-Caching) e GET condicional.
+
+As chaves das respostas incluem a versão dos dados do usuário
+(versioning.py), incrementada pelo banco a cada escrita; uma resposta em
+cache nunca é servida depois que os dados mudaram, sem precisar conhecer
+as chaves (rotas com query string variam). A mesma versão gera o ETag e o
+Last-Modified, e If-None-Match/If-Modified-Since são respondidos com 304
+antes de executar a rota.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, request
+
+from . import cache
+from .versioning import get_data_version
+
+# Nomes curtos usados em CACHE_TYPE (config.py) -> backends do Flask-Caching 2.x
+CACHE_BACKENDS = {
+    'redis': 'RedisCache',
+    'simple': 'SimpleCache',
+    'null': 'NullCache',
+    'filesystem': 'FileSystemCache',
+}
+
+
+def init_cache(app):
+    """
+    Inicializa o cache a partir de CACHE_TYPE/REDIS_URL/CACHE_DEFAULT_TIMEOUT.
+    Se o Redis estiver configurado mas indisponível, usa o NullCache: as
+    rotas continuam funcionando, sem cache. Um cache em memória por processo
+    daria respostas diferentes em cada worker do gunicorn. O SimpleCache
+    (CACHE_TYPE=simple) só serve para implantações de um único processo.
+    """
+    cache_type = app.config.get('CACHE_TYPE', 'simple')
+    cache_type = CACHE_BACKENDS.get(cache_type.lower(), cache_type)
+
+    config = {
+        'CACHE_TYPE': cache_type,
+        'CACHE_DEFAULT_TIMEOUT': app.config.get('CACHE_DEFAULT_TIMEOUT', 300),
+        'CACHE_KEY_PREFIX': 'betting:',
+    }
+
+    if cache_type == 'RedisCache':
+        redis_url = app.config.get('REDIS_URL')
+        try:
+            import redis
+            redis.from_url(redis_url, socket_connect_timeout=0.5).ping()
+            config['CACHE_REDIS_URL'] = redis_url
+        except Exception as e:
+            app.logger.warning(f'Redis unavailable ({e}), caching disabled (NullCache)')
+            config['CACHE_TYPE'] = 'NullCache'
+
+    cache.init_app(app, config=config)
+
+
+def _etag(user_id, version):
+    path_digest = hashlib.sha1(request.full_path.encode()).hexdigest()[:12]
+    return f'{user_id}-{version}-{path_digest}'
+
+
+def _last_modified(updated_at):
+    """
+    Last-Modified tem precisão de segundos: a data da última escrita é
+    arredondada para cima. Enquanto esse segundo não terminou, outra escrita
+    ainda pode cair nele com o mesmo valor, então o validador não é emitido
+    (o ETag continua valendo).
+    """
+    if updated_at is None:
+        return None
+    rounded = updated_at.replace(microsecond=0)
+    if rounded < updated_at:
+        rounded += timedelta(seconds=1)
+    return rounded if rounded <= datetime.utcnow() else None
+
+
+def _is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _user_view(f, use_cache):
+    @wraps(f)
+    def decorated(current_user_id, *args, **kwargs):
+        version, updated_at = get_data_version(current_user_id)
+        if not version:
+            # Sem ledger gravado (usuário anterior a ele) a versão não muda com as
+            # escritas: sem cache nem validadores até a primeira escrita criá-lo
+            return f(current_user_id, *args, **kwargs)
+
+        etag = _etag(current_user_id, version)
+        last_modified = _last_modified(updated_at)
+
+        if _is_not_modified(etag, last_modified):
+            return _set_validators(current_app.response_class(status=304), etag, last_modified)
+
+        key, cached = None, None
+        if use_cache:
+            try:
+                key = f'view:{current_user_id}:{version}:{request.full_path}'
+                cached = cache.get(key)
+            except Exception as e:
+                current_app.logger.warning(f'Cache read failed: {e}')
+                key, cached = None, None
+
+        if cached is not None:
+            response = current_app.response_class(cached, status=200, mimetype='application/json')
+            return _set_validators(response, etag, last_modified)
+
+        response = current_app.make_response(f(current_user_id, *args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            return response
+
+        if key:
+            try:
+                cache.set(key, response.get_data())
+            except Exception as e:
+                current_app.logger.warning(f'Cache write failed: {e}')
+
+        return _set_validators(response, etag, last_modified)
+    return decorated
+
+
+def conditional_per_user(f):
+    """
+    Responde 304 quando o cliente já tem a versão atual dos dados do usuário
+    (If-None-Match/If-Modified-Since) e emite ETag/Last-Modified nas respostas 200.
+    Use abaixo de @token_required.
+    """
+    return _user_view(f, use_cache=False)
+
+
+def cached_per_user(f):
+    """
+    Como conditional_per_user, e também cacheia a resposta JSON (status 200)
+    por usuário, versão dos dados, caminho e query string.
+    Use abaixo de @token_required.
+    """
+    return _user_view(f, use_cache=True)
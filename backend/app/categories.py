@@ -0,0 +1,378 @@
+# categories.py
+"""
+Estatísticas por categoria (tabela category_stats) mantidas incrementalmente.
+
+Cada escrita de transação com categoria ajusta a linha (usuário, categoria):
+quantidade, soma de depósitos, soma de saques e data do último uso. As rotas
+de categorias leem essas poucas linhas em vez de agrupar o histórico.
+Usuários anteriores à tabela têm as linhas criadas por flask upgrade-db ou,
+antes disso, na primeira leitura (_ensure_category_stats).
+
+O autocomplete (GET /categories/suggest) usa um índice de prefixos por
+usuário montado a partir dessas linhas e mantido em memória (LRU por
+processo), invalidado pela versão dos dados do usuário.
+"""
+
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import text, bindparam
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import CategoryStats, Transaction
+
+ZERO = Decimal('0.00')
+
+# Sugestões guardadas por prefixo no índice (limite máximo de ?limit=)
+SUGGEST_MAX_RESULTS = 20
+
+# Peso da recência no ranking: o uso de uma categoria vale metade a cada 30 dias
+RECENCY_HALF_LIFE_DAYS = 30
+
+
+def record_category(user_id, category, tx_type, amount, tx_date, sign=1):
+    """
+    Soma (sign=1) ou subtrai (sign=-1) uma transação das estatísticas da sua
+    categoria. Transações sem categoria são ignoradas. Ao subtrair, a linha é
+    removida quando a contagem chega a zero e o último uso é recalculado se a
+    transação removida era a mais recente.
+    """
+    if not category:
+        return
+
+    deposits = amount if tx_type == 'deposit' else ZERO
+    withdrawals = amount if tx_type != 'deposit' else ZERO
+
+    if sign > 0:
+        _upsert_category(user_id, category, 1, deposits, withdrawals, tx_date)
+    else:
+        _subtract_category(user_id, category, deposits, withdrawals, tx_date)
+
+
+def record_categories(user_id, transactions):
+    """
+    Versão em lote de record_category para transações novas (objetos ou dicts
+    com category, type, amount, date): soma em memória e faz um único upsert
+    por categoria tocada.
+    """
+    buckets = {}
+    for tx in transactions:
+        get = tx.get if isinstance(tx, dict) else lambda name: getattr(tx, name)
+        category = get('category')
+        if not category:
+            continue
+
+        bucket = buckets.get(category)
+        if bucket is None:
+            bucket = buckets[category] = {
+                'transaction_count': 0,
+                'total_deposits': ZERO,
+                'total_withdrawals': ZERO,
+                'last_used_at': get('date'),
+            }
+        amount = get('amount')
+        bucket['transaction_count'] += 1
+        if get('type') == 'deposit':
+            bucket['total_deposits'] += amount
+        else:
+            bucket['total_withdrawals'] += amount
+        bucket['last_used_at'] = max(bucket['last_used_at'], get('date'))
+
+    for category, bucket in buckets.items():
+        _upsert_category(
+            user_id, category, bucket['transaction_count'],
+            bucket['total_deposits'], bucket['total_withdrawals'], bucket['last_used_at']
+        )
+
+
+def get_category_names(user_id):
+    """Categorias já usadas pelo usuário, em ordem alfabética"""
+    _ensure_category_stats(user_id)
+    return [
+        row.category for row in db.session.query(CategoryStats.category).filter(
+            CategoryStats.user_id == user_id
+        ).order_by(CategoryStats.category)
+    ]
+
+
+def get_popular_categories(user_id, limit=5):
+    """As `limit` categorias com mais transações"""
+    _ensure_category_stats(user_id)
+    return db.session.query(
+        CategoryStats.category, CategoryStats.transaction_count
+    ).filter(
+        CategoryStats.user_id == user_id
+    ).order_by(
+        CategoryStats.transaction_count.desc(), CategoryStats.category
+    ).limit(limit).all()
+
+
+def get_category_breakdown(user_id):
+    """Linhas de category_stats do usuário, das categorias com mais saques para as com menos"""
+    _ensure_category_stats(user_id)
+    return CategoryStats.query.filter_by(user_id=user_id).order_by(
+        CategoryStats.total_withdrawals.desc(), CategoryStats.category
+    ).all()
+
+
+def _ensure_category_stats(user_id):
+    # Sem linhas mas com transações categorizadas: usuário anterior a category_stats.
+    # Reconstrói e confirma já, para a próxima leitura não repetir o agrupamento
+    has_stats = db.session.query(
+        CategoryStats.query.filter_by(user_id=user_id).exists()
+    ).scalar()
+    if has_stats or not _has_categorized_transactions(user_id):
+        return
+
+    from .versioning import bump_data_version
+    try:
+        with db.session.begin_nested():
+            rebuild_category_stats(db.session.connection(), [user_id])
+    except IntegrityError:
+        # Outra requisição reconstruiu ao mesmo tempo: as linhas dela valem
+        return
+    # O índice de sugestões e o cache de views da versão atual foram montados sem as linhas
+    bump_data_version([user_id])
+    db.session.commit()
+
+
+def _has_categorized_transactions(user_id):
+    # idx_user_category resolve sem ler as linhas
+    return db.session.query(
+        Transaction.query.filter(
+            Transaction.user_id == user_id,
+            Transaction.category.isnot(None),
+            Transaction.category != ''
+        ).exists()
+    ).scalar()
+
+
+def _upsert_category(user_id, category, count, deposits, withdrawals, last_used_at):
+    """INSERT ... ON CONFLICT (user_id, category) DO UPDATE somando os totais"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        greatest = db.func.greatest
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        greatest = db.func.max
+    else:
+        return _upsert_category_orm(user_id, category, count, deposits, withdrawals, last_used_at)
+
+    table = CategoryStats.__table__
+    statement = insert(table).values(
+        user_id=user_id, category=category,
+        transaction_count=count, total_deposits=deposits, total_withdrawals=withdrawals,
+        last_used_at=last_used_at, updated_at=datetime.utcnow()
+    )
+    excluded = statement.excluded
+
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['user_id', 'category'],
+        set_={
+            'transaction_count': table.c.transaction_count + excluded.transaction_count,
+            'total_deposits': table.c.total_deposits + excluded.total_deposits,
+            'total_withdrawals': table.c.total_withdrawals + excluded.total_withdrawals,
+            'last_used_at': greatest(
+                db.func.coalesce(table.c.last_used_at, excluded.last_used_at), excluded.last_used_at
+            ),
+            'updated_at': excluded.updated_at,
+        }
+    ))
+
+
+def _upsert_category_orm(user_id, category, count, deposits, withdrawals, last_used_at):
+    # Bancos sem ON CONFLICT: leitura com lock seguida de insert/update pelo ORM
+    row = CategoryStats.query.filter_by(
+        user_id=user_id, category=category
+    ).with_for_update().first()
+
+    if row is None:
+        db.session.add(CategoryStats(
+            user_id=user_id, category=category,
+            transaction_count=count, total_deposits=deposits, total_withdrawals=withdrawals,
+            last_used_at=last_used_at, updated_at=datetime.utcnow()
+        ))
+        db.session.flush()
+        return
+
+    row.transaction_count += count
+    row.total_deposits += deposits
+    row.total_withdrawals += withdrawals
+    row.last_used_at = max(row.last_used_at or last_used_at, last_used_at)
+    row.updated_at = datetime.utcnow()
+
+
+def _subtract_category(user_id, category, deposits, withdrawals, tx_date):
+    # Escritas de transação já seguram o lock do ledger do usuário, então ler e
+    # alterar a linha pelo ORM não disputa com outras escritas da mesma categoria
+    row = CategoryStats.query.filter_by(
+        user_id=user_id, category=category
+    ).with_for_update().first()
+    if row is None:
+        return
+
+    row.transaction_count -= 1
+    if row.transaction_count <= 0:
+        db.session.delete(row)
+        db.session.flush()
+        return
+
+    row.total_deposits -= deposits
+    row.total_withdrawals -= withdrawals
+    row.updated_at = datetime.utcnow()
+
+    if row.last_used_at is None or tx_date >= row.last_used_at:
+        # A transação removida podia ser a mais recente: idx_user_category resolve o MAX
+        row.last_used_at = db.session.query(db.func.max(Transaction.date)).filter(
+            Transaction.user_id == user_id,
+            Transaction.category == category
+        ).scalar()
+
+    # Grava já: um upsert da mesma categoria em seguida (edição) parte destes valores
+    db.session.flush()
+
+
+# === AUTOCOMPLETE ===
+
+def normalize_category(value):
+    """Minúsculas e sem acentos: 'Depósito' e 'deposito' caem no mesmo prefixo"""
+    decomposed = unicodedata.normalize('NFKD', (value or '').strip().lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+class CategoryIndex:
+    """
+    Índice de prefixos das categorias de um usuário. Cada prefixo (do nome
+    inteiro e de cada palavra) aponta para a lista de sugestões já ordenada
+    por frequência e recência, então a consulta é um único acesso ao dict.
+    """
+
+    def __init__(self, rows, now=None):
+        now = now or datetime.utcnow()
+        ranked = sorted(rows, key=lambda row: (-_suggest_score(row, now), row.category))
+
+        self.prefixes = {}
+        for row in ranked:
+            entry = {
+                'category': row.category,
+                'transaction_count': row.transaction_count,
+                'last_used_at': row.last_used_at.isoformat() if row.last_used_at else None,
+            }
+            for prefix in _prefixes(normalize_category(row.category)):
+                suggestions = self.prefixes.setdefault(prefix, [])
+                if len(suggestions) < SUGGEST_MAX_RESULTS:
+                    suggestions.append(entry)
+
+    def suggest(self, query, limit):
+        return self.prefixes.get(normalize_category(query), [])[:limit]
+
+
+# user_id -> (versão dos dados, CategoryIndex), do menos para o mais recente
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def suggest_categories(user_id, query, version, limit, max_users=1024):
+    """
+    Sugestões para o prefixo `query`. O índice do usuário é reaproveitado
+    enquanto a versão dos dados não mudar; quando muda (ou foi descartado
+    pelo LRU), é remontado a partir de category_stats.
+    """
+    if not version:
+        # Versão 0 não identifica os dados (ver get_data_version): índice descartável
+        return CategoryIndex(get_category_breakdown(user_id)).suggest(query, limit)
+
+    with _indexes_lock:
+        cached = _indexes.get(user_id)
+        if cached is not None and cached[0] == version:
+            _indexes.move_to_end(user_id)
+            return cached[1].suggest(query, limit)
+
+    index = CategoryIndex(get_category_breakdown(user_id))
+
+    with _indexes_lock:
+        _indexes[user_id] = (version, index)
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > max_users:
+            _indexes.popitem(last=False)
+
+    return index.suggest(query, limit)
+
+
+def _suggest_score(row, now):
+    if row.last_used_at is None:
+        return 0.0
+    age_days = max((now - row.last_used_at).total_seconds(), 0) / 86400
+    return row.transaction_count * 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+
+def _prefixes(name):
+    # Prefixos a partir do início do nome e do início de cada palavra ('' inclui todas)
+    starts = [0] + [i + 1 for i, char in enumerate(name) if char in ' -_/' and i + 1 < len(name)]
+    return {name[start:end] for start in starts for end in range(start, len(name) + 1)}
+
+
+# === RECONSTRUÇÃO EM LOTE (flask rebuild-stats) ===
+
+def rebuild_category_stats(connection, user_ids):
+    """
+    Reconstrói as linhas de category_stats dos usuários informados a partir
+    de todo o histórico (DELETE seguido de INSERT ... SELECT ... GROUP BY).
+    Retorna a quantidade de linhas gravadas.
+    """
+    binds = (bindparam('user_ids', expanding=True), bindparam('now', type_=db.DateTime))
+    params = {'user_ids': list(user_ids), 'now': datetime.utcnow()}
+
+    connection.execute(text("""
+        DELETE FROM category_stats WHERE user_id IN :user_ids
+    """).bindparams(binds[0]), {'user_ids': params['user_ids']})
+
+    result = connection.execute(text("""
+        INSERT INTO category_stats (
+            user_id, category, transaction_count, total_deposits, total_withdrawals,
+            last_used_at, updated_at
+        )
+        SELECT user_id, category, COUNT(*),
+               SUM(CASE WHEN type = 'deposit' THEN amount ELSE 0 END),
+               SUM(CASE WHEN type = 'deposit' THEN 0 ELSE amount END),
+               MAX(date), :now
+        FROM transactions
+        WHERE user_id IN :user_ids AND category IS NOT NULL AND category <> ''
+        GROUP BY user_id, category
+    """).bindparams(*binds), params)
+
+    return max(result.rowcount, 0)
+
+
+def backfill_category_stats(batch_size=500):
+    """
+    Cria as linhas de category_stats dos usuários com transações
+    categorizadas e nenhuma linha (anteriores à tabela), em lotes com commit.
+    Idempotente. Retorna a quantidade de usuários preenchidos.
+    """
+    from .models import User
+    from .versioning import bump_data_version
+
+    filled, last_id = 0, 0
+    while True:
+        user_ids = [row[0] for row in db.session.query(User.id).filter(
+            User.id > last_id,
+            ~CategoryStats.query.filter(CategoryStats.user_id == User.id).exists(),
+            Transaction.query.filter(
+                Transaction.user_id == User.id,
+                Transaction.category.isnot(None),
+                Transaction.category != ''
+            ).exists()
+        ).order_by(User.id).limit(batch_size)]
+        if not user_ids:
+            return filled
+        last_id = user_ids[-1]
+
+        rebuild_category_stats(db.session.connection(), user_ids)
+        bump_data_version(user_ids)
+        db.session.commit()
+        filled += len(user_ids)
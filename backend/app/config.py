@@ -114,6 +114,23 @@ class Config:
     DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '20'))
     MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '100'))
     
+    # Batch requests (POST /batch)
+    MAX_BATCH_REQUESTS = int(os.getenv('MAX_BATCH_REQUESTS', '20'))
+    MAX_BULK_TRANSACTIONS = int(os.getenv('MAX_BULK_TRANSACTIONS', '1000'))
+    
+    # Category autocomplete (GET /categories/suggest)
+    CATEGORY_SUGGEST_LIMIT = int(os.getenv('CATEGORY_SUGGEST_LIMIT', '8'))
+    CATEGORY_INDEX_MAX_USERS = int(os.getenv('CATEGORY_INDEX_MAX_USERS', '1024'))  # In-memory LRU per process
+    
+    # Risk-of-ruin simulation (GET /stats/risk-of-ruin, flask simulate-ruin)
+    SIMULATION_DEFAULT_PATHS = int(os.getenv('SIMULATION_DEFAULT_PATHS', '10000'))
+    SIMULATION_MAX_PATHS = int(os.getenv('SIMULATION_MAX_PATHS', '100000'))
+    SIMULATION_DEFAULT_ROUNDS = int(os.getenv('SIMULATION_DEFAULT_ROUNDS', '500'))
+    SIMULATION_MAX_ROUNDS = int(os.getenv('SIMULATION_MAX_ROUNDS', '2000'))
+    SIMULATION_TIME_BUDGET_SECONDS = float(os.getenv('SIMULATION_TIME_BUDGET_SECONDS', '1.5'))
+    SIMULATION_WORKERS = int(os.getenv('SIMULATION_WORKERS', '1'))  # Pool processes per app worker: total is this x gunicorn workers
+    SIMULATION_PARALLEL_THRESHOLD = int(os.getenv('SIMULATION_PARALLEL_THRESHOLD', '20000'))  # Paths before using the process pool
+    
     # Backup and maintenance
     BACKUP_ENABLED = os.getenv('BACKUP_ENABLED', 'True').lower() == 'true'
     BACKUP_SCHEDULE = os.getenv('BACKUP_SCHEDULE', '0 2 * * *')  # Daily at 2 AM
@@ -168,6 +185,9 @@ class TestingConfig(Config):
     
     # Disable cache during testing
     CACHE_TYPE = 'null'
+    
+    # Run simulations in-process
+    SIMULATION_WORKERS = 1
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -0,0 +1,99 @@
+# context.py
+"""
+Contexto financeiro do usuário por requisição (guardado em flask.g).
+
+Saldo, totais, última transação, banca inicial e perfil ativo são carregados
+juntos em uma única consulta (ledger + joins externos) na primeira vez que
+uma rota ou helper pede algum deles; o resto da requisição reutiliza o
+mesmo objeto. Escritas devem chamar reset_financial_context para que
+leituras posteriores na mesma requisição vejam os valores novos.
+"""
+
+from decimal import Decimal
+from flask import g
+from sqlalchemy import and_
+from sqlalchemy.orm import aliased
+
+from . import db
+from .models import Transaction, BettingProfile, UserBalance
+from .ledger import rebuild_user_ledger, ZERO
+
+
+class FinancialContext:
+    """Fotografia dos dados financeiros de um usuário durante a requisição"""
+
+    def __init__(self, user_id, ledger, profile, last_transaction, initial_bank_amount):
+        self.user_id = user_id
+        self.ledger = ledger
+        self.profile = profile
+        self.last_transaction = last_transaction
+
+        self.balance = ledger.balance
+        self.total_deposits = ledger.total_deposits
+        self.total_withdrawals = ledger.total_withdrawals
+        self.transaction_count = ledger.transaction_count
+
+        # Mesma regra de antes: transação inicial, senão o perfil ativo, senão zero
+        if initial_bank_amount is not None:
+            self.initial_bank = Decimal(str(initial_bank_amount))
+        elif profile is not None:
+            self.initial_bank = profile.initial_balance
+        else:
+            self.initial_bank = ZERO
+
+    @property
+    def profit_loss(self):
+        return self.balance - self.initial_bank
+
+    @property
+    def roi_percentage(self):
+        if self.initial_bank > 0:
+            return (self.balance - self.initial_bank) / self.initial_bank * 100
+        return 0
+
+
+def get_financial_context(user_id):
+    """Retorna o contexto financeiro do usuário, carregando-o uma vez por requisição"""
+    contexts = g.setdefault('financial_contexts', {})
+    context = contexts.get(user_id)
+    if context is None:
+        context = contexts[user_id] = _load_financial_context(user_id)
+    return context
+
+
+def reset_financial_context(user_id=None):
+    """Descarta o contexto carregado (de um usuário ou de todos) após uma escrita"""
+    contexts = g.get('financial_contexts')
+    if not contexts:
+        return
+    if user_id is None:
+        contexts.clear()
+    else:
+        contexts.pop(user_id, None)
+
+
+def _load_financial_context(user_id):
+    last_tx = aliased(Transaction)
+
+    initial_bank_amount = db.session.query(Transaction.amount).filter(
+        Transaction.user_id == user_id,
+        Transaction.is_initial_bank == True
+    ).order_by(Transaction.id).limit(1).scalar_subquery()
+
+    query = db.session.query(
+        UserBalance, BettingProfile, last_tx, initial_bank_amount.label('initial_bank_amount')
+    ).outerjoin(
+        BettingProfile,
+        and_(BettingProfile.user_id == UserBalance.user_id, BettingProfile.is_active == True)
+    ).outerjoin(
+        last_tx, last_tx.id == UserBalance.last_transaction_id
+    ).filter(UserBalance.user_id == user_id)
+
+    row = query.first()
+    if row is None:
+        # Usuário anterior ao ledger: cria o registro e repete a consulta
+        rebuild_user_ledger(user_id)
+        row = query.first()
+
+    ledger, profile, last_transaction, initial_bank = row
+    return FinancialContext(user_id, ledger, profile, last_transaction, initial_bank)
@@ -0,0 +1,141 @@
+# drawdown.py
+"""
+Drawdown sobre a curva de saldo (balance_after em ordem de date, id).
+
+Uma única passada pelas transações, lidas com cursor no servidor, acompanha
+o pico corrente e encontra o maior drawdown pico-vale, com as datas do pico,
+do vale e da recuperação (primeiro saldo que volta ao pico), além do
+drawdown atual e há quanto tempo ele dura. O resultado fica em cache por
+usuário e versão dos dados, então só é recalculado depois de uma escrita.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import select
+
+from . import db, cache
+from .models import Transaction
+from .versioning import get_data_version
+
+ZERO = Decimal('0.00')
+
+# Linhas buscadas por ida ao banco durante a passada
+STREAM_BATCH_SIZE = 5000
+
+
+def get_drawdown_report(user_id):
+    """Relatório de drawdown do usuário (ver compute_drawdown), em cache por versão dos dados"""
+    version, _ = get_data_version(user_id)
+    if not version:
+        return compute_drawdown(user_id)  # versão 0 não identifica os dados (ver get_data_version)
+    key = f'drawdown:{user_id}:{version}'
+
+    try:
+        report = cache.get(key)
+    except Exception as e:
+        current_app.logger.warning(f'Cache read failed: {e}')
+        report = None
+    if report is not None:
+        return report
+
+    report = compute_drawdown(user_id)
+    try:
+        cache.set(key, report)
+    except Exception as e:
+        current_app.logger.warning(f'Cache write failed: {e}')
+    return report
+
+
+def compute_drawdown(user_id, now=None):
+    """
+    Percorre a curva de saldo uma vez. O maior drawdown é medido em valor;
+    a porcentagem é relativa ao pico daquele drawdown. Durações em dias.
+    """
+    now = now or datetime.utcnow()
+    rows = db.session.execute(
+        select(Transaction.date, Transaction.balance_after).where(
+            Transaction.user_id == user_id,
+            Transaction.balance_after.isnot(None)
+        ).order_by(Transaction.date, Transaction.id).execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+
+    peak = peak_date = last_balance = None
+    worst = None  # maior drawdown até aqui: valor, pico, vale e recuperação
+    underwater = False
+    longest_underwater = 0.0
+    points = 0
+
+    for tx_date, balance in rows:
+        points += 1
+        last_balance = balance
+
+        if peak is None or balance >= peak:
+            if underwater:
+                # Saldo voltou ao pico: encerra o período abaixo dele
+                longest_underwater = max(longest_underwater, _days(peak_date, tx_date))
+                if worst['recovery_date'] is None and worst['peak_date'] == peak_date:
+                    worst['recovery_date'] = tx_date
+                underwater = False
+            if peak is None or balance > peak:
+                peak, peak_date = balance, tx_date
+            continue
+
+        underwater = True
+        amount = peak - balance
+        if worst is None or amount > worst['amount']:
+            worst = {
+                'amount': amount,
+                'peak': peak,
+                'peak_date': peak_date,
+                'trough': balance,
+                'trough_date': tx_date,
+                'recovery_date': None,
+            }
+
+    return _report(peak, peak_date, last_balance, worst, longest_underwater, points, now)
+
+
+def _report(peak, peak_date, last_balance, worst, longest_underwater, points, now):
+    current_amount = (peak - last_balance) if points else ZERO
+    in_drawdown = points > 0 and current_amount > 0
+    if in_drawdown:
+        longest_underwater = max(longest_underwater, _days(peak_date, now))
+
+    report = {
+        'points': points,
+        'peak_balance': str(peak) if peak is not None else None,
+        'peak_date': peak_date.isoformat() if peak_date else None,
+        'current': {
+            'amount': str(current_amount),
+            'percentage': _percentage(current_amount, peak),
+            'duration_days': round(_days(peak_date, now), 2) if in_drawdown else 0
+        },
+        'max': None,
+        'longest_underwater_days': round(longest_underwater, 2)
+    }
+
+    if worst is not None:
+        recovery_date = worst['recovery_date']
+        report['max'] = {
+            'amount': str(worst['amount']),
+            'percentage': _percentage(worst['amount'], worst['peak']),
+            'peak_balance': str(worst['peak']),
+            'trough_balance': str(worst['trough']),
+            'peak_date': worst['peak_date'].isoformat(),
+            'trough_date': worst['trough_date'].isoformat(),
+            'recovery_date': recovery_date.isoformat() if recovery_date else None,
+            'recovered': recovery_date is not None,
+            'duration_days': round(_days(worst['peak_date'], worst['trough_date']), 2),
+            'recovery_days': round(_days(worst['trough_date'], recovery_date), 2) if recovery_date else None
+        }
+
+    return report
+
+
+def _percentage(amount, peak):
+    return round(float(amount / peak * 100), 2) if peak and peak > 0 else 0
+
+
+def _days(start, end):
+    return (end - start).total_seconds() / 86400
@@ -0,0 +1,101 @@
+# export.py
+"""
+Exportação de transações em CSV ou NDJSON.
+
+As linhas são lidas com yield_per (cursor do lado do servidor no PostgreSQL)
+e emitidas em blocos de texto, então a memória usada depende do tamanho do
+bloco e não da quantidade de transações exportadas.
+"""
+
+import csv
+import io
+import json
+from decimal import Decimal
+
+from . import db
+from .models import Transaction
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+EXPORT_COLUMNS = (
+    Transaction.id,
+    Transaction.user_id,
+    Transaction.date,
+    Transaction.type,
+    Transaction.amount,
+    Transaction.category,
+    Transaction.description,
+    Transaction.game_type,
+    Transaction.betting_session_id,
+    Transaction.is_initial_bank,
+    Transaction.balance_before,
+    Transaction.balance_after,
+    Transaction.meta,
+    Transaction.tags,
+)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def build_export_query(user_id=None):
+    """Consulta base da exportação: um usuário ou a tabela inteira (admin), em ordem cronológica"""
+    query = db.session.query(*EXPORT_COLUMNS)
+    if user_id is not None:
+        query = query.filter(Transaction.user_id == user_id)
+    return query
+
+
+def iter_export(query, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Gera blocos de texto com as linhas da consulta no formato pedido.
+    A ordenação (user_id, date, id) é aplicada aqui para manter a saída estável.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Formato de exportação inválido: {fmt}')
+
+    rows = query.order_by(
+        Transaction.user_id, Transaction.date, Transaction.id
+    ).yield_per(chunk_size)
+
+    names = [column.key for column in EXPORT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+
+    if writer:
+        writer.writerow(names)
+
+    pending = 0
+    for row in rows:
+        values = [_format_value(value, fmt) for value in row]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(names, values)), ensure_ascii=False))
+            buffer.write('\n')
+
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    remaining = buffer.getvalue()
+    if remaining:
+        yield remaining
+
+
+def _format_value(value, fmt):
+    if value is None:
+        return '' if fmt == 'csv' else None
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False) if fmt == 'csv' else value
+    return value
@@ -0,0 +1,261 @@
+# importer.py
+"""
+Importação de histórico de transações a partir de CSV (flask import-transactions).
+
+O arquivo é lido em streaming e gravado em lotes: COPY no PostgreSQL
+(psycopg2) e INSERT com executemany nos demais bancos. Saldos por transação,
+ledger e agregados são recalculados uma única vez no fim, na mesma transação
+do banco, então uma importação interrompida não deixa dados parciais.
+
+Como nas rotas de escrita, o ledger do usuário fica bloqueado (FOR UPDATE)
+do início ao fim, e a importação é recusada se algum saque deixar o saldo
+negativo.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from . import db
+from .models import Transaction
+from .ledger import get_user_ledger, recompute_running_balances, rebuild_user_ledger
+from .rollups import rebuild_stats_for_users
+from .categories import rebuild_category_stats
+from .running_stats import rebuild_running_stats
+from .utils import (
+    parse_currency_input, parse_datetime_utc, validate_transaction_amount,
+    validate_transaction_attributes, promote_meta_columns
+)
+from .versioning import bump_data_version
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Cabeçalhos aceitos (planilhas em português ou o formato do export)
+COLUMN_ALIASES = {
+    'date': ('date', 'data'),
+    'type': ('type', 'tipo'),
+    'amount': ('amount', 'valor'),
+    'category': ('category', 'categoria'),
+    'description': ('description', 'descricao', 'descrição'),
+    'game_type': ('game_type', 'jogo'),
+    'betting_session_id': ('betting_session_id', 'sessao', 'sessão'),
+    'tags': ('tags', 'etiquetas'),
+    'meta': ('meta',),
+}
+
+TYPE_ALIASES = {
+    'deposit': 'deposit', 'deposito': 'deposit', 'depósito': 'deposit', 'entrada': 'deposit',
+    'withdraw': 'withdraw', 'saque': 'withdraw', 'retirada': 'withdraw', 'saida': 'withdraw', 'saída': 'withdraw',
+}
+
+DATE_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y')
+
+# Colunas gravadas pelo import (balance_before/after são calculados no fim)
+LOAD_COLUMNS = (
+    'user_id', 'type', 'amount', 'category', 'description', 'game_type',
+    'betting_session_id', 'is_initial_bank', 'meta', 'tags', 'bet_odds', 'bet_type', 'bet_stake',
+    'date', 'created_at', 'updated_at',
+)
+
+
+class ImportRowError(ValueError):
+    """Linha inválida no arquivo de importação"""
+
+    def __init__(self, line_number, errors):
+        self.line_number = line_number
+        self.errors = errors
+        super().__init__(f'Linha {line_number}: {"; ".join(errors)}')
+
+
+class ImportBalanceError(ValueError):
+    """A importação deixaria o saldo do usuário negativo"""
+
+
+def parse_import_row(record, line_number, user_id, now):
+    """Converte um registro do CSV no dict de colunas de transactions. Levanta ImportRowError."""
+    errors = []
+
+    tx_type = TYPE_ALIASES.get((record.get('type') or '').strip().lower())
+    if tx_type is None:
+        errors.append('Type must be "deposit" or "withdraw"')
+
+    amount = parse_currency_input(record.get('amount') or '')
+    # Saldos são recalculados no fim da importação: aqui só os limites do valor
+    validation = validate_transaction_amount(amount, Decimal('Infinity'), tx_type)
+    errors.extend(validation['errors'])
+
+    tx_date = None
+    try:
+        tx_date = _parse_import_date(record.get('date'))
+    except (ValueError, TypeError):
+        errors.append('Invalid date format')
+
+    tags, meta = None, None
+    try:
+        tags = _parse_import_tags(record.get('tags'))
+        meta = json.loads(record['meta']) if (record.get('meta') or '').strip() else None
+    except ValueError:
+        errors.append('Tags and meta must be valid JSON (tags may also be comma-separated)')
+    attributes = validate_transaction_attributes(tags, meta)
+    errors.extend(attributes['errors'])
+
+    if errors:
+        raise ImportRowError(line_number, errors)
+
+    return {
+        'user_id': user_id,
+        'type': tx_type,
+        'amount': amount,
+        'category': (record.get('category') or '').strip() or None,
+        'description': (record.get('description') or '').strip() or None,
+        'game_type': (record.get('game_type') or '').strip() or None,
+        'betting_session_id': (record.get('betting_session_id') or '').strip() or None,
+        'is_initial_bank': False,
+        'meta': attributes['meta'],
+        'tags': attributes['tags'],
+        **promote_meta_columns(attributes['meta']),
+        'date': tx_date,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+def iter_import_batches(stream, user_id, batch_size=DEFAULT_BATCH_SIZE, delimiter=',', skip_invalid=False):
+    """
+    Lê o CSV e gera (lote de linhas válidas, lista de ImportRowError ignorados).
+    Sem skip_invalid, a primeira linha inválida levanta ImportRowError.
+    """
+    reader = csv.DictReader(stream, delimiter=delimiter)
+    columns = _resolve_columns(reader.fieldnames or [])
+    now = datetime.utcnow()
+
+    batch, skipped = [], []
+    for record in reader:
+        line_number = reader.line_num
+        record = {name: record.get(header) for name, header in columns.items()}
+        try:
+            batch.append(parse_import_row(record, line_number, user_id, now))
+        except ImportRowError as e:
+            if not skip_invalid:
+                raise
+            skipped.append(e)
+
+        if len(batch) >= batch_size:
+            yield batch, skipped
+            batch, skipped = [], []
+
+    if batch or skipped:
+        yield batch, skipped
+
+
+def begin_import(user_id):
+    """Bloqueia o ledger do usuário até o commit, antes do primeiro lote"""
+    return get_user_ledger(user_id, for_update=True)
+
+
+def load_batch(rows):
+    """Grava um lote na transação corrente: COPY no PostgreSQL/psycopg2, executemany nos demais"""
+    if not rows:
+        return 0
+
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_copy_value(row[column]) for column in LOAD_COLUMNS])
+        buffer.seek(0)
+
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f'COPY transactions ({", ".join(LOAD_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')',
+                buffer
+            )
+        finally:
+            cursor.close()
+    else:
+        connection.execute(Transaction.__table__.insert(), rows)
+
+    return len(rows)
+
+
+def finalize_import(user_id, since):
+    """
+    Depois da carga: saldos por transação a partir da data mais antiga importada
+    (levanta ImportBalanceError se algum ficar negativo), ledger, agregados de betting_stats e category_stats, estatísticas
+    acumuladas e versão dos dados do usuário.
+    """
+    recompute_running_balances(user_id, since, 0)
+    _check_non_negative_balance(user_id, since)
+    rebuild_user_ledger(user_id)
+    rebuild_stats_for_users(db.session.connection(), [user_id], since)
+    rebuild_category_stats(db.session.connection(), [user_id])
+    rebuild_running_stats(user_id)
+    bump_data_version([user_id])
+
+
+def _check_non_negative_balance(user_id, since):
+    # Mesma regra das rotas: nenhum saque pode deixar o saldo abaixo de zero
+    row = db.session.query(Transaction.date, Transaction.amount, Transaction.balance_after).filter(
+        Transaction.user_id == user_id,
+        Transaction.date >= since,
+        Transaction.balance_after < 0
+    ).order_by(Transaction.date, Transaction.id).first()
+
+    if row is not None:
+        raise ImportBalanceError(
+            f'Saldo negativo ({row.balance_after}) após o saque de {row.amount} em '
+            f'{row.date.isoformat(sep=" ")}: inclua os depósitos anteriores no arquivo'
+        )
+
+
+def _resolve_columns(fieldnames):
+    normalized = {(name or '').strip().lower(): name for name in fieldnames}
+    columns = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[column] = normalized[alias]
+                break
+
+    missing = [column for column in ('date', 'type', 'amount') if column not in columns]
+    if missing:
+        raise ValueError(f'Colunas obrigatórias ausentes no CSV: {", ".join(missing)}')
+    return columns
+
+
+def _parse_import_date(value):
+    value = (value or '').strip()
+    if not value:
+        raise ValueError('Data ausente')
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return parse_datetime_utc(value)
+
+
+def _parse_import_tags(value):
+    # Lista JSON (formato do export) ou nomes separados por vírgula
+    value = (value or '').strip()
+    if not value:
+        return None
+    if value.startswith('['):
+        return json.loads(value)
+    return value.split(',')
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
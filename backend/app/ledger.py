@@ -0,0 +1,222 @@
+# ledger.py
+"""
+Saldo materializado por usuário (tabela user_balances).
+
+As rotas de escrita de transações atualizam o registro na mesma transação do
+banco, de modo que a leitura do saldo custa uma busca pela chave primária em
+vez de somar todo o histórico do usuário.
+"""
+
+import sqlite3
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import desc, func, case, text, bindparam
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .models import User, Transaction, UserBalance
+from .versioning import bump_data_version
+
+ZERO = Decimal('0.00')
+
+
+def signed_amount(tx_type, amount):
+    """Efeito de uma transação no saldo: depósitos somam, saques subtraem"""
+    return amount if tx_type == 'deposit' else -amount
+
+
+def get_user_ledger(user_id, for_update=False):
+    """
+    Retorna o registro de saldo do usuário, criando-o a partir da tabela
+    transactions caso ainda não exista (usuários anteriores ao ledger).
+    Com for_update=True a linha é bloqueada até o commit (PostgreSQL).
+    """
+    query = UserBalance.query.filter_by(user_id=user_id)
+    if for_update:
+        query = query.with_for_update()
+
+    ledger = query.first()
+    if ledger is None:
+        ledger = rebuild_user_ledger(user_id)
+    return ledger
+
+
+def rebuild_user_ledger(user_id, flush=True):
+    """
+    Recalcula o registro de saldo do usuário a partir da tabela transactions.
+    flush=False deixa o registro pendente na sessão (uso dentro de um flush).
+    """
+    totals = db.session.query(
+        func.coalesce(func.sum(case((Transaction.type == 'deposit', Transaction.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((Transaction.type == 'withdraw', Transaction.amount), else_=0)), 0),
+        func.count(Transaction.id)
+    ).filter(Transaction.user_id == user_id).one()
+
+    total_deposits = Decimal(str(totals[0])).quantize(ZERO)
+    total_withdrawals = Decimal(str(totals[1])).quantize(ZERO)
+
+    ledger = db.session.get(UserBalance, user_id)
+    if ledger is None:
+        ledger = UserBalance(user_id=user_id)
+        db.session.add(ledger)
+
+    ledger.total_deposits = total_deposits
+    ledger.total_withdrawals = total_withdrawals
+    ledger.balance = total_deposits - total_withdrawals
+    ledger.transaction_count = totals[2]
+    ledger.last_transaction_id = _latest_transaction_id(user_id)
+    if flush:
+        db.session.flush()
+
+    return ledger
+
+
+def apply_transaction(ledger, tx_type, amount, sign=1):
+    """
+    Aplica (sign=1) ou reverte (sign=-1) o efeito de uma transação nos totais.
+    Não ajusta last_transaction_id; veja refresh_last_transaction.
+    """
+    if tx_type == 'deposit':
+        ledger.total_deposits = (ledger.total_deposits or ZERO) + sign * amount
+    else:
+        ledger.total_withdrawals = (ledger.total_withdrawals or ZERO) + sign * amount
+
+    ledger.balance = (ledger.balance or ZERO) + sign * signed_amount(tx_type, amount)
+    ledger.transaction_count = (ledger.transaction_count or 0) + sign
+
+
+def record_new_transaction(ledger, transaction):
+    """Aplica uma transação recém-inserida (já com id) ao ledger"""
+    apply_transaction(ledger, transaction.type, transaction.amount)
+
+    latest = db.session.get(Transaction, ledger.last_transaction_id) if ledger.last_transaction_id else None
+    if latest is None or (transaction.date, transaction.id) >= (latest.date, latest.id):
+        ledger.last_transaction_id = transaction.id
+
+
+def refresh_last_transaction(ledger):
+    """Recalcula last_transaction_id com uma busca pelo índice idx_user_date"""
+    ledger.last_transaction_id = _latest_transaction_id(ledger.user_id)
+
+
+def recompute_running_balances(user_id, from_date=None, from_id=0):
+    """
+    Reescreve balance_before/balance_after das transações do usuário a partir da
+    chave (from_date, from_id), inclusive, usando uma soma acumulada em janela
+    sobre (user_id, date, id). O saldo de partida é o balance_after da última
+    transação anterior à chave, então apenas o sufixo afetado é tocado.
+    Sem from_date, todo o histórico do usuário é recalculado. As linhas
+    reescritas recebem updated_at novo (sincronização em /transactions/changes).
+    """
+    now = datetime.utcnow()
+    if from_date is None:
+        params = {'user_id': user_id}
+        suffix_filter = 'TRUE'
+        anchor = '0'
+    else:
+        params = {'user_id': user_id, 'from_date': from_date, 'from_id': from_id}
+        suffix_filter = '(date > :from_date OR (date = :from_date AND id >= :from_id))'
+        anchor = """COALESCE((
+            SELECT balance_after FROM transactions
+            WHERE user_id = :user_id
+              AND (date < :from_date OR (date = :from_date AND id < :from_id))
+            ORDER BY date DESC, id DESC
+            LIMIT 1
+        ), 0)"""
+
+    running_select = f"""
+        SELECT id,
+               CASE WHEN type = 'deposit' THEN amount ELSE -amount END AS signed,
+               ROUND({anchor} + SUM(CASE WHEN type = 'deposit' THEN amount ELSE -amount END) OVER (
+                   PARTITION BY user_id ORDER BY date, id
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+               ), 2) AS running
+        FROM transactions
+        WHERE user_id = :user_id AND {suffix_filter}
+    """
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite' and sqlite3.sqlite_version_info < (3, 33, 0):
+        # SQLite antigo não suporta UPDATE ... FROM: calcula a janela no banco
+        # e aplica com um único executemany, sem carregar objetos no ORM
+        rows = db.session.execute(_typed(text(running_select)), params).fetchall()
+        if rows:
+            db.session.execute(
+                _typed(text('UPDATE transactions SET balance_before = :before, balance_after = :after, '
+                            'updated_at = :now WHERE id = :id')),
+                [{'id': row.id, 'before': row.running - row.signed, 'after': row.running, 'now': now} for row in rows]
+            )
+        return len(rows)
+
+    distinct = 'IS NOT' if dialect == 'sqlite' else 'IS DISTINCT FROM'
+    result = db.session.execute(_typed(text(f"""
+        UPDATE transactions
+        SET balance_before = r.running - r.signed,
+            balance_after = r.running,
+            updated_at = :now
+        FROM ({running_select}) AS r
+        WHERE transactions.id = r.id
+          AND (transactions.balance_after {distinct} r.running
+               OR transactions.balance_before {distinct} r.running - r.signed)
+    """)), {**params, 'now': now})
+
+    return result.rowcount
+
+
+def backfill_missing_ledgers(batch_size=500):
+    """
+    Cria o ledger dos usuários que ainda não têm um (anteriores ao ledger),
+    já com versão de dados, em lotes com commit. Usuários cujo histórico não
+    cabe no ledger (valores fora da precisão da coluna) são pulados.
+    Retorna (quantidade de ledgers criados, ids pulados).
+    """
+    created, skipped, last_id = 0, [], 0
+    while True:
+        user_ids = [row[0] for row in db.session.query(User.id).filter(
+            User.id > last_id,
+            ~db.session.query(UserBalance.user_id).filter(UserBalance.user_id == User.id).exists()
+        ).order_by(User.id).limit(batch_size)]
+        if not user_ids:
+            return created, skipped
+        last_id = user_ids[-1]
+
+        rebuilt = []
+        for user_id in user_ids:
+            try:
+                with db.session.begin_nested():
+                    rebuild_user_ledger(user_id)
+                rebuilt.append(user_id)
+            except (ArithmeticError, SQLAlchemyError):
+                skipped.append(user_id)
+
+        bump_data_version(rebuilt)
+        db.session.commit()
+        created += len(rebuilt)
+
+
+def rebuild_all_ledgers(user_ids=None):
+    """Reconstrói o ledger de todos os usuários (ou dos informados). Retorna a quantidade."""
+    if user_ids is None:
+        user_ids = [row[0] for row in db.session.query(User.id)]
+
+    for user_id in user_ids:
+        rebuild_user_ledger(user_id)
+    # O ledger não é um modelo versionado: invalida caches e ETags dos usuários reconstruídos
+    bump_data_version(user_ids)
+    db.session.commit()
+
+    return len(user_ids)
+
+
+def _typed(statement):
+    # Garante que :from_date/:now sejam serializados no mesmo formato da coluna DateTime
+    for name in ('from_date', 'now'):
+        if f':{name}' in statement.text:
+            statement = statement.bindparams(bindparam(name, type_=db.DateTime))
+    return statement
+
+
+def _latest_transaction_id(user_id):
+    return db.session.query(Transaction.id).filter(
+        Transaction.user_id == user_id
+    ).order_by(desc(Transaction.date), desc(Transaction.id)).limit(1).scalar()
@@ -324,6 +324,7 @@ def validate_migration(session):
         if all_passed:
             print("\n🎉 Migração concluída com sucesso!")
             print("   Todos os usuários agora possuem banca inicial obrigatória")
+            print("   Execute 'flask rebuild-balances' para atualizar o ledger de saldos")
         else:
             print("\n⚠️  Migração concluída com avisos - revisar usuários problemáticos")
         
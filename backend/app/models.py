@@ -1,6 +1,6 @@
 import pytz
 from . import db
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.dialects.postgresql import JSON, JSONB
 from datetime import datetime
 from decimal import Decimal
 
@@ -21,6 +21,61 @@ class User(db.Model):
     betting_profiles = db.relationship('BettingProfile', backref='user', lazy=True, cascade='all, delete-orphan')
     transactions = db.relationship('Transaction', backref='user', lazy=True, cascade='all, delete-orphan')
     objectives = db.relationship('Objective', backref='user', lazy=True, cascade='all, delete-orphan')
+    balance_ledger = db.relationship('UserBalance', backref='user', uselist=False, lazy=True, cascade='all, delete-orphan')
+    transaction_tombstones = db.relationship('TransactionTombstone', lazy=True, cascade='all, delete-orphan')
+    category_stats = db.relationship('CategoryStats', lazy=True, cascade='all, delete-orphan')
+    running_stats = db.relationship('UserRunningStats', uselist=False, lazy=True, cascade='all, delete-orphan')
+
+class UserBalance(db.Model):
+    __tablename__ = 'user_balances'
+    
+    # One row per user, maintained on every transaction write (see ledger.py)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    
+    # Materialized Totals
+    balance = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.00'))
+    total_deposits = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.00'))
+    total_withdrawals = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.00'))
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    last_transaction_id = db.Column(db.Integer)  # Latest transaction by (date, id)
+    
+    # Data Version (bumped on every write to the user's data, see versioning.py)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    data_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Timestamps
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class UserRunningStats(db.Model):
+    __tablename__ = 'user_running_stats'
+    
+    # One row per user, updated in O(1) on each transaction/session write (see running_stats.py)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    
+    # Welford accumulators of per-transaction returns (change / balance before)
+    return_count = db.Column(db.Integer, nullable=False, default=0)
+    return_mean = db.Column(db.Float, nullable=False, default=0.0)
+    return_m2 = db.Column(db.Float, nullable=False, default=0.0)
+    
+    # Balance path
+    last_balance = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.00'))
+    peak_balance = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.00'))
+    max_drawdown = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.00'))
+    max_drawdown_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    
+    # Welford accumulators of completed session results
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    session_mean = db.Column(db.Float, nullable=False, default=0.0)
+    session_m2 = db.Column(db.Float, nullable=False, default=0.0)
+    winning_sessions = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Streaks of completed sessions (current_streak > 0: wins in a row, < 0: losses)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    longest_win_streak = db.Column(db.Integer, nullable=False, default=0)
+    longest_loss_streak = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Timestamps
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class BettingProfile(db.Model):
     __tablename__ = 'betting_profiles'
@@ -70,9 +125,14 @@ class Transaction(db.Model):
     balance_before = db.Column(db.Numeric(12, 2))
     balance_after = db.Column(db.Numeric(12, 2))
     
-    # Metadata
-    meta = db.Column(JSON)  # Additional data like bet details, odds, etc
-    tags = db.Column(JSON)  # Array of tags for categorization
+    # Metadata (JSONB on PostgreSQL so tags can use a GIN index)
+    meta = db.Column(JSON().with_variant(JSONB(), 'postgresql'))  # Additional data like bet details, odds, etc
+    tags = db.Column(JSON().with_variant(JSONB(), 'postgresql'))  # Array of tags for categorization
+    
+    # Hot meta keys promoted to typed columns for filtering (see utils.promote_meta_columns)
+    bet_odds = db.Column(db.Numeric(10, 3))  # meta.odds
+    bet_type = db.Column(db.String(30))  # meta.bet_type
+    bet_stake = db.Column(db.Numeric(12, 2))  # meta.stake
     
     # Timestamps
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -83,7 +143,52 @@ class Transaction(db.Model):
     __table_args__ = (
         db.Index('idx_user_date', 'user_id', 'date'),
         db.Index('idx_user_type', 'user_id', 'type'),
-        db.Index('idx_user_category', 'user_id', 'category'),
+        db.Index('idx_user_category', 'user_id', 'category', 'date'),
+        db.Index('idx_user_updated', 'user_id', 'updated_at'),
+        db.Index('idx_user_game_date', 'user_id', 'game_type', 'date', postgresql_include=['type', 'amount']),
+        db.Index('idx_user_bet_type', 'user_id', 'bet_type', 'date'),
+        db.Index('idx_user_bet_odds', 'user_id', 'bet_odds'),
+        db.Index('idx_user_bet_stake', 'user_id', 'bet_stake'),
+        db.Index(
+            'idx_transactions_tags', 'tags',
+            postgresql_using='gin', postgresql_ops={'tags': 'jsonb_path_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
+
+class CategoryStats(db.Model):
+    __tablename__ = 'category_stats'
+    
+    # One row per (user, category), maintained on every transaction write (see categories.py)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    
+    # Totals
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    total_deposits = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.00'))
+    total_withdrawals = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.00'))
+    last_used_at = db.Column(db.DateTime)  # Latest transaction date in the category
+    
+    # Timestamps
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'category', name='unique_user_category_stats'),
+    )
+
+class TransactionTombstone(db.Model):
+    __tablename__ = 'transaction_tombstones'
+    
+    # One row per deleted transaction, read by GET /transactions/changes
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, nullable=False)
+    
+    # Timestamps
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_tombstone_user_deleted', 'user_id', 'deleted_at'),
     )
 
 class Objective(db.Model):
@@ -155,6 +260,10 @@ class BettingSession(db.Model):
     status = db.Column(db.String(20), default='active')  # active, completed, stopped
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_session_user_game', 'user_id', 'game_type', 'started_at'),
+    )
 
 class BettingStats(db.Model):
     __tablename__ = 'betting_stats'
@@ -179,6 +288,9 @@ class BettingStats(db.Model):
     losing_sessions = db.Column(db.Integer, default=0)
     total_bets = db.Column(db.Integer, default=0)
     win_rate = db.Column(db.Numeric(5, 2), default=Decimal('0.00'))  # Percentage
+    sessions_net_result = db.Column(db.Numeric(12, 2), default=Decimal('0.00'))  # Sum of session net results
+    best_session_result = db.Column(db.Numeric(12, 2))  # NULL until a session ends in the period
+    worst_session_result = db.Column(db.Numeric(12, 2))
     
     # Risk Management
     stop_losses_hit = db.Column(db.Integer, default=0)
@@ -0,0 +1,447 @@
+# rollups.py
+"""
+Agregados por período (tabela betting_stats) mantidos incrementalmente.
+
+Cada escrita de transação ou fim de sessão faz um upsert nas linhas diária,
+semanal, mensal e anual do período correspondente. As rotas de analytics
+leem esses poucos registros em vez de reagregar o histórico.
+"""
+
+import json
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import create_engine, text, bindparam
+from sqlalchemy.pool import NullPool
+
+from . import db
+from .models import BettingStats
+
+PERIOD_TYPES = ('daily', 'weekly', 'monthly', 'yearly')
+
+ZERO = Decimal('0.00')
+
+# Início usado quando a reconstrução não tem --since
+EPOCH = date(1900, 1, 1)
+
+
+def period_start(period_type, value):
+    """Data inicial do período (dia, segunda-feira, dia 1 do mês ou 1º de janeiro)"""
+    if isinstance(value, datetime):
+        value = value.date()
+
+    if period_type == 'daily':
+        return value
+    if period_type == 'weekly':
+        return value - timedelta(days=value.weekday())
+    if period_type == 'monthly':
+        return value.replace(day=1)
+    if period_type == 'yearly':
+        return value.replace(month=1, day=1)
+    raise ValueError(f'Tipo de período inválido: {period_type}')
+
+
+def record_transaction(user_id, tx_type, amount, tx_date, balance_before=None, balance_after=None, sign=1):
+    """
+    Soma (sign=1) ou subtrai (sign=-1) uma transação dos agregados dos períodos
+    que contêm tx_date. Com balance_after informado (transação nova no fim do
+    histórico), o saldo final do período passa a ser o da transação; nos demais
+    casos use refresh_period_balances depois.
+    """
+    amount = sign * amount
+    deposits = amount if tx_type == 'deposit' else ZERO
+    withdrawals = amount if tx_type != 'deposit' else ZERO
+
+    for period_type in PERIOD_TYPES:
+        values = {
+            'total_deposits': deposits,
+            'total_withdrawals': withdrawals,
+            'net_profit_loss': deposits - withdrawals,
+        }
+        insert_values = dict(values)
+        if balance_after is not None:
+            insert_values['starting_balance'] = balance_before
+            insert_values['ending_balance'] = balance_after
+
+        _upsert_period(
+            user_id, period_type, period_start(period_type, tx_date),
+            insert_values,
+            increments=values.keys(),
+            replacements=('ending_balance',) if balance_after is not None else ()
+        )
+
+
+def record_transactions(user_id, transactions, with_balances=True):
+    """
+    Versão em lote de record_transaction para uma lista de transações novas
+    (objetos ou dicts com type, amount, date, balance_before, balance_after),
+    em ordem cronológica. Soma os valores em memória e faz um único upsert por
+    período tocado. with_balances=False equivale a record_transaction sem
+    saldos (use refresh_period_balances depois).
+    """
+    buckets = {}
+    for tx in transactions:
+        get = tx.get if isinstance(tx, dict) else lambda name: getattr(tx, name)
+        amount = get('amount')
+        deposits = amount if get('type') == 'deposit' else ZERO
+        withdrawals = amount if get('type') != 'deposit' else ZERO
+
+        for period_type in PERIOD_TYPES:
+            key = (period_type, period_start(period_type, get('date')))
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {
+                    'total_deposits': ZERO,
+                    'total_withdrawals': ZERO,
+                    'net_profit_loss': ZERO,
+                    'starting_balance': get('balance_before'),
+                }
+            bucket['total_deposits'] += deposits
+            bucket['total_withdrawals'] += withdrawals
+            bucket['net_profit_loss'] += deposits - withdrawals
+            bucket['ending_balance'] = get('balance_after')
+
+    increments = ('total_deposits', 'total_withdrawals', 'net_profit_loss')
+    for (period_type, period_date), bucket in buckets.items():
+        insert_values = {column: bucket[column] for column in increments}
+        if with_balances:
+            insert_values['starting_balance'] = bucket['starting_balance']
+            insert_values['ending_balance'] = bucket['ending_balance']
+
+        _upsert_period(
+            user_id, period_type, period_date,
+            insert_values,
+            increments=increments,
+            replacements=('ending_balance',) if with_balances else ()
+        )
+
+
+def record_session(session, current_balance):
+    """Contabiliza uma sessão encerrada nos períodos que contêm seu início"""
+    net_result = session.net_result or ZERO
+    winning = 1 if net_result > 0 else 0
+
+    values = {
+        'total_sessions': 1,
+        'winning_sessions': winning,
+        'losing_sessions': 1 if net_result < 0 else 0,
+        'total_bets': session.total_bets or 0,
+        'stop_losses_hit': 1 if session.stop_loss_hit else 0,
+        'profit_targets_hit': 1 if session.profit_target_hit else 0,
+        'sessions_net_result': net_result,
+    }
+
+    for period_type in PERIOD_TYPES:
+        insert_values = dict(values)
+        insert_values.update({
+            'win_rate': Decimal(winning * 100),
+            'best_session_result': net_result,
+            'worst_session_result': net_result,
+            'starting_balance': current_balance,
+            'ending_balance': current_balance,
+        })
+
+        _upsert_period(
+            user_id=session.user_id,
+            period_type=period_type,
+            period_date=period_start(period_type, session.started_at),
+            insert_values=insert_values,
+            increments=values.keys(),
+            extremes={'best_session_result': 'max', 'worst_session_result': 'min'},
+            recompute_win_rate=True
+        )
+
+
+def refresh_period_balances(user_id, since):
+    """
+    Recalcula starting_balance/ending_balance das linhas a partir do período que
+    contém `since`, em um único UPDATE: o saldo inicial é o balance_after da
+    última transação anterior ao período (busca por idx_user_date) e o final é
+    o inicial mais net_profit_loss. Usado após edições, exclusões e lançamentos
+    retroativos.
+    """
+    params = _since_params(since)
+    params['user_ids'] = [user_id]
+    db.session.execute(_period_balances_statement(), params)
+
+
+def get_period_rows(user_id, period_type, since):
+    """Linhas de betting_stats do usuário a partir do período que contém `since`"""
+    return BettingStats.query.filter(
+        BettingStats.user_id == user_id,
+        BettingStats.period_type == period_type,
+        BettingStats.period_date >= period_start(period_type, since)
+    ).order_by(BettingStats.period_date).all()
+
+
+def _upsert_period(user_id, period_type, period_date, insert_values, increments=(),
+                   replacements=(), extremes=None, recompute_win_rate=False):
+    """
+    INSERT ... ON CONFLICT (user_id, period_type, period_date) DO UPDATE.
+    Colunas em `increments` são somadas, em `replacements` substituídas e em
+    `extremes` combinadas com max/min (ignorando NULL).
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        greatest, least = db.func.greatest, db.func.least
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        greatest, least = db.func.max, db.func.min
+    else:
+        return _upsert_period_orm(user_id, period_type, period_date, insert_values,
+                                  increments, replacements, extremes, recompute_win_rate)
+
+    table = BettingStats.__table__
+    statement = insert(table).values(
+        user_id=user_id, period_type=period_type, period_date=period_date,
+        updated_at=datetime.utcnow(), **insert_values
+    )
+    excluded = statement.excluded
+
+    update_set = {'updated_at': excluded.updated_at}
+    for column in increments:
+        update_set[column] = db.func.coalesce(table.c[column], 0) + excluded[column]
+    for column in replacements:
+        update_set[column] = excluded[column]
+    for column, mode in (extremes or {}).items():
+        combine = greatest if mode == 'max' else least
+        update_set[column] = combine(db.func.coalesce(table.c[column], excluded[column]), excluded[column])
+    if recompute_win_rate:
+        total = db.func.coalesce(table.c.total_sessions, 0) + excluded.total_sessions
+        winning = db.func.coalesce(table.c.winning_sessions, 0) + excluded.winning_sessions
+        update_set['win_rate'] = winning * 100.0 / total
+
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['user_id', 'period_type', 'period_date'],
+        set_=update_set
+    ))
+
+
+def _upsert_period_orm(user_id, period_type, period_date, insert_values, increments,
+                       replacements, extremes, recompute_win_rate):
+    # Bancos sem ON CONFLICT: leitura com lock seguida de insert/update pelo ORM
+    row = BettingStats.query.filter_by(
+        user_id=user_id, period_type=period_type, period_date=period_date
+    ).with_for_update().first()
+
+    if row is None:
+        db.session.add(BettingStats(
+            user_id=user_id, period_type=period_type, period_date=period_date,
+            updated_at=datetime.utcnow(), **insert_values
+        ))
+        db.session.flush()
+        return
+
+    for column in increments:
+        setattr(row, column, (getattr(row, column) or 0) + insert_values[column])
+    for column in replacements:
+        setattr(row, column, insert_values[column])
+    for column, mode in (extremes or {}).items():
+        current = getattr(row, column)
+        candidates = [value for value in (current, insert_values[column]) if value is not None]
+        setattr(row, column, max(candidates) if mode == 'max' else min(candidates))
+    if recompute_win_rate and row.total_sessions:
+        row.win_rate = Decimal(row.winning_sessions * 100) / row.total_sessions
+    row.updated_at = datetime.utcnow()
+
+
+# === RECONSTRUÇÃO EM LOTE (flask rebuild-stats) ===
+
+def _since_params(since):
+    since = since or EPOCH
+    return {f'since_{period_type}': period_start(period_type, since) for period_type in PERIOD_TYPES}
+
+
+def _since_bindparams():
+    return [bindparam(f'since_{period_type}', type_=db.Date) for period_type in PERIOD_TYPES]
+
+
+def _since_conditions(column):
+    return ' OR '.join(
+        f"(period_type = '{period_type}' AND {column} >= :since_{period_type})"
+        for period_type in PERIOD_TYPES
+    )
+
+
+def _period_balances_statement():
+    previous_balance = """COALESCE((
+        SELECT t.balance_after FROM transactions t
+        WHERE t.user_id = betting_stats.user_id AND t.date < betting_stats.period_date
+        ORDER BY t.date DESC, t.id DESC
+        LIMIT 1
+    ), 0)"""
+
+    return text(f"""
+        UPDATE betting_stats
+        SET starting_balance = {previous_balance},
+            ending_balance = {previous_balance} + net_profit_loss
+        WHERE user_id IN :user_ids AND ({_since_conditions('period_date')})
+    """).bindparams(bindparam('user_ids', expanding=True), *_since_bindparams())
+
+
+def _period_bucket(dialect, period_type, column):
+    """Expressão SQL que leva `column` ao início do período (mesma regra de period_start)"""
+    if dialect == 'postgresql':
+        unit = {'daily': 'day', 'weekly': 'week', 'monthly': 'month', 'yearly': 'year'}[period_type]
+        return f"CAST(date_trunc('{unit}', {column}) AS DATE)"
+
+    # SQLite: semanas começam na segunda-feira, como em period_start
+    if period_type == 'daily':
+        return f"date({column})"
+    if period_type == 'weekly':
+        return f"date({column}, '-' || ((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7) || ' days')"
+    if period_type == 'monthly':
+        return f"date({column}, 'start of month')"
+    return f"date({column}, 'start of year')"
+
+
+def rebuild_stats_for_users(connection, user_ids, since=None):
+    """
+    Reconstrói as linhas de betting_stats dos usuários informados a partir de
+    `since` (ou de todo o histórico), usando apenas instruções em lote:
+    DELETE, INSERT ... SELECT ... GROUP BY por tipo de período para transações
+    e sessões, e o UPDATE de saldos. Retorna a quantidade de linhas gravadas.
+    """
+    dialect = connection.dialect.name
+    now = datetime.utcnow()
+    params = _since_params(since)
+    params.update({'user_ids': list(user_ids), 'now': now})
+
+    def run(sql):
+        binds = [bindparam('user_ids', expanding=True), bindparam('now', type_=db.DateTime), *_since_bindparams()]
+        binds = [b for b in binds if f':{b.key}' in sql]
+        return connection.execute(text(sql).bindparams(*binds), {b.key: params[b.key] for b in binds})
+
+    run(f"""
+        DELETE FROM betting_stats
+        WHERE user_id IN :user_ids AND ({_since_conditions('period_date')})
+    """)
+
+    rows_written = 0
+    for period_type in PERIOD_TYPES:
+        bucket = _period_bucket(dialect, period_type, 'date')
+        result = run(f"""
+            INSERT INTO betting_stats (
+                user_id, period_type, period_date,
+                starting_balance, ending_balance, total_deposits, total_withdrawals, net_profit_loss,
+                total_sessions, winning_sessions, losing_sessions, total_bets, win_rate,
+                sessions_net_result, stop_losses_hit, profit_targets_hit, max_drawdown, max_profit,
+                created_at, updated_at
+            )
+            SELECT user_id, '{period_type}', {bucket},
+                   0, 0,
+                   SUM(CASE WHEN type = 'deposit' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'deposit' THEN 0 ELSE amount END),
+                   SUM(CASE WHEN type = 'deposit' THEN amount ELSE -amount END),
+                   0, 0, 0, 0, 0,
+                   0, 0, 0, 0, 0,
+                   :now, :now
+            FROM transactions
+            WHERE user_id IN :user_ids AND date >= :since_{period_type}
+            GROUP BY user_id, {bucket}
+        """)
+        rows_written += max(result.rowcount, 0)
+
+        session_bucket = _period_bucket(dialect, period_type, 'started_at')
+        result = run(f"""
+            INSERT INTO betting_stats (
+                user_id, period_type, period_date,
+                starting_balance, ending_balance, total_deposits, total_withdrawals, net_profit_loss,
+                total_sessions, winning_sessions, losing_sessions, total_bets, win_rate,
+                sessions_net_result, best_session_result, worst_session_result,
+                stop_losses_hit, profit_targets_hit, max_drawdown, max_profit,
+                created_at, updated_at
+            )
+            SELECT user_id, '{period_type}', {session_bucket},
+                   0, 0, 0, 0, 0,
+                   COUNT(*),
+                   SUM(CASE WHEN net_result > 0 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN net_result < 0 THEN 1 ELSE 0 END),
+                   SUM(COALESCE(total_bets, 0)),
+                   SUM(CASE WHEN net_result > 0 THEN 1 ELSE 0 END) * 100.0 / COUNT(*),
+                   SUM(COALESCE(net_result, 0)), MAX(net_result), MIN(net_result),
+                   SUM(CASE WHEN stop_loss_hit THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN profit_target_hit THEN 1 ELSE 0 END),
+                   0, 0,
+                   :now, :now
+            FROM betting_sessions
+            WHERE user_id IN :user_ids AND status = 'completed' AND started_at >= :since_{period_type}
+            GROUP BY user_id, {session_bucket}
+            ON CONFLICT (user_id, period_type, period_date) DO UPDATE SET
+                total_sessions = excluded.total_sessions,
+                winning_sessions = excluded.winning_sessions,
+                losing_sessions = excluded.losing_sessions,
+                total_bets = excluded.total_bets,
+                win_rate = excluded.win_rate,
+                sessions_net_result = excluded.sessions_net_result,
+                best_session_result = excluded.best_session_result,
+                worst_session_result = excluded.worst_session_result,
+                stop_losses_hit = excluded.stop_losses_hit,
+                profit_targets_hit = excluded.profit_targets_hit,
+                updated_at = excluded.updated_at
+        """)
+        rows_written += max(result.rowcount, 0)
+
+    connection.execute(_period_balances_statement(), params)
+
+    return rows_written
+
+
+# Engine do processo worker, criado por _init_rebuild_worker
+_worker_engine = None
+
+
+def _init_rebuild_worker(database_uri):
+    global _worker_engine
+    _worker_engine = create_engine(database_uri, poolclass=NullPool)
+
+
+def rebuild_stats_chunk(user_ids, since=None, database_uri=None):
+    """
+    Executa rebuild_stats_for_users e rebuild_category_stats em uma transação
+    própria e incrementa a versão dos dados dos usuários. Nos workers do pool
+    usa o engine do processo; fora dele, um engine criado para a chamada.
+    Retorna (user_ids, linhas gravadas).
+    """
+    from .categories import rebuild_category_stats
+    from .versioning import bump_data_version_on
+
+    engine = _worker_engine or create_engine(database_uri, poolclass=NullPool)
+    with engine.begin() as connection:
+        rows = rebuild_stats_for_users(connection, user_ids, since)
+        rows += rebuild_category_stats(connection, user_ids)
+        # Escritas em SQL puro não passam pelo before_flush: invalida caches e ETags aqui
+        bump_data_version_on(connection, user_ids)
+    return user_ids, rows
+
+
+def load_checkpoint(path, since=None):
+    """
+    IDs de usuários já reconstruídos registrados no arquivo de checkpoint.
+    Levanta ValueError se o checkpoint foi gravado com outro --since: os
+    usuários dele não tiveram reconstruídos os períodos pedidos agora.
+    """
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        state = json.load(f)
+
+    expected = since.isoformat() if since else None
+    if state.get('since') != expected:
+        raise ValueError(
+            f"Checkpoint {path} gravado com --since {state.get('since') or '(nenhum)'}, "
+            f"não {expected or '(nenhum)'}: use o mesmo --since ou outro arquivo de checkpoint"
+        )
+    return set(state.get('completed_user_ids', []))
+
+
+def save_checkpoint(path, completed_user_ids, since=None):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'since': since.isoformat() if since else None,
+            'completed_user_ids': sorted(completed_user_ids),
+            'updated_at': datetime.utcnow().isoformat(),
+        }, f)
+    os.replace(tmp_path, path)
@@ -1,13 +1,38 @@
 # routes.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, g
+from werkzeug.test import EnvironBuilder
 from . import db
-from .models import User, Transaction, BettingProfile, Objective, BettingSession, BettingStats
-from sqlalchemy import desc, func, and_, extract
+from .config import GAME_CONFIGURATIONS
+from .models import (
+    User, Transaction, BettingProfile, Objective, BettingSession, BettingStats, UserBalance,
+    TransactionTombstone
+)
+from .ledger import (
+    get_user_ledger, apply_transaction, record_new_transaction, refresh_last_transaction,
+    recompute_running_balances
+)
+from .export import EXPORT_FORMATS, EXPORT_MIMETYPES, build_export_query, iter_export
+from .caching import cached_per_user, conditional_per_user
+from .context import get_financial_context, reset_financial_context
+from . import rollups, categories, running_stats
+from .utils import (
+    parse_datetime_utc, validate_transaction_payload, validate_transaction_attributes,
+    promote_meta_columns, get_period_range, downsample_lttb
+)
+from .versioning import bump_data_version, get_data_version
+from .search import apply_search, apply_tag_filter
+from .drawdown import get_drawdown_report
+from .simulation import simulate_risk_of_ruin, SimulationTimeout
+from sqlalchemy import desc, func, and_, or_, case, insert
 from decimal import Decimal
-from datetime import datetime, date, timedelta
+from datetime import datetime, timedelta
 import uuid
+import operator
 import hashlib
+import base64
+import binascii
+import json
 import jwt as pyjwt
 import os
 from functools import wraps
@@ -26,6 +51,12 @@ def generate_token(user_id):
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
+        # Sub-requisições do /batch: o token já foi validado na requisição externa
+        batch_user_id = g.get('batch_user_id')
+        if batch_user_id is not None:
+            g.current_user_id = batch_user_id
+            return f(batch_user_id, *args, **kwargs)
+        
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({'error': 'Token is missing'}), 401
@@ -40,52 +71,186 @@ def token_required(f):
         except pyjwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token'}), 401
         
+        g.current_user_id = current_user_id
         return f(current_user_id, *args, **kwargs)
     return decorated
 
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+@main.after_request
+def reset_context_after_write(response):
+    """
+    Toda escrita bem-sucedida descarta o contexto financeiro da requisição
+    (relevante no /batch). O cache de respostas não precisa ser limpo: as
+    chaves usam a versão dos dados, incrementada no flush (versioning.py).
+    """
+    user_id = g.get('current_user_id')
+    if request.endpoint == 'main.run_batch':
+        return response  # cada sub-requisição já tratou as próprias escritas
+    if user_id is not None and request.method in WRITE_METHODS and response.status_code < 400:
+        reset_financial_context(user_id)
+    return response
+
 # =================================================================
 # FUNÇÃO AUXILIAR PARA CÁLCULO DE SALDO (ADICIONADA)
 # =================================================================
 def _get_user_balance(user_id):
     """
-    Calcula o saldo atual do usuário de forma robusta, somando depósitos e subtraindo saques.
-    Isso evita o erro 'TypeError' e garante que o saldo seja sempre um valor numérico.
+    Retorna o saldo atual do usuário a partir do ledger materializado (user_balances),
+    mantido pelas rotas de escrita de transações. Vem do contexto financeiro da requisição.
     """
-    total_deposits = db.session.query(func.sum(Transaction.amount)).filter(
-        and_(Transaction.user_id == user_id, Transaction.type == 'deposit')
-    ).scalar() or Decimal('0.00')
-
-    total_withdrawals = db.session.query(func.sum(Transaction.amount)).filter(
-        and_(Transaction.user_id == user_id, Transaction.type == 'withdraw')
-    ).scalar() or Decimal('0.00')
-    
-    return total_deposits - total_withdrawals
+    return get_financial_context(user_id).balance
 
 def _get_user_initial_bank(user_id):
     """
     Obtém a banca inicial do usuário através da primeira transação marcada como inicial
-    ou do perfil de apostas.
+    ou do perfil de apostas (ver context.py; carregada junto com o saldo).
     """
-    # Primeiro tenta encontrar na transação inicial
-    initial_tx = Transaction.query.filter_by(
-        user_id=user_id, 
-        is_initial_bank=True
-    ).first()
-    
-    if initial_tx:
-        return initial_tx.amount
-    
-    # Senão, busca no perfil de apostas
-    profile = BettingProfile.query.filter_by(
-        user_id=user_id, 
-        is_active=True
-    ).first()
-    
-    if profile:
-        return profile.initial_balance
-    
-    # Valor padrão se não encontrar
-    return Decimal('0.00')
+    return get_financial_context(user_id).initial_bank
+
+def _parse_transaction_date(value):
+    """
+    Converte a data enviada pelo cliente (ISO string ou datetime) para datetime
+    UTC sem timezone, o formato usado na coluna Transaction.date.
+    Levanta ValueError/TypeError se o formato for inválido.
+    """
+    return parse_datetime_utc(value)
+
+def _encode_cursor(tx):
+    """Cursor opaco com a chave (date, id) da última transação da página"""
+    raw = json.dumps([tx.date.isoformat(), tx.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    """Inverso de _encode_cursor. Levanta ValueError se o cursor for inválido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_date, cursor_id = json.loads(raw)
+        return datetime.fromisoformat(cursor_date), int(cursor_id)
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError('Cursor inválido')
+
+def _get_page_size(args):
+    """Tamanho de página a partir de ?limit=, respeitando DEFAULT_PAGE_SIZE/MAX_PAGE_SIZE"""
+    default_size = current_app.config.get('DEFAULT_PAGE_SIZE', 20)
+    max_size = current_app.config.get('MAX_PAGE_SIZE', 100)
+    limit = args.get('limit', default_size, type=int)
+    return max(1, min(limit, max_size))
+
+def _filter_transactions(query, args, user_id):
+    """
+    Aplica os filtros de listagem (?start_date, end_date, type, category,
+    game_type, betting_session_id, tag, bet_type, min_odds, max_odds,
+    min_stake, max_stake). O intervalo de datas é semiaberto
+    [start_date, end_date) para usar o índice idx_user_date. ?tag pode ser
+    repetido (todas as tags precisam estar presentes); os filtros de aposta
+    usam as colunas promovidas de meta (bet_odds, bet_type, bet_stake).
+    `user_id` é o dono das linhas da consulta: no SQLite as tags são
+    procuradas no índice (user_id, tag) de transaction_tags.
+    Levanta ValueError para parâmetros inválidos.
+    """
+    try:
+        if args.get('start_date'):
+            query = query.filter(Transaction.date >= _parse_transaction_date(args['start_date']))
+        if args.get('end_date'):
+            query = query.filter(Transaction.date < _parse_transaction_date(args['end_date']))
+    except (ValueError, TypeError):
+        raise ValueError('Formato de data inválido')
+
+    if args.get('type'):
+        if args['type'] not in ('deposit', 'withdraw'):
+            raise ValueError('Tipo deve ser "deposit" ou "withdraw"')
+        query = query.filter(Transaction.type == args['type'])
+
+    for param, column in (('category', Transaction.category),
+                          ('game_type', Transaction.game_type),
+                          ('betting_session_id', Transaction.betting_session_id)):
+        if args.get(param):
+            query = query.filter(column == args[param])
+
+    if args.get('bet_type'):
+        query = query.filter(Transaction.bet_type == args['bet_type'].strip().lower())
+
+    try:
+        for param, column, compare in (('min_odds', Transaction.bet_odds, operator.ge),
+                                       ('max_odds', Transaction.bet_odds, operator.le),
+                                       ('min_stake', Transaction.bet_stake, operator.ge),
+                                       ('max_stake', Transaction.bet_stake, operator.le)):
+            if args.get(param):
+                query = query.filter(compare(column, Decimal(args[param])))
+    except ArithmeticError:
+        raise ValueError('Filtro numérico inválido')
+
+    return apply_tag_filter(query, [tag.strip() for tag in args.getlist('tag') if tag.strip()], user_id)
+
+def _paginate_transactions(query, args):
+    """
+    Paginação por chave (keyset) em (date, id) decrescente. Retorna a lista
+    da página e o next_cursor (None na última página).
+    """
+    if args.get('cursor'):
+        cursor_date, cursor_id = _decode_cursor(args['cursor'])
+        query = query.filter(or_(
+            Transaction.date < cursor_date,
+            and_(Transaction.date == cursor_date, Transaction.id < cursor_id)
+        ))
+
+    page_size = _get_page_size(args)
+    rows = query.order_by(desc(Transaction.date), desc(Transaction.id)).limit(page_size + 1).all()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = _encode_cursor(rows[-1]) if has_more else None
+
+    return rows, next_cursor
+
+def _encode_sync_token(updated_key, deleted_key):
+    """Token de sincronização: posição (timestamp, id) em transações alteradas e em exclusões"""
+    state = {
+        'u': [updated_key[0].isoformat(), updated_key[1]] if updated_key else None,
+        'd': [deleted_key[0].isoformat(), deleted_key[1]] if deleted_key else None,
+    }
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip('=')
+
+def _decode_sync_token(token):
+    """Inverso de _encode_sync_token. Levanta ValueError se o token for inválido."""
+    if not token:
+        return None, None
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        keys = []
+        for name in ('u', 'd'):
+            key = state.get(name)
+            keys.append((datetime.fromisoformat(key[0]), int(key[1])) if key else None)
+        return tuple(keys)
+    except (TypeError, ValueError, AttributeError, IndexError, UnicodeDecodeError, binascii.Error):
+        raise ValueError('Token de sincronização inválido')
+
+def _after_key(query, timestamp_column, id_column, key):
+    """Linhas estritamente depois da chave (timestamp, id)"""
+    if key is None:
+        return query
+    return query.filter(or_(
+        timestamp_column > key[0],
+        and_(timestamp_column == key[0], id_column > key[1])
+    ))
+
+def _serialize_transaction(tx):
+    return {
+        'id': tx.id,
+        'type': tx.type,
+        'amount': str(tx.amount),
+        'category': tx.category,
+        'description': tx.description,
+        'date': tx.date.isoformat(),
+        'balance_before': str(tx.balance_before),
+        'balance_after': str(tx.balance_after),
+        'is_initial_bank': tx.is_initial_bank,
+        'game_type': tx.game_type,
+        'betting_session_id': tx.betting_session_id,
+        'meta': tx.meta or {},
+        'tags': tx.tags or []
+    }
 
 # === AUTHENTICATION ROUTES ===
 
@@ -138,6 +303,26 @@ def register():
         )
         
         db.session.add(initial_transaction)
+        db.session.flush()
+        
+        # Ledger de saldo já nasce com a banca inicial
+        ledger = UserBalance(
+            user_id=user.id,
+            balance=Decimal('0.00'),
+            total_deposits=Decimal('0.00'),
+            total_withdrawals=Decimal('0.00'),
+            transaction_count=0
+        )
+        db.session.add(ledger)
+        record_new_transaction(ledger, initial_transaction)
+        rollups.record_transaction(
+            user.id, 'deposit', initial_bank_decimal, initial_transaction.date,
+            Decimal('0.00'), initial_bank_decimal
+        )
+        categories.record_category(
+            user.id, initial_transaction.category, 'deposit', initial_bank_decimal, initial_transaction.date
+        )
+        running_stats.rebuild_running_stats(user.id)
         
         # 3. Criar perfil de apostas padrão com a banca inicial
         default_betting_profile = BettingProfile(
@@ -257,8 +442,9 @@ def create_betting_profile(current_user_id):
 
 @main.route('/betting-profiles', methods=['GET'])
 @token_required
+@conditional_per_user
 def get_betting_profile(current_user_id):
-    profile = BettingProfile.query.filter_by(user_id=current_user_id, is_active=True).first()
+    profile = get_financial_context(current_user_id).profile
     
     if not profile:
         return jsonify({'error': 'No active betting profile found'}), 404
@@ -306,39 +492,154 @@ def update_betting_profile(current_user_id, profile_id):
 # === TRANSACTION ROUTES ===
 @main.route('/transactions', methods=['GET'])
 @token_required
+@conditional_per_user
 def get_transactions(current_user_id):
     """
-    Retorna todas as transações do usuário, ordenadas por data decrescente.
+    Retorna as transações do usuário, ordenadas por data decrescente, paginadas
+    por cursor. Aceita ?limit, cursor e os filtros de _filter_transactions
+    (datas, tipo, categoria, jogo, sessão, tag, bet_type, odds e stake). Use o
+    next_cursor da resposta como ?cursor para buscar a próxima página.
+    ?tag usa o índice GIN de tags no PostgreSQL e a tabela transaction_tags no
+    SQLite; em outros bancos é uma busca no JSON de cada transação do usuário.
     """
     try:
-        transactions = Transaction.query.filter_by(
-            user_id=current_user_id
-        ).order_by(desc(Transaction.date)).all()
+        query = _filter_transactions(Transaction.query.filter_by(user_id=current_user_id), request.args, current_user_id)
+        transactions, next_cursor = _paginate_transactions(query, request.args)
 
         return jsonify({
             'success': True,
-            'data': [
-                {
-                    'id': tx.id,
-                    'type': tx.type,
-                    'amount': str(tx.amount),
-                    'category': tx.category,
-                    'description': tx.description,
-                    'date': tx.date.isoformat(),
-                    'balance_before': str(tx.balance_before),
-                    'balance_after': str(tx.balance_after),
-                    'is_initial_bank': tx.is_initial_bank,
-                    'meta': tx.meta or {}
-                }
-                for tx in transactions
-            ]
+            'data': [_serialize_transaction(tx) for tx in transactions],
+            'pagination': {
+                'limit': _get_page_size(request.args),
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
         })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
             'error': 'Erro ao carregar transações'
         }), 500
 
+@main.route('/transactions/search', methods=['GET'])
+@token_required
+@conditional_per_user
+def search_transactions(current_user_id):
+    """
+    Busca textual na descrição e na categoria (?q=), com os mesmos filtros e
+    a mesma paginação por cursor de GET /transactions. Todos os termos
+    precisam aparecer; cada termo casa com o início de uma palavra.
+    """
+    try:
+        query = Transaction.query.filter_by(user_id=current_user_id)
+        query = apply_search(_filter_transactions(query, request.args, current_user_id), request.args.get('q'))
+        transactions, next_cursor = _paginate_transactions(query, request.args)
+
+        return jsonify({
+            'success': True,
+            'data': [_serialize_transaction(tx) for tx in transactions],
+            'pagination': {
+                'limit': _get_page_size(request.args),
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.error(f'Transaction search failed for user {current_user_id}: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Erro ao buscar transações'
+        }), 500
+
+@main.route('/transactions/export', methods=['GET'])
+@token_required
+def export_transactions(current_user_id):
+    """
+    Exporta as transações do usuário em streaming (?format=csv|ndjson).
+    Aceita os mesmos filtros de GET /transactions.
+    """
+    if not current_app.config.get('ENABLE_EXPORT_FEATURES', False):
+        return jsonify({'success': False, 'error': 'Exportação desabilitada'}), 403
+    
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Formato deve ser "csv" ou "ndjson"'}), 400
+    
+    try:
+        query = _filter_transactions(build_export_query(current_user_id), request.args, current_user_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    filename = f"transacoes_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    
+    return Response(
+        stream_with_context(iter_export(query, fmt)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@main.route('/transactions/changes', methods=['GET'])
+@token_required
+@conditional_per_user
+def get_transaction_changes(current_user_id):
+    """
+    Sincronização incremental da lista de transações (?since=<token>&limit=).
+    Retorna as transações criadas ou alteradas e os ids excluídos depois do
+    token, em ordem de alteração, e o token para a próxima chamada. Sem since,
+    devolve o histórico desde o início. O cliente aplica `deleted` antes de
+    `changed` e repete enquanto has_more for true.
+    """
+    try:
+        updated_key, deleted_key = _decode_sync_token(request.args.get('since'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    page_size = _get_page_size(request.args)
+    
+    changed = _after_key(
+        Transaction.query.filter(Transaction.user_id == current_user_id),
+        Transaction.updated_at, Transaction.id, updated_key
+    ).order_by(Transaction.updated_at, Transaction.id).limit(page_size + 1).all()
+    
+    deleted = _after_key(
+        TransactionTombstone.query.filter(TransactionTombstone.user_id == current_user_id),
+        TransactionTombstone.deleted_at, TransactionTombstone.id, deleted_key
+    ).order_by(TransactionTombstone.deleted_at, TransactionTombstone.id).limit(page_size + 1).all()
+    
+    has_more = len(changed) > page_size or len(deleted) > page_size
+    changed = changed[:page_size]
+    deleted = deleted[:page_size]
+    
+    if changed:
+        updated_key = (changed[-1].updated_at, changed[-1].id)
+    if deleted:
+        deleted_key = (deleted[-1].deleted_at, deleted[-1].id)
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'changed': [
+                {**_serialize_transaction(tx), 'updated_at': tx.updated_at.isoformat()}
+                for tx in changed
+            ],
+            'deleted': [tombstone.transaction_id for tombstone in deleted]
+        },
+        'sync': {
+            'next_token': _encode_sync_token(updated_key, deleted_key),
+            'has_more': has_more
+        }
+    })
+
 @main.route('/transactions', methods=['POST'])
 @token_required
 def create_transaction(current_user_id):
@@ -346,8 +647,22 @@ def create_transaction(current_user_id):
     tx_type = data.get('type')
     amount = Decimal(str(data.get('amount')))
     
-    # CORREÇÃO: Lógica de saldo instável substituída
-    current_balance = _get_user_balance(current_user_id)
+    # Data opcional permite lançar transações retroativas
+    tx_date = datetime.utcnow()
+    if data.get('date'):
+        try:
+            tx_date = _parse_transaction_date(data['date'])
+        except (ValueError, TypeError):
+            return jsonify({'success': False, 'error': 'Formato de data inválido'}), 400
+    
+    attributes = validate_transaction_attributes(data.get('tags'), data.get('meta'))
+    if not attributes['is_valid']:
+        return jsonify({'success': False, 'error': '; '.join(attributes['errors'])}), 400
+    
+    # Bloqueia o ledger até o commit para serializar escritas concorrentes
+    ledger = get_user_ledger(current_user_id, for_update=True)
+    current_balance = ledger.balance
+    stats = running_stats.get_running_stats(current_user_id)
 
     if tx_type == 'deposit':
         new_balance = current_balance + amount
@@ -365,11 +680,39 @@ def create_transaction(current_user_id):
         game_type=data.get('gameType'),
         balance_before=current_balance,
         balance_after=new_balance,
-        meta=data.get('meta', {}),
-        date=datetime.utcnow()
+        meta=attributes['meta'],
+        tags=attributes['tags'],
+        date=tx_date,
+        **promote_meta_columns(attributes['meta'])
     )
 
+    # Transação retroativa (antes da última): recalcula apenas o sufixo a partir dela
+    latest = db.session.get(Transaction, ledger.last_transaction_id) if ledger.last_transaction_id else None
+    backdated = latest is not None and new_tx.date < latest.date
+    if backdated:
+        suffix = running_stats.read_suffix(current_user_id, new_tx.date)
+    
     db.session.add(new_tx)
+    db.session.flush()
+    
+    if backdated:
+        recompute_running_balances(current_user_id, new_tx.date, new_tx.id)
+        db.session.refresh(new_tx)
+        rollups.record_transaction(current_user_id, new_tx.type, new_tx.amount, new_tx.date)
+        rollups.refresh_period_balances(current_user_id, new_tx.date)
+        running_stats.apply_suffix_change(stats, current_user_id, new_tx.date, suffix)
+    else:
+        rollups.record_transaction(
+            current_user_id, new_tx.type, new_tx.amount, new_tx.date,
+            new_tx.balance_before, new_tx.balance_after
+        )
+        running_stats.record_balance_change(
+            stats, new_tx.balance_before, new_tx.balance_after,
+            running_stats.is_game_transaction(new_tx.game_type, new_tx.betting_session_id)
+        )
+    
+    categories.record_category(current_user_id, new_tx.category, new_tx.type, new_tx.amount, new_tx.date)
+    record_new_transaction(ledger, new_tx)
     db.session.commit()
 
     return jsonify({
@@ -383,70 +726,216 @@ def create_transaction(current_user_id):
             'category': new_tx.category,
             'description': new_tx.description,
             'date': new_tx.date.isoformat(),
-            'meta': new_tx.meta
+            'meta': new_tx.meta,
+            'tags': new_tx.tags
         }
     }), 201
 
+@main.route('/transactions/bulk', methods=['POST'])
+@token_required
+def create_transactions_bulk(current_user_id):
+    """
+    Lança várias transações de uma vez ({"transactions": [...]}, mesmos campos
+    de POST /transactions). O lote é validado por inteiro antes de gravar
+    (tudo ou nada); os saldos são calculados em uma passada em memória a
+    partir do saldo atual, as linhas entram em um único INSERT em lote e o
+    commit é único. Retorna o resultado de cada linha na ordem enviada.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('transactions')
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'Informe a lista "transactions"'}), 400
+    
+    max_rows = current_app.config.get('MAX_BULK_TRANSACTIONS', 1000)
+    if len(items) > max_rows:
+        return jsonify({'success': False, 'error': f'Máximo de {max_rows} transações por lote'}), 400
+    
+    max_amount = Decimal(str(current_app.config.get('MAX_TRANSACTION_AMOUNT', '100000.00')))
+    now = datetime.utcnow()
+    
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        validation = validate_transaction_payload(item, max_amount)
+        if not validation['is_valid']:
+            errors.append({'index': index, 'errors': validation['errors']})
+            continue
+        row = validation['transaction']
+        row['date'] = row['date'] or now
+        rows.append((index, row))
+    
+    if errors:
+        return jsonify({'success': False, 'error': 'Lote inválido', 'details': errors}), 400
+    
+    try:
+        # Ordem cronológica (estável): os ids seguem a mesma ordem das datas
+        rows.sort(key=lambda indexed: indexed[1]['date'])
+        
+        ledger = get_user_ledger(current_user_id, for_update=True)
+        stats = running_stats.get_running_stats(current_user_id)
+        latest = db.session.get(Transaction, ledger.last_transaction_id) if ledger.last_transaction_id else None
+        # Lote que começa antes da última transação exige recalcular o sufixo
+        backdated = latest is not None and rows[0][1]['date'] < latest.date
+        if backdated:
+            suffix = running_stats.read_suffix(current_user_id, rows[0][1]['date'])
+        
+        balance = ledger.balance
+        for _, row in rows:
+            row['user_id'] = current_user_id
+            row['balance_before'] = balance
+            balance += row['amount'] if row['type'] == 'deposit' else -row['amount']
+            row['balance_after'] = balance
+        
+        ids = db.session.scalars(
+            insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+            [row for _, row in rows]
+        ).all()
+        for (_, row), tx_id in zip(rows, ids):
+            row['id'] = tx_id
+        
+        for _, row in rows:
+            apply_transaction(ledger, row['type'], row['amount'])
+        
+        if backdated:
+            first = rows[0][1]
+            recompute_running_balances(current_user_id, first['date'], first['id'])
+            rollups.record_transactions(current_user_id, [row for _, row in rows], with_balances=False)
+            rollups.refresh_period_balances(current_user_id, first['date'])
+            running_stats.apply_suffix_change(stats, current_user_id, first['date'], suffix)
+            refresh_last_transaction(ledger)
+            
+            balances = dict(
+                (tx_id, (before, after)) for tx_id, before, after in db.session.query(
+                    Transaction.id, Transaction.balance_before, Transaction.balance_after
+                ).filter(Transaction.id.in_(ids))
+            )
+            for _, row in rows:
+                row['balance_before'], row['balance_after'] = balances[row['id']]
+        else:
+            rollups.record_transactions(current_user_id, [row for _, row in rows])
+            for _, row in rows:
+                running_stats.record_balance_change(
+                    stats, row['balance_before'], row['balance_after'],
+                    running_stats.is_game_transaction(row['game_type'], row['betting_session_id'])
+                )
+            ledger.last_transaction_id = rows[-1][1]['id']
+        
+        categories.record_categories(current_user_id, [row for _, row in rows])
+        
+        # INSERT em lote não passa pelo flush do ORM: versão incrementada aqui
+        bump_data_version([current_user_id])
+        db.session.commit()
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Bulk insert failed for user {current_user_id}: {str(e)}')
+        return jsonify({'success': False, 'error': 'Erro interno do servidor'}), 500
+    
+    results = sorted(rows, key=lambda indexed: indexed[0])
+    return jsonify({
+        'success': True,
+        'data': [{
+            'index': index,
+            'id': row['id'],
+            'type': row['type'],
+            'amount': str(row['amount']),
+            'balance_before': str(row['balance_before']),
+            'balance_after': str(row['balance_after']),
+            'category': row['category'],
+            'description': row['description'],
+            'date': row['date'].isoformat(),
+            'meta': row['meta'],
+            'tags': row['tags']
+        } for index, row in results]
+    }), 201
+
+# Janelas aceitas em /transactions/summary (ver utils.get_period_start_date)
+SUMMARY_WINDOWS = ('today', 'week', 'month', 'quarter', 'year')
+
+def _transactions_summary_data(user_id, window='today'):
+    """
+    Resumo das transações para o dashboard. O total vem do ledger e a
+    contagem de depósitos de idx_user_type (saques são o restante). As
+    transações do dia e da janela pedida saem de uma única busca por
+    intervalo [início, fim) em idx_user_date: toda janela contém o dia de
+    hoje, então o dia é uma condição dentro das linhas da janela. A última
+    transação vem do contexto financeiro e as categorias mais usadas de
+    category_stats.
+    """
+    window_start, window_end = get_period_range(window)
+    today_start, today_end = get_period_range('today')
+    context = get_financial_context(user_id)
+    
+    deposit_count = db.session.query(func.count(Transaction.id)).filter(
+        Transaction.user_id == user_id,
+        Transaction.type == 'deposit'
+    ).scalar()
+    
+    in_today = and_(Transaction.date >= today_start, Transaction.date < today_end)
+    is_deposit = Transaction.type == 'deposit'
+    
+    counts = db.session.query(
+        func.count(Transaction.id).label('window_count'),
+        func.coalesce(func.sum(case((in_today, 1), else_=0)), 0).label('today'),
+        func.coalesce(func.sum(case((is_deposit, Transaction.amount), else_=0)), 0).label('window_deposits'),
+        func.coalesce(func.sum(case((~is_deposit, Transaction.amount), else_=0)), 0).label('window_withdrawals')
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.date >= window_start,
+        Transaction.date < window_end
+    ).one()
+    
+    # Categorias mais usadas (category_stats)
+    popular_categories = categories.get_popular_categories(user_id, limit=5)
+    
+    last_transaction = context.last_transaction
+    window_deposits = Decimal(str(counts.window_deposits)).quantize(Decimal('0.01'))
+    window_withdrawals = Decimal(str(counts.window_withdrawals)).quantize(Decimal('0.01'))
+    
+    return {
+        'total_transactions': context.transaction_count,
+        'deposit_count': deposit_count,
+        'withdraw_count': context.transaction_count - deposit_count,
+        'today_transactions': int(counts.today),
+        'window': {
+            'name': window,
+            'start': window_start.isoformat(),
+            'end': window_end.isoformat(),
+            'transactions': int(counts.window_count),
+            'deposits': str(window_deposits),
+            'withdrawals': str(window_withdrawals),
+            'net': str(window_deposits - window_withdrawals)
+        },
+        'last_transaction': {
+            'id': last_transaction.id,
+            'type': last_transaction.type,
+            'amount': str(last_transaction.amount),
+            'category': last_transaction.category,
+            'date': last_transaction.date.isoformat()
+        } if last_transaction else None,
+        'popular_categories': [
+            {'category': cat[0], 'count': cat[1]} 
+            for cat in popular_categories
+        ]
+    }
+
 @main.route('/transactions/summary', methods=['GET'])
 @token_required
 def get_transactions_summary(current_user_id):
     """
-    Retorna um resumo das transações para dashboard.
+    Retorna um resumo das transações para dashboard (?window=today|week|month|quarter|year).
     """
+    window = request.args.get('window', 'today')
+    if window not in SUMMARY_WINDOWS:
+        return jsonify({
+            'success': False,
+            'error': f'Janela inválida. Use: {", ".join(SUMMARY_WINDOWS)}'
+        }), 400
+    
     try:
-        # Contar transações por tipo
-        deposit_count = Transaction.query.filter_by(
-            user_id=current_user_id, 
-            type='deposit'
-        ).count()
-        
-        withdraw_count = Transaction.query.filter_by(
-            user_id=current_user_id, 
-            type='withdraw'
-        ).count()
-        
-        # Última transação
-        last_transaction = Transaction.query.filter_by(
-            user_id=current_user_id
-        ).order_by(desc(Transaction.date)).first()
-        
-        # Categorias mais usadas
-        popular_categories = db.session.query(
-            Transaction.category,
-            func.count(Transaction.id).label('count')
-        ).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.category.isnot(None)
-        ).group_by(Transaction.category).order_by(
-            desc('count')
-        ).limit(5).all()
-        
-        # Transações hoje
-        today = datetime.utcnow().date()
-        today_transactions = Transaction.query.filter(
-            Transaction.user_id == current_user_id,
-            func.date(Transaction.date) == today
-        ).count()
-        
         return jsonify({
             'success': True,
-            'data': {
-                'total_transactions': deposit_count + withdraw_count,
-                'deposit_count': deposit_count,
-                'withdraw_count': withdraw_count,
-                'today_transactions': today_transactions,
-                'last_transaction': {
-                    'id': last_transaction.id,
-                    'type': last_transaction.type,
-                    'amount': str(last_transaction.amount),
-                    'category': last_transaction.category,
-                    'date': last_transaction.date.isoformat()
-                } if last_transaction else None,
-                'popular_categories': [
-                    {'category': cat[0], 'count': cat[1]} 
-                    for cat in popular_categories
-                ]
-            }
+            'data': _transactions_summary_data(current_user_id, window)
         })
         
     except Exception as e:
@@ -454,12 +943,13 @@ def get_transactions_summary(current_user_id):
             'success': False, 
             'error': 'Erro ao carregar resumo'
         }), 500
+
 @main.route('/transactions/<int:transaction_id>', methods=['PUT'])
 @token_required
 def update_transaction(current_user_id, transaction_id):
     """
     Atualiza uma transação existente.
-    Permite editar: amount, category, description, type, date
+    Permite editar: amount, category, description, type, date, tags, meta
     """
     try:
         # Buscar a transação
@@ -492,7 +982,7 @@ def update_transaction(current_user_id, transaction_id):
                         'success': False, 
                         'error': 'Valor deve ser maior que zero'
                     }), 400
-            except (ValueError, TypeError):
+            except (ValueError, TypeError, ArithmeticError):
                 return jsonify({
                     'success': False, 
                     'error': 'Valor inválido'
@@ -504,19 +994,42 @@ def update_transaction(current_user_id, transaction_id):
                 'error': 'Tipo deve ser "deposit" ou "withdraw"'
             }), 400
         
-        if 'category' in data and not data['category'].strip():
+        if 'category' in data and (not isinstance(data['category'], str) or not data['category'].strip()):
             return jsonify({
                 'success': False, 
                 'error': 'Categoria é obrigatória'
             }), 400
         
+        attributes = validate_transaction_attributes(data.get('tags'), data.get('meta'))
+        if not attributes['is_valid']:
+            return jsonify({
+                'success': False, 
+                'error': '; '.join(attributes['errors'])
+            }), 400
+        
+        # Data validada antes de alterar a transação: nenhum erro deixa o objeto pela metade
+        if 'date' in data:
+            try:
+                # Aceitar tanto ISO string quanto datetime
+                new_date = _parse_transaction_date(data['date'])
+            except (ValueError, TypeError):
+                return jsonify({
+                    'success': False, 
+                    'error': 'Formato de data inválido'
+                }), 400
+        
         # Salvar valores originais para recalcular saldos
         old_amount = transaction.amount
         old_type = transaction.type
+        old_date = transaction.date
+        old_category = transaction.category
+        
+        ledger = get_user_ledger(current_user_id, for_update=True)
+        stats = running_stats.get_running_stats(current_user_id)
         
         # Atualizar campos da transação
         if 'amount' in data:
-            transaction.amount = Decimal(str(data['amount']))
+            transaction.amount = new_amount
         
         if 'category' in data:
             transaction.category = data['category'].strip()
@@ -524,53 +1037,52 @@ def update_transaction(current_user_id, transaction_id):
         if 'description' in data:
             transaction.description = data['description']
         
+        if 'tags' in data:
+            transaction.tags = attributes['tags']
+        
+        if 'meta' in data:
+            transaction.meta = attributes['meta']
+            for column, value in promote_meta_columns(attributes['meta']).items():
+                setattr(transaction, column, value)
+        
         if 'type' in data:
             transaction.type = data['type']
         
         if 'date' in data:
-            try:
-                # Aceitar tanto ISO string quanto datetime
-                if isinstance(data['date'], str):
-                    transaction.date = datetime.fromisoformat(data['date'].replace('Z', '+00:00'))
-                else:
-                    transaction.date = data['date']
-            except (ValueError, TypeError):
-                return jsonify({
-                    'success': False, 
-                    'error': 'Formato de data inválido'
-                }), 400
+            transaction.date = new_date
         
         transaction.updated_at = datetime.utcnow()
         
-        # Recalcular saldos se amount ou type mudaram
-        if 'amount' in data or 'type' in data:
-            # Reverter o efeito da transação original
-            if old_type == 'deposit':
-                adjusted_balance = transaction.balance_before
-            else:  # withdraw
-                adjusted_balance = transaction.balance_before
+        # Recalcular saldos se amount, type ou date mudaram
+        balance_changed = transaction.amount != old_amount or transaction.type != old_type
+        if balance_changed:
+            apply_transaction(ledger, old_type, old_amount, sign=-1)
+            apply_transaction(ledger, transaction.type, transaction.amount)
+        
+        if balance_changed or transaction.date != old_date:
+            suffix_start = min(old_date, transaction.date)
+            suffix = running_stats.read_suffix(current_user_id, suffix_start)
+            db.session.flush()
             
-            # Aplicar o novo efeito
-            if transaction.type == 'deposit':
-                transaction.balance_after = adjusted_balance + transaction.amount
-            else:  # withdraw
-                transaction.balance_after = adjusted_balance - transaction.amount
+            # Recalcula no banco o sufixo a partir da posição mais antiga (antiga ou nova)
+            recompute_running_balances(current_user_id, suffix_start, transaction.id)
+            db.session.refresh(transaction)
             
-            # Atualizar saldos de transações posteriores
-            later_transactions = Transaction.query.filter(
-                Transaction.user_id == current_user_id,
-                Transaction.date > transaction.date,
-                Transaction.id != transaction.id
-            ).order_by(Transaction.date).all()
+            # Agregados por período: remove o efeito antigo e aplica o novo
+            rollups.record_transaction(current_user_id, old_type, old_amount, old_date, sign=-1)
+            rollups.record_transaction(current_user_id, transaction.type, transaction.amount, transaction.date)
+            rollups.refresh_period_balances(current_user_id, suffix_start)
+            running_stats.apply_suffix_change(stats, current_user_id, suffix_start, suffix)
             
-            current_balance = transaction.balance_after
-            for later_tx in later_transactions:
-                later_tx.balance_before = current_balance
-                if later_tx.type == 'deposit':
-                    current_balance += later_tx.amount
-                else:
-                    current_balance -= later_tx.amount
-                later_tx.balance_after = current_balance
+            if transaction.date != old_date:
+                refresh_last_transaction(ledger)
+        
+        # Estatísticas por categoria: mesma troca quando algo que elas contam mudou
+        if balance_changed or transaction.date != old_date or transaction.category != old_category:
+            categories.record_category(current_user_id, old_category, old_type, old_amount, old_date, sign=-1)
+            categories.record_category(
+                current_user_id, transaction.category, transaction.type, transaction.amount, transaction.date
+            )
         
         db.session.commit()
         
@@ -586,6 +1098,8 @@ def update_transaction(current_user_id, transaction_id):
                 'date': transaction.date.isoformat(),
                 'balance_before': str(transaction.balance_before),
                 'balance_after': str(transaction.balance_after),
+                'tags': transaction.tags or [],
+                'meta': transaction.meta or {},
                 'updated_at': transaction.updated_at.isoformat()
             }
         })
@@ -627,28 +1141,30 @@ def delete_transaction(current_user_id, transaction_id):
         deleted_amount = transaction.amount
         deleted_type = transaction.type
         deleted_date = transaction.date
-        balance_before_deleted = transaction.balance_before
-        
-        # Atualizar saldos de transações posteriores
-        later_transactions = Transaction.query.filter(
-            Transaction.user_id == current_user_id,
-            Transaction.date > deleted_date,
-            Transaction.id != transaction_id
-        ).order_by(Transaction.date).all()
-        
-        # O novo saldo após a exclusão é o balance_before da transação excluída
-        current_balance = balance_before_deleted
-        
-        for later_tx in later_transactions:
-            later_tx.balance_before = current_balance
-            if later_tx.type == 'deposit':
-                current_balance += later_tx.amount
-            else:
-                current_balance -= later_tx.amount
-            later_tx.balance_after = current_balance
+        deleted_category = transaction.category
+        
+        # Excluir a transação e reverter seu efeito no ledger
+        ledger = get_user_ledger(current_user_id, for_update=True)
+        apply_transaction(ledger, deleted_type, deleted_amount, sign=-1)
+        stats = running_stats.get_running_stats(current_user_id)
+        suffix = running_stats.read_suffix(current_user_id, deleted_date)
         
-        # Excluir a transação
         db.session.delete(transaction)
+        db.session.add(TransactionTombstone(user_id=current_user_id, transaction_id=transaction_id))
+        db.session.flush()
+        
+        # Transações posteriores partem do saldo anterior à excluída
+        recompute_running_balances(current_user_id, deleted_date, transaction_id)
+        rollups.record_transaction(current_user_id, deleted_type, deleted_amount, deleted_date, sign=-1)
+        rollups.refresh_period_balances(current_user_id, deleted_date)
+        running_stats.apply_suffix_change(stats, current_user_id, deleted_date, suffix)
+        categories.record_category(
+            current_user_id, deleted_category, deleted_type, deleted_amount, deleted_date, sign=-1
+        )
+        
+        if ledger.last_transaction_id == transaction_id:
+            refresh_last_transaction(ledger)
+        
         db.session.commit()
         
         return jsonify({
@@ -664,6 +1180,7 @@ def delete_transaction(current_user_id, transaction_id):
         }), 500
 @main.route('/balance', methods=['GET'])
 @token_required
+@cached_per_user
 def get_balance(current_user_id):
     # CORREÇÃO: Lógica de saldo instável substituída
     current_balance = _get_user_balance(current_user_id)
@@ -678,81 +1195,76 @@ def get_balance(current_user_id):
 
 # === DASHBOARD OVERVIEW ROUTE (NOVA) ===
 
+def _dashboard_overview_data(user_id):
+    """Conteúdo de /dashboard/overview (também usado por /dashboard/bundle)"""
+    # Saldo, totais, banca inicial, perfil e última transação: uma consulta
+    context = get_financial_context(user_id)
+    current_balance = context.balance
+    initial_bank = context.initial_bank
+    
+    # Calcular métricas
+    profit_loss = context.profit_loss
+    roi_percentage = context.roi_percentage
+    
+    # Obter perfil ativo
+    profile = context.profile
+    
+    # Estatísticas de transações (totais materializados no ledger)
+    total_deposits = context.total_deposits
+    total_withdrawals = context.total_withdrawals
+    total_transactions = context.transaction_count
+    
+    # Última transação
+    last_transaction = context.last_transaction
+    
+    return {
+        # Dados financeiros principais
+        'current_balance': str(current_balance),
+        'initial_bank': str(initial_bank),
+        'profit_loss': str(profit_loss),
+        'roi_percentage': round(float(roi_percentage), 2),
+        
+        # Estatísticas de transações
+        'total_deposits': str(total_deposits),
+        'total_withdrawals': str(total_withdrawals),
+        'total_transactions': total_transactions,
+        
+        # Dados do perfil
+        'profile': {
+            'risk_level': profile.risk_level if profile else 5,
+            'stop_loss': str(profile.stop_loss) if profile else '0.00',
+            'profit_target': str(profile.profit_target) if profile else '0.00',
+            'title': profile.title if profile else 'Perfil Padrão'
+        } if profile else None,
+        
+        # Última atividade
+        'last_transaction': {
+            'type': last_transaction.type,
+            'amount': str(last_transaction.amount),
+            'category': last_transaction.category,
+            'date': last_transaction.date.isoformat()
+        } if last_transaction else None,
+        
+        # Status da conta
+        'account_status': {
+            'is_profitable': profit_loss > 0,
+            'days_since_creation': (datetime.utcnow() - profile.created_at).days if profile else 0,
+            'has_initial_bank': initial_bank > 0
+        }
+    }
+
 @main.route('/dashboard/overview', methods=['GET'])
 @token_required
+@cached_per_user
 def get_dashboard_overview(current_user_id):
     """
     Endpoint específico para fornecer dados completos do dashboard,
     incluindo a banca inicial definida no cadastro.
     """
     try:
-        # Obter dados básicos
-        current_balance = _get_user_balance(current_user_id)
-        initial_bank = _get_user_initial_bank(current_user_id)
-        
-        # Calcular métricas
-        profit_loss = current_balance - initial_bank
-        roi_percentage = ((current_balance - initial_bank) / initial_bank * 100) if initial_bank > 0 else 0
-        
-        # Obter perfil ativo
-        profile = BettingProfile.query.filter_by(user_id=current_user_id, is_active=True).first()
-        
-        # Estatísticas de transações
-        total_deposits = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == 'deposit'
-        ).scalar() or Decimal('0.00')
-        
-        total_withdrawals = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == 'withdraw'
-        ).scalar() or Decimal('0.00')
-        
-        # Contar transações
-        total_transactions = Transaction.query.filter_by(user_id=current_user_id).count()
-        
-        # Última transação
-        last_transaction = Transaction.query.filter_by(
-            user_id=current_user_id
-        ).order_by(desc(Transaction.date)).first()
-        
         return jsonify({
             'success': True,
-            'data': {
-                # Dados financeiros principais
-                'current_balance': str(current_balance),
-                'initial_bank': str(initial_bank),
-                'profit_loss': str(profit_loss),
-                'roi_percentage': round(float(roi_percentage), 2),
-                
-                # Estatísticas de transações
-                'total_deposits': str(total_deposits),
-                'total_withdrawals': str(total_withdrawals),
-                'total_transactions': total_transactions,
-                
-                # Dados do perfil
-                'profile': {
-                    'risk_level': profile.risk_level if profile else 5,
-                    'stop_loss': str(profile.stop_loss) if profile else '0.00',
-                    'profit_target': str(profile.profit_target) if profile else '0.00',
-                    'title': profile.title if profile else 'Perfil Padrão'
-                } if profile else None,
-                
-                # Última atividade
-                'last_transaction': {
-                    'type': last_transaction.type,
-                    'amount': str(last_transaction.amount),
-                    'category': last_transaction.category,
-                    'date': last_transaction.date.isoformat()
-                } if last_transaction else None,
-                
-                # Status da conta
-                'account_status': {
-                    'is_profitable': profit_loss > 0,
-                    'days_since_creation': (datetime.utcnow() - profile.created_at).days if profile else 0,
-                    'has_initial_bank': initial_bank > 0
-                }
-            }
+            'data': _dashboard_overview_data(current_user_id)
         })
         
     except Exception as e:
@@ -761,6 +1273,70 @@ def get_dashboard_overview(current_user_id):
             'error': 'Erro ao carregar dados do dashboard'
         }), 500
 
+# === DASHBOARD BUNDLE ===
+
+# Seções disponíveis em /dashboard/bundle (mesmo conteúdo das rotas individuais)
+BUNDLE_SECTIONS = ('overview', 'analytics', 'monthly', 'performance', 'risk', 'objectives', 'categories')
+
+@main.route('/dashboard/bundle', methods=['GET'])
+@token_required
+@cached_per_user
+def get_dashboard_bundle(current_user_id):
+    """
+    Retorna em uma única resposta as seções carregadas na abertura do app
+    (?sections=overview,risk,... ; padrão: todas). Aceita também ?months=
+    (monthly) e ?period= (performance). As seções compartilham o contexto
+    financeiro da requisição, então saldo, banca inicial e perfil são lidos
+    uma única vez.
+    """
+    requested = request.args.get('sections')
+    if requested:
+        sections = [section.strip() for section in requested.split(',') if section.strip()]
+    else:
+        sections = list(BUNDLE_SECTIONS)
+
+    unknown = [section for section in sections if section not in BUNDLE_SECTIONS]
+    if unknown:
+        return jsonify({
+            'success': False,
+            'error': f'Seções inválidas: {", ".join(unknown)}',
+            'available_sections': list(BUNDLE_SECTIONS)
+        }), 400
+
+    builders = {
+        'overview': lambda: _dashboard_overview_data(current_user_id),
+        'analytics': lambda: _analytics_overview_data(current_user_id),
+        'monthly': lambda: _monthly_analytics_data(current_user_id, request.args.get('months', 6, type=int)),
+        'performance': lambda: _performance_stats_data(current_user_id, request.args.get('period', 'monthly')),
+        'risk': lambda: _risk_analysis_data(current_user_id),
+        'objectives': lambda: _objectives_data(current_user_id),
+        'categories': lambda: _categories_data(current_user_id),
+    }
+
+    try:
+        data = {}
+        errors = {}
+        for section in dict.fromkeys(sections):
+            data[section] = builders[section]()
+            if section == 'risk' and data[section] is None:
+                errors[section] = 'No betting profile found'
+
+        response = {
+            'success': True,
+            'data': data
+        }
+        if errors:
+            response['errors'] = errors
+
+        return jsonify(response)
+
+    except Exception as e:
+        current_app.logger.error(f'Dashboard bundle failed for user {current_user_id}: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Erro ao carregar dados do dashboard'
+        }), 500
+
 # === OBJECTIVES ROUTES ===
 
 @main.route('/objectives', methods=['POST'])
@@ -796,27 +1372,31 @@ def create_objective(current_user_id):
         }
     }), 201
 
+def _objectives_data(user_id):
+    objectives = Objective.query.filter_by(user_id=user_id).all()
+
+    return [{
+        'id': obj.id,
+        'title': obj.title,
+        'description': obj.description,
+        'target_amount': str(obj.target_amount),
+        'current_amount': str(obj.current_amount),
+        'target_date': obj.target_date.isoformat() if obj.target_date else None,
+        'priority': obj.priority,
+        'status': obj.status,
+        'category': obj.category,
+        'color': obj.color,
+        'icon_name': obj.icon_name,
+        'created_at': obj.created_at.isoformat()
+    } for obj in objectives]
+
 @main.route('/objectives', methods=['GET'])
 @token_required
+@cached_per_user
 def get_objectives(current_user_id):
-    objectives = Objective.query.filter_by(user_id=current_user_id).all()
-    
     return jsonify({
         'success': True,
-        'data': [{
-            'id': obj.id,
-            'title': obj.title,
-            'description': obj.description,
-            'target_amount': str(obj.target_amount),
-            'current_amount': str(obj.current_amount),
-            'target_date': obj.target_date.isoformat() if obj.target_date else None,
-            'priority': obj.priority,
-            'status': obj.status,
-            'category': obj.category,
-            'color': obj.color,
-            'icon_name': obj.icon_name,
-            'created_at': obj.created_at.isoformat()
-        } for obj in objectives]
+        'data': _objectives_data(current_user_id)
     })
 @main.route('/objectives/<int:objective_id>', methods=['PUT'])
 @token_required
@@ -876,82 +1456,233 @@ def delete_objective(current_user_id, objective_id):
 
 # === ANALYTICS ROUTES ===
 
-@main.route('/analytics/overview', methods=['GET'])
-@token_required
-def get_analytics_overview(current_user_id):
+def _analytics_overview_data(user_id):
     # CORREÇÃO: Lógica de saldo instável substituída + inclusão da banca inicial
-    current_balance = _get_user_balance(current_user_id)
-    initial_bank = _get_user_initial_bank(current_user_id)
+    context = get_financial_context(user_id)
+    current_balance = context.balance
+    initial_bank = context.initial_bank
     
-    profile = BettingProfile.query.filter_by(user_id=current_user_id, is_active=True).first()
+    profile = context.profile
     
-    total_deposits = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user_id,
-        Transaction.type == 'deposit'
-    ).scalar() or Decimal('0.00')
-    
-    total_withdrawals = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user_id,
-        Transaction.type == 'withdraw'
-    ).scalar() or Decimal('0.00')
+    total_deposits = context.total_deposits
+    total_withdrawals = context.total_withdrawals
     
     # Usar a banca inicial real do usuário
     real_profit = current_balance - initial_bank
     roi = ((current_balance - initial_bank) / initial_bank * 100) if initial_bank > 0 else 0
     
+    return {
+        'current_balance': str(current_balance),
+        'initial_balance': str(initial_bank),  # Agora usa a banca real do cadastro
+        'total_deposits': str(total_deposits),
+        'total_withdrawals': str(total_withdrawals),
+        'real_profit': str(real_profit),
+        'roi_percentage': round(float(roi), 2),
+        'stop_loss': str(profile.stop_loss) if profile else '0.00',
+        'profit_target': str(profile.profit_target) if profile else '0.00',
+        'risk_level': profile.risk_level if profile else 5
+    }
+
+@main.route('/analytics/overview', methods=['GET'])
+@token_required
+@cached_per_user
+def get_analytics_overview(current_user_id):
     return jsonify({
         'success': True,
-        'data': {
-            'current_balance': str(current_balance),
-            'initial_balance': str(initial_bank),  # Agora usa a banca real do cadastro
-            'total_deposits': str(total_deposits),
-            'total_withdrawals': str(total_withdrawals),
-            'real_profit': str(real_profit),
-            'roi_percentage': round(float(roi), 2),
-            'stop_loss': str(profile.stop_loss) if profile else '0.00',
-            'profit_target': str(profile.profit_target) if profile else '0.00',
-            'risk_level': profile.risk_level if profile else 5
-        }
+        'data': _analytics_overview_data(current_user_id)
     })
 
+def _monthly_analytics_data(user_id, months=6):
+    start_date = datetime.utcnow() - timedelta(days=months * 30)
+    
+    # Lê os agregados mensais (um registro por mês) em vez das transações
+    monthly_rows = rollups.get_period_rows(user_id, 'monthly', start_date)
+    
+    result = []
+    for row in monthly_rows:
+        deposits = float(row.total_deposits or 0)
+        withdraws = float(row.total_withdrawals or 0)
+        if not deposits and not withdraws:
+            continue
+        
+        result.append({
+            'month': row.period_date.strftime('%Y-%m'),
+            'deposits': deposits,
+            'withdraws': withdraws,
+            'balance': deposits - withdraws
+        })
+    
+    return result
+
 @main.route('/analytics/monthly', methods=['GET'])
 @token_required
+@cached_per_user
 def get_monthly_analytics(current_user_id):
     months = request.args.get('months', 6, type=int)
     
-    start_date = datetime.utcnow() - timedelta(days=months * 30)
+    return jsonify({
+        'success': True,
+        'data': _monthly_analytics_data(current_user_id, months)
+    })
+
+def _game_analytics_data(user_id, start_date=None, end_date=None):
+    """
+    Resultados por tipo de jogo em duas agregações agrupadas: transações
+    (idx_user_game_date, que no PostgreSQL inclui type e amount para um
+    index-only scan) e sessões encerradas (idx_session_user_game). Datas
+    opcionais em intervalo semiaberto [start_date, end_date).
+    
+    Nas transações de um jogo, saques são o valor apostado e depósitos o
+    retorno; a vantagem da casa realizada é a perda sobre o apostado,
+    comparada com o house_edge de GAME_CONFIGURATIONS.
+    """
+    is_deposit = Transaction.type == 'deposit'
+    tx_query = db.session.query(
+        Transaction.game_type,
+        func.count(Transaction.id).label('transactions'),
+        func.coalesce(func.sum(case((is_deposit, Transaction.amount), else_=0)), 0).label('deposits'),
+        func.coalesce(func.sum(case((is_deposit, 0), else_=Transaction.amount)), 0).label('withdrawals')
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.game_type.isnot(None)
+    )
     
-    monthly_data = db.session.query(
-        extract('year', Transaction.date).label('year'),
-        extract('month', Transaction.date).label('month'),
-        Transaction.type,
-        func.sum(Transaction.amount).label('total')
+    session_query = db.session.query(
+        BettingSession.game_type,
+        func.count(BettingSession.id).label('sessions'),
+        func.coalesce(func.sum(case((BettingSession.net_result > 0, 1), else_=0)), 0).label('winning_sessions'),
+        func.coalesce(func.sum(BettingSession.net_result), 0).label('net_result')
     ).filter(
-        Transaction.user_id == current_user_id,
-        Transaction.date >= start_date
-    ).group_by(
-        extract('year', Transaction.date),
-        extract('month', Transaction.date),
-        Transaction.type
-    ).all()
-    
-    result = {}
-    for year, month, tx_type, total in monthly_data:
-        key = f"{int(year)}-{int(month):02d}"
-        if key not in result:
-            result[key] = {'deposits': 0, 'withdraws': 0, 'month': key}
-        
-        if tx_type == 'deposit':
-            result[key]['deposits'] = float(total)
-        else:
-            result[key]['withdraws'] = float(total)
+        BettingSession.user_id == user_id,
+        BettingSession.status == 'completed'
+    )
+    
+    if start_date:
+        tx_query = tx_query.filter(Transaction.date >= start_date)
+        session_query = session_query.filter(BettingSession.started_at >= start_date)
+    if end_date:
+        tx_query = tx_query.filter(Transaction.date < end_date)
+        session_query = session_query.filter(BettingSession.started_at < end_date)
+    
+    transactions = {row.game_type: row for row in tx_query.group_by(Transaction.game_type)}
+    sessions = {row.game_type: row for row in session_query.group_by(BettingSession.game_type)}
+    
+    games = []
+    for game_type in sorted(set(transactions) | set(sessions)):
+        tx, session = transactions.get(game_type), sessions.get(game_type)
+        config = GAME_CONFIGURATIONS.get(game_type, {})
+        
+        deposits = Decimal(str(tx.deposits)) if tx else Decimal('0.00')
+        wagered = Decimal(str(tx.withdrawals)) if tx else Decimal('0.00')
+        net_result = deposits - wagered
+        session_count = session.sessions if session else 0
+        
+        realized_edge = float(-net_result / wagered * 100) if wagered > 0 else None
+        house_edge = config.get('house_edge')
+        
+        games.append({
+            'game_type': game_type,
+            'name': config.get('name', game_type),
+            'icon': config.get('icon'),
+            'transactions': tx.transactions if tx else 0,
+            'volume': str((deposits + wagered).quantize(Decimal('0.01'))),
+            'wagered': str(wagered.quantize(Decimal('0.01'))),
+            'returned': str(deposits.quantize(Decimal('0.01'))),
+            'net_result': str(net_result.quantize(Decimal('0.01'))),
+            'sessions': session_count,
+            'sessions_net_result': str(Decimal(str(session.net_result)).quantize(Decimal('0.01'))) if session else '0.00',
+            'win_rate': round(int(session.winning_sessions) / session_count * 100, 2) if session_count else 0,
+            'house_edge': house_edge,
+            'realized_edge': round(realized_edge, 2) if realized_edge is not None else None,
+            'edge_difference': (
+                round(realized_edge - house_edge, 2)
+                if realized_edge is not None and house_edge is not None else None
+            )
+        })
+    
+    # Jogos com maior volume primeiro
+    games.sort(key=lambda game: Decimal(game['volume']), reverse=True)
+    return games
+
+@main.route('/analytics/games', methods=['GET'])
+@token_required
+@cached_per_user
+def get_game_analytics(current_user_id):
+    """
+    Resultado, volume, sessões, taxa de vitória e vantagem da casa realizada
+    por tipo de jogo (?start_date, end_date opcionais).
+    """
+    try:
+        start_date = _parse_transaction_date(request.args['start_date']) if request.args.get('start_date') else None
+        end_date = _parse_transaction_date(request.args['end_date']) if request.args.get('end_date') else None
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'error': 'Formato de data inválido'}), 400
+    
+    return jsonify({
+        'success': True,
+        'data': _game_analytics_data(current_user_id, start_date, end_date)
+    })
+
+# Pontos da curva de saldo por padrão e no máximo (?max_points=)
+EQUITY_CURVE_DEFAULT_POINTS = 300
+EQUITY_CURVE_MAX_POINTS = 5000
+
+def _equity_curve_data(user_id, start_date=None, end_date=None, max_points=EQUITY_CURVE_DEFAULT_POINTS):
+    """
+    Curva de saldo a partir de balance_after, em ordem (date, id), lida pelo
+    idx_user_date apenas com as colunas necessárias. Séries maiores que
+    max_points são reduzidas com LTTB, que mantém picos e vales visíveis.
+    """
+    query = db.session.query(
+        Transaction.date, Transaction.balance_before, Transaction.balance_after
+    ).filter(Transaction.user_id == user_id)
+    if start_date:
+        query = query.filter(Transaction.date >= start_date)
+    if end_date:
+        query = query.filter(Transaction.date < end_date)
+    
+    rows = query.order_by(Transaction.date, Transaction.id).all()
+    if not rows:
+        return {
+            'starting_balance': None,
+            'ending_balance': None,
+            'total_points': 0,
+            'downsampled': False,
+            'points': []
+        }
+    
+    epoch = datetime(1970, 1, 1)
+    xs = [(row.date - epoch).total_seconds() for row in rows]
+    ys = [float(row.balance_after) for row in rows]
+    selected = downsample_lttb(xs, ys, max_points)
+    
+    return {
+        'starting_balance': str(rows[0].balance_before),
+        'ending_balance': str(rows[-1].balance_after),
+        'total_points': len(rows),
+        'downsampled': len(selected) < len(rows),
+        'points': [{'date': rows[i].date.isoformat(), 'balance': ys[i]} for i in selected]
+    }
+
+@main.route('/analytics/equity-curve', methods=['GET'])
+@token_required
+@cached_per_user
+def get_equity_curve(current_user_id):
+    """
+    Saldo ao longo do tempo para gráficos (?start_date, end_date, max_points).
+    """
+    try:
+        start_date = _parse_transaction_date(request.args['start_date']) if request.args.get('start_date') else None
+        end_date = _parse_transaction_date(request.args['end_date']) if request.args.get('end_date') else None
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'error': 'Formato de data inválido'}), 400
     
-    for data in result.values():
-        data['balance'] = data['deposits'] - data['withdraws']
+    max_points = request.args.get('max_points', EQUITY_CURVE_DEFAULT_POINTS, type=int)
+    max_points = max(3, min(max_points, EQUITY_CURVE_MAX_POINTS))
     
     return jsonify({
         'success': True,
-        'data': list(result.values())
+        'data': _equity_curve_data(current_user_id, start_date, end_date, max_points)
     })
 
 # === BETTING SESSION ROUTES ===
@@ -996,6 +1727,7 @@ def end_betting_session(current_user_id, session_id):
     
     # CORREÇÃO: Lógica de saldo instável substituída
     current_balance = _get_user_balance(current_user_id)
+    stats = running_stats.get_running_stats(current_user_id)
     
     session.end_balance = current_balance
     session.ended_at = datetime.utcnow()
@@ -1003,6 +1735,9 @@ def end_betting_session(current_user_id, session_id):
     session.net_result = current_balance - session.start_balance
     session.status = 'completed'
     
+    rollups.record_session(session, current_balance)
+    running_stats.record_session_result(stats, session.net_result)
+    
     db.session.commit()
     
     return jsonify({
@@ -1018,11 +1753,7 @@ def end_betting_session(current_user_id, session_id):
 
 # === STATISTICS ROUTES ===
 
-@main.route('/stats/performance', methods=['GET'])
-@token_required
-def get_performance_stats(current_user_id):
-    period = request.args.get('period', 'monthly')
-    
+def _performance_stats_data(user_id, period='monthly'):
     now = datetime.utcnow()
     if period == 'daily':
         start_date = now - timedelta(days=30)
@@ -1033,59 +1764,70 @@ def get_performance_stats(current_user_id):
     else:
         start_date = now - timedelta(days=365 * 3)
     
-    profile = BettingProfile.query.filter_by(user_id=current_user_id, is_active=True).first()
+    # Granularidade dos agregados usada para cada janela
+    period_type = {'daily': 'daily', 'weekly': 'weekly', 'monthly': 'monthly'}.get(period, 'yearly')
+    
+    profile = get_financial_context(user_id).profile
     
     stats = db.session.query(
-        func.count(BettingSession.id).label('total_sessions'),
-        func.sum(BettingSession.net_result).label('total_profit'),
-        func.avg(BettingSession.net_result).label('avg_session_result'),
-        func.max(BettingSession.net_result).label('best_session'),
-        func.min(BettingSession.net_result).label('worst_session')
+        func.sum(BettingStats.total_sessions).label('total_sessions'),
+        func.sum(BettingStats.winning_sessions).label('winning_sessions'),
+        func.sum(BettingStats.sessions_net_result).label('total_profit'),
+        func.max(BettingStats.best_session_result).label('best_session'),
+        func.min(BettingStats.worst_session_result).label('worst_session')
     ).filter(
-        BettingSession.user_id == current_user_id,
-        BettingSession.started_at >= start_date,
-        BettingSession.status == 'completed'
+        BettingStats.user_id == user_id,
+        BettingStats.period_type == period_type,
+        BettingStats.period_date >= rollups.period_start(period_type, start_date)
     ).first()
     
-    winning_sessions = db.session.query(func.count(BettingSession.id)).filter(
-        BettingSession.user_id == current_user_id,
-        BettingSession.started_at >= start_date,
-        BettingSession.net_result > 0,
-        BettingSession.status == 'completed'
-    ).scalar() or 0
-    
-    total_sessions = stats.total_sessions or 0
+    total_sessions = int(stats.total_sessions or 0)
+    winning_sessions = int(stats.winning_sessions or 0)
     win_rate = (winning_sessions / total_sessions * 100) if total_sessions > 0 else 0
+    avg_session_result = (
+        (Decimal(str(stats.total_profit)) / total_sessions).quantize(Decimal('0.01'))
+        if total_sessions > 0 and stats.total_profit is not None else None
+    )
     
-    initial_bank = _get_user_initial_bank(current_user_id)
+    initial_bank = _get_user_initial_bank(user_id)
+    
+    return {
+        'period': period,
+        'total_sessions': total_sessions,
+        'winning_sessions': winning_sessions,
+        'win_rate': round(win_rate, 2),
+        'total_profit': str(stats.total_profit or Decimal('0.00')),
+        'avg_session_result': str(avg_session_result or Decimal('0.00')),
+        'best_session': str(stats.best_session or Decimal('0.00')),
+        'worst_session': str(stats.worst_session or Decimal('0.00')),
+        'initial_balance': str(initial_bank),  # Agora usa a banca real do cadastro
+        'current_stop_loss': str(profile.stop_loss) if profile else '0.00',
+        'current_profit_target': str(profile.profit_target) if profile else '0.00',
+        # Acumuladores de todo o histórico (user_running_stats), sem varrer transações
+        'running': running_stats.summarize(running_stats.get_running_stats(user_id, commit=True))
+    }
+
+@main.route('/stats/performance', methods=['GET'])
+@token_required
+@cached_per_user
+def get_performance_stats(current_user_id):
+    period = request.args.get('period', 'monthly')
     
     return jsonify({
         'success': True,
-        'data': {
-            'period': period,
-            'total_sessions': total_sessions,
-            'winning_sessions': winning_sessions,
-            'win_rate': round(win_rate, 2),
-            'total_profit': str(stats.total_profit or Decimal('0.00')),
-            'avg_session_result': str(stats.avg_session_result or Decimal('0.00')),
-            'best_session': str(stats.best_session or Decimal('0.00')),
-            'worst_session': str(stats.worst_session or Decimal('0.00')),
-            'initial_balance': str(initial_bank),  # Agora usa a banca real do cadastro
-            'current_stop_loss': str(profile.stop_loss) if profile else '0.00',
-            'current_profit_target': str(profile.profit_target) if profile else '0.00'
-        }
+        'data': _performance_stats_data(current_user_id, period)
     })
 
-@main.route('/stats/risk-analysis', methods=['GET'])
-@token_required
-def get_risk_analysis(current_user_id):
-    profile = BettingProfile.query.filter_by(user_id=current_user_id, is_active=True).first()
+def _risk_analysis_data(user_id):
+    """Conteúdo de /stats/risk-analysis; None se o usuário não tiver perfil ativo"""
+    context = get_financial_context(user_id)
+    profile = context.profile
     
-    current_balance = _get_user_balance(current_user_id)
-    initial_bank = _get_user_initial_bank(current_user_id)  # Usar banca real do cadastro
+    current_balance = context.balance
+    initial_bank = context.initial_bank  # Usar banca real do cadastro
     
     if not profile:
-        return jsonify({'error': 'No betting profile found'}), 404
+        return None
     
     stop_loss = profile.stop_loss
     profit_target = profile.profit_target
@@ -1100,45 +1842,204 @@ def get_risk_analysis(current_user_id):
     risk_status = 'safe'
     if stop_loss > 0 and current_balance <= stop_loss:
         risk_status = 'stop_loss_hit'
-    elif stop_loss > 0 and stop_loss_distance and stop_loss_distance < (initial_bank * 0.1):
+    elif stop_loss > 0 and stop_loss_distance and stop_loss_distance < (initial_bank * Decimal('0.1')):
         risk_status = 'high_risk'
     elif profit_target > 0 and current_balance >= target_balance:
         risk_status = 'target_achieved'
     
-    max_balance = db.session.query(func.max(Transaction.balance_after)).filter(
-        Transaction.user_id == current_user_id
-    ).scalar() or initial_bank
+    # Curva de saldo inteira em uma passada, em cache por versão dos dados
+    drawdown_report = get_drawdown_report(user_id)
+    max_balance = Decimal(drawdown_report['peak_balance']) if drawdown_report['peak_balance'] else initial_bank
     
     current_drawdown = max_balance - current_balance
     drawdown_percentage = (current_drawdown / max_balance * 100) if max_balance > 0 else 0
     
+    return {
+        'current_balance': str(current_balance),
+        'initial_balance': str(initial_bank),  # Agora usa a banca real do cadastro
+        'risk_level': profile.risk_level,
+        'risk_status': risk_status,
+        'stop_loss': {
+            'value': str(stop_loss),
+            'distance': str(stop_loss_distance) if stop_loss_distance else None,
+            'percentage': round(stop_loss_percentage, 2) if stop_loss_percentage else None,
+            'is_active': stop_loss > 0
+        },
+        'profit_target': {
+            'value': str(target_balance),
+            'distance': str(profit_target_distance) if profit_target_distance else None,
+            'percentage': round(profit_target_percentage, 2) if profit_target_percentage else None,
+            'is_active': profit_target > 0
+        },
+        'drawdown': {
+            'current': str(current_drawdown),
+            'percentage': round(drawdown_percentage, 2),
+            'max_balance': str(max_balance),
+            'peak_date': drawdown_report['peak_date'],
+            'duration_days': drawdown_report['current']['duration_days'],
+            'max': drawdown_report['max'],
+            'longest_underwater_days': drawdown_report['longest_underwater_days']
+        },
+        'running': running_stats.summarize(running_stats.get_running_stats(user_id, commit=True))
+    }
+
+@main.route('/stats/risk-analysis', methods=['GET'])
+@token_required
+@cached_per_user
+def get_risk_analysis(current_user_id):
+    data = _risk_analysis_data(current_user_id)
+    
+    if data is None:
+        return jsonify({'error': 'No betting profile found'}), 404
+    
     return jsonify({
         'success': True,
-        'data': {
-            'current_balance': str(current_balance),
-            'initial_balance': str(initial_bank),  # Agora usa a banca real do cadastro
-            'risk_level': profile.risk_level,
-            'risk_status': risk_status,
-            'stop_loss': {
-                'value': str(stop_loss),
-                'distance': str(stop_loss_distance) if stop_loss_distance else None,
-                'percentage': round(stop_loss_percentage, 2) if stop_loss_percentage else None,
-                'is_active': stop_loss > 0
-            },
-            'profit_target': {
-                'value': str(target_balance),
-                'distance': str(profit_target_distance) if profit_target_distance else None,
-                'percentage': round(profit_target_percentage, 2) if profit_target_percentage else None,
-                'is_active': profit_target > 0
-            },
-            'drawdown': {
-                'current': str(current_drawdown),
-                'percentage': round(drawdown_percentage, 2),
-                'max_balance': str(max_balance)
-            }
-        }
+        'data': data
+    })
+
+@main.route('/stats/risk-of-ruin', methods=['GET'])
+@token_required
+@cached_per_user
+def get_risk_of_ruin(current_user_id):
+    """
+    Probabilidade de atingir o stop loss antes da meta de lucro, por simulação
+    de Monte Carlo a partir do saldo atual e do perfil ativo.
+    ?game_type (padrão roulette), bet_fraction, paths, rounds, seed (padrão 0;
+    a mesma semente dá o mesmo resultado).
+    """
+    context = get_financial_context(current_user_id)
+    profile = context.profile
+    
+    if not profile:
+        return jsonify({'error': 'No betting profile found'}), 404
+    
+    config = current_app.config
+    game_type = request.args.get('game_type', 'roulette')
+    if game_type not in GAME_CONFIGURATIONS:
+        return jsonify({'success': False, 'error': 'Tipo de jogo inválido'}), 400
+    
+    paths = request.args.get('paths', config.get('SIMULATION_DEFAULT_PATHS', 10000), type=int)
+    rounds = request.args.get('rounds', config.get('SIMULATION_DEFAULT_ROUNDS', 500), type=int)
+    paths = max(100, min(paths, config.get('SIMULATION_MAX_PATHS', 100000)))
+    rounds = max(1, min(rounds, config.get('SIMULATION_MAX_ROUNDS', 2000)))
+    
+    seed = request.args.get('seed', 0, type=int)
+    if seed < 0:
+        return jsonify({'success': False, 'error': 'A semente deve ser um inteiro não negativo'}), 400
+    
+    if context.balance <= 0:
+        return jsonify({'success': False, 'error': 'Saldo insuficiente para simular'}), 400
+    
+    profit_target = profile.profit_target or Decimal('0')
+    try:
+        data = simulate_risk_of_ruin(
+            start_balance=float(context.balance),
+            stop_loss=float(profile.stop_loss or 0),
+            profit_target=float(context.initial_bank + profit_target) if profit_target > 0 else None,
+            game_type=game_type,
+            bet_fraction=request.args.get('bet_fraction', type=float),
+            paths=paths,
+            rounds=rounds,
+            seed=seed,
+            workers=config.get('SIMULATION_WORKERS', 1),
+            parallel_threshold=config.get('SIMULATION_PARALLEL_THRESHOLD', 20000),
+            time_budget=config.get('SIMULATION_TIME_BUDGET_SECONDS')
+        )
+    except SimulationTimeout:
+        return jsonify({
+            'success': False,
+            'error': 'Simulação excedeu o tempo limite; reduza rounds ou paths'
+        }), 503
+    
+    return jsonify({
+        'success': True,
+        'data': data
     })
 
+# === BATCH ROUTE ===
+
+@main.route('/batch', methods=['POST'])
+@token_required
+def run_batch(current_user_id):
+    """
+    Executa várias requisições da API em uma só ida e volta.
+    Corpo: {"requests": [{"id": "...", "method": "GET", "path": "/balance", "body": {...}}]}
+    O token é validado uma vez; cada sub-requisição passa pelas mesmas rotas
+    (hooks, cache e validações), em ordem, na mesma sessão do banco, dentro
+    de um savepoint desfeito quando ela falha (status >= 400 ou exceção).
+    """
+    data = request.get_json(silent=True) or {}
+    sub_requests = data.get('requests')
+    
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({'success': False, 'error': 'Informe a lista "requests"'}), 400
+    
+    max_requests = current_app.config.get('MAX_BATCH_REQUESTS', 20)
+    if len(sub_requests) > max_requests:
+        return jsonify({'success': False, 'error': f'Máximo de {max_requests} requisições por lote'}), 400
+    
+    responses = []
+    g.batch_user_id = current_user_id
+    try:
+        for index, sub_request in enumerate(sub_requests):
+            responses.append(_run_batch_item(index, sub_request))
+    finally:
+        g.pop('batch_user_id', None)
+    
+    return jsonify({
+        'success': True,
+        'responses': responses
+    })
+
+def _run_batch_item(index, sub_request):
+    """Despacha uma sub-requisição do /batch pelas rotas do blueprint"""
+    if not isinstance(sub_request, dict):
+        return {'id': index, 'status': 400, 'body': {'error': 'Requisição inválida'}}
+    
+    item_id = sub_request.get('id', index)
+    method = str(sub_request.get('method', 'GET')).upper()
+    path = sub_request.get('path')
+    
+    if not isinstance(path, str) or not path.startswith('/'):
+        return {'id': item_id, 'status': 400, 'body': {'error': 'Caminho inválido'}}
+    
+    builder = EnvironBuilder(
+        path=path,
+        method=method,
+        base_url=request.host_url,
+        json=sub_request.get('body') if method in WRITE_METHODS else None,
+        headers=sub_request.get('headers') or {},
+    )
+    
+    with current_app.request_context(builder.get_environ()):
+        if request.endpoint is None or not request.endpoint.startswith('main.') or request.endpoint == 'main.run_batch':
+            return {'id': item_id, 'status': 404, 'body': {'error': 'Rota não encontrada'}}
+        
+        # Savepoint por sub-requisição: o que uma sub-requisição com erro deixou
+        # na sessão (alterado, mas sem commit) não vaza para as seguintes
+        savepoint = db.session.begin_nested()
+        try:
+            response = current_app.full_dispatch_request()
+        except Exception as e:
+            if savepoint.is_active:
+                savepoint.rollback()
+            current_app.logger.error(f'Batch item {item_id} ({method} {path}) failed: {str(e)}')
+            return {'id': item_id, 'status': 500, 'body': {'error': 'Internal server error'}}
+        
+        # Rotas que confirmam fazem commit da transação inteira, encerrando o savepoint
+        if savepoint.is_active:
+            if response.status_code >= 400:
+                savepoint.rollback()
+            else:
+                savepoint.commit()
+    
+    body = response.get_json(silent=True)
+    return {
+        'id': item_id,
+        'status': response.status_code,
+        'body': body if body is not None else response.get_data(as_text=True)
+    }
+
 # === ERROR HANDLERS ===
 
 @main.errorhandler(400)
@@ -1172,17 +2073,66 @@ def health_check():
         'version': '1.0.0'
     })
 
+def _categories_data(user_id):
+    return categories.get_category_names(user_id)
+
 @main.route('/categories', methods=['GET'])
 @token_required
+@cached_per_user
 def get_categories(current_user_id):
-    categories = db.session.query(Transaction.category).filter(
-        Transaction.user_id == current_user_id,
-        Transaction.category.isnot(None)
-    ).distinct().all()
+    return jsonify({
+        'success': True,
+        'data': _categories_data(current_user_id)
+    })
+
+def _category_breakdown_data(user_id):
+    """
+    Totais por categoria lidos de category_stats. `withdraws` segue o formato
+    usado pelos gráficos de pizza do app; `percentage` é a fatia da categoria
+    no total de saques.
+    """
+    rows = categories.get_category_breakdown(user_id)
+    total_withdrawals = sum((row.total_withdrawals for row in rows), Decimal('0.00'))
+    
+    return [{
+        'category': row.category,
+        'transaction_count': row.transaction_count,
+        'deposits': float(row.total_deposits),
+        'withdraws': float(row.total_withdrawals),
+        'net': float(row.total_deposits - row.total_withdrawals),
+        'last_used_at': row.last_used_at.isoformat() if row.last_used_at else None,
+        'percentage': round(float(row.total_withdrawals / total_withdrawals * 100), 2) if total_withdrawals > 0 else 0
+    } for row in rows]
+
+@main.route('/categories/breakdown', methods=['GET'])
+@token_required
+@cached_per_user
+def get_category_breakdown(current_user_id):
+    return jsonify({
+        'success': True,
+        'data': _category_breakdown_data(current_user_id)
+    })
+
+@main.route('/categories/suggest', methods=['GET'])
+@token_required
+def suggest_categories(current_user_id):
+    """
+    Sugestões de categoria enquanto o usuário digita (?q=prefixo, ?limit=).
+    Ordenadas por frequência e recência de uso; o prefixo casa com o início
+    do nome ou de qualquer palavra, sem diferenciar acentos e maiúsculas.
+    """
+    limit = request.args.get('limit', type=int) or current_app.config.get('CATEGORY_SUGGEST_LIMIT', 8)
+    limit = max(1, min(limit, categories.SUGGEST_MAX_RESULTS))
+    
+    version, _ = get_data_version(current_user_id)
+    suggestions = categories.suggest_categories(
+        current_user_id, request.args.get('q', ''), version, limit,
+        max_users=current_app.config.get('CATEGORY_INDEX_MAX_USERS', 1024)
+    )
     
     return jsonify({
         'success': True,
-        'data': [cat[0] for cat in categories if cat[0]]
+        'data': suggestions
     })
 
 @main.route('/game-types', methods=['GET'])
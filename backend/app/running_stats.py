@@ -0,0 +1,362 @@
+# running_stats.py
+"""
+Estatísticas acumuladas por usuário (tabela user_running_stats).
+
+Cada transação nova no fim do histórico e cada sessão encerrada atualizam
+os acumuladores em O(1): média e variância (Welford) dos retornos das
+transações de jogo e dos resultados de sessão, pico do saldo, drawdown
+máximo e sequências de vitórias/derrotas. Depósitos e saques de caixa (sem
+jogo nem sessão) movem o saldo mas não contam como retorno.
+
+Escritas que mudam o meio do histórico (retroativas, edições, exclusões)
+atualizam só o sufixo afetado (apply_suffix_change): os retornos antigos
+saem do Welford e os novos entram, e pico/drawdown são refeitos a partir do
+estado antes do sufixo. As rotas de estatísticas leem uma linha em vez de
+varrer o histórico.
+"""
+
+import math
+from decimal import Decimal
+from types import SimpleNamespace
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import UserRunningStats, Transaction, BettingSession, User
+
+ZERO = Decimal('0.00')
+
+
+def get_running_stats(user_id, commit=False):
+    """
+    Linha de estatísticas do usuário, reconstruída a partir do histórico se
+    ainda não existir. Chame antes de gravar a transação/sessão que será
+    aplicada a ela, para a reconstrução não contá-la duas vezes. Nas rotas
+    de leitura use commit=True: a linha reconstruída é gravada na hora e a
+    próxima leitura não repete a passada.
+    """
+    stats = db.session.get(UserRunningStats, user_id)
+    if stats is not None:
+        return stats
+    if not commit:
+        return rebuild_running_stats(user_id)
+
+    try:
+        with db.session.begin_nested():
+            stats = rebuild_running_stats(user_id)
+    except IntegrityError:
+        # Outra requisição gravou a linha ao mesmo tempo: vale a dela
+        return db.session.get(UserRunningStats, user_id)
+    db.session.commit()
+    return stats
+
+
+def is_game_transaction(game_type, betting_session_id):
+    """Transação de jogo (com jogo ou sessão); as demais são depósitos e saques de caixa"""
+    return bool(game_type) or betting_session_id is not None
+
+
+def record_balance_change(stats, balance_before, balance_after, game):
+    """
+    Aplica uma transação nova no fim do histórico (saldo antes -> depois).
+    Só transações de jogo (game=True) entram na média dos retornos.
+    """
+    if balance_after is None:
+        return
+
+    value = _return(balance_before, balance_after) if game else None
+    if value is not None:
+        _welford(stats, 'return', value)
+    _record_balance(stats, balance_after)
+
+
+def read_suffix(user_id, from_date):
+    """
+    (saldo antes, saldo depois, é jogo) das transações a partir de
+    from_date, na ordem do histórico. Leia antes de alterar o histórico e
+    passe o resultado para apply_suffix_change depois de recalcular os saldos.
+    """
+    with db.session.no_autoflush:
+        return [
+            (before, after, is_game_transaction(game_type, session_id))
+            for before, after, game_type, session_id in _suffix_query(user_id, from_date)
+        ]
+
+
+def apply_suffix_change(stats, user_id, from_date, old_rows):
+    """
+    Atualiza a linha depois de uma escrita que mudou o histórico a partir de
+    from_date (retroativa, edição ou exclusão), com saldos já recalculados.
+    old_rows é o read_suffix de antes da escrita. O custo é o do sufixo: o
+    estado anterior a ele vem dos próprios acumuladores. Só quando o pico
+    antigo estava no sufixo, ou o drawdown máximo antigo estava nele e o novo
+    sufixo não o supera, o prefixo é agregado no banco (_aggregate_prefix).
+    """
+    new_rows = read_suffix(user_id, from_date)
+
+    for before, after, game in old_rows:
+        value = _return(before, after) if game and after is not None else None
+        if value is not None:
+            _welford_remove(stats, 'return', value)
+    for before, after, game in new_rows:
+        value = _return(before, after) if game and after is not None else None
+        if value is not None:
+            _welford(stats, 'return', value)
+
+    old_max_drawdown = stats.max_drawdown
+    prefix, exact = _prefix_state(stats, user_id, from_date, old_rows)
+    _replay_suffix(stats, prefix, new_rows)
+    if not exact and stats.max_drawdown <= old_max_drawdown:
+        # O drawdown máximo do prefixo (até o antigo) pode ser maior que o do novo sufixo
+        _replay_suffix(stats, _aggregate_prefix(prefix, user_id, from_date), new_rows)
+
+
+def record_session_result(stats, net_result):
+    """Aplica o resultado de uma sessão encerrada (empate zera a sequência atual)"""
+    net_result = net_result or ZERO
+    _welford(stats, 'session', float(net_result))
+
+    if net_result > 0:
+        stats.winning_sessions += 1
+        stats.current_streak = stats.current_streak + 1 if stats.current_streak > 0 else 1
+        stats.longest_win_streak = max(stats.longest_win_streak, stats.current_streak)
+    elif net_result < 0:
+        stats.current_streak = stats.current_streak - 1 if stats.current_streak < 0 else -1
+        stats.longest_loss_streak = max(stats.longest_loss_streak, -stats.current_streak)
+    else:
+        stats.current_streak = 0
+
+
+def rebuild_running_stats(user_id):
+    """Recalcula a linha do usuário com uma passada pelas transações e sessões encerradas"""
+    stats = db.session.get(UserRunningStats, user_id)
+    if stats is None:
+        stats = UserRunningStats(user_id=user_id)
+        db.session.add(stats)
+    _reset(stats)
+
+    for balance_before, balance_after, game_type, session_id in _suffix_query(user_id):
+        record_balance_change(
+            stats, balance_before, balance_after, is_game_transaction(game_type, session_id)
+        )
+
+    results = db.session.query(BettingSession.net_result).filter(
+        BettingSession.user_id == user_id,
+        BettingSession.status == 'completed'
+    ).order_by(BettingSession.ended_at, BettingSession.id)
+    for (net_result,) in results:
+        record_session_result(stats, net_result)
+
+    db.session.flush()
+    return stats
+
+
+def backfill_running_stats(batch_size=500):
+    """
+    Cria a linha dos usuários que ainda não têm uma, em lotes com commit.
+    Retorna a quantidade de linhas criadas.
+    """
+    created, last_id = 0, 0
+    while True:
+        user_ids = [row[0] for row in db.session.query(User.id).filter(
+            User.id > last_id,
+            ~db.session.query(UserRunningStats.user_id).filter(UserRunningStats.user_id == User.id).exists()
+        ).order_by(User.id).limit(batch_size)]
+        if not user_ids:
+            return created
+        last_id = user_ids[-1]
+
+        for user_id in user_ids:
+            rebuild_running_stats(user_id)
+        db.session.commit()
+        created += len(user_ids)
+
+
+def rebuild_all_running_stats(user_ids=None):
+    """Reconstrói a linha de todos os usuários (ou dos informados). Retorna a quantidade."""
+    if user_ids is None:
+        user_ids = [row[0] for row in db.session.query(User.id)]
+
+    for user_id in user_ids:
+        rebuild_running_stats(user_id)
+        db.session.commit()
+    return len(user_ids)
+
+
+def summarize(stats):
+    """Métricas derivadas dos acumuladores, no formato das rotas de estatísticas"""
+    current_drawdown = stats.peak_balance - stats.last_balance
+    streak = stats.current_streak
+
+    return {
+        'mean_return': round(stats.return_mean * 100, 4),
+        'return_volatility': round(_std(stats.return_count, stats.return_m2) * 100, 4),
+        'peak_balance': str(stats.peak_balance),
+        'current_drawdown': str(current_drawdown),
+        'current_drawdown_percentage': (
+            round(float(current_drawdown / stats.peak_balance * 100), 2) if stats.peak_balance > 0 else 0
+        ),
+        'max_drawdown': str(stats.max_drawdown),
+        'max_drawdown_percentage': round(stats.max_drawdown_percentage, 2),
+        'sessions': stats.session_count,
+        'mean_session_result': round(stats.session_mean, 2),
+        'session_result_std': round(_std(stats.session_count, stats.session_m2), 2),
+        'win_rate': round(stats.winning_sessions / stats.session_count * 100, 2) if stats.session_count else 0,
+        'current_streak': {
+            'type': 'win' if streak > 0 else 'loss' if streak < 0 else None,
+            'length': abs(streak)
+        },
+        'longest_win_streak': stats.longest_win_streak,
+        'longest_loss_streak': stats.longest_loss_streak
+    }
+
+
+def _welford(stats, prefix, value):
+    # Atualização de Welford: média e soma dos quadrados dos desvios (M2) em O(1)
+    count = getattr(stats, f'{prefix}_count') + 1
+    mean = getattr(stats, f'{prefix}_mean')
+    delta = value - mean
+    mean += delta / count
+
+    setattr(stats, f'{prefix}_count', count)
+    setattr(stats, f'{prefix}_mean', mean)
+    setattr(stats, f'{prefix}_m2', getattr(stats, f'{prefix}_m2') + delta * (value - mean))
+
+
+def _welford_remove(stats, prefix, value):
+    # Inverso de _welford: tira um valor já somado à média e ao M2
+    count = getattr(stats, f'{prefix}_count') - 1
+    if count <= 0:
+        setattr(stats, f'{prefix}_count', 0)
+        setattr(stats, f'{prefix}_mean', 0.0)
+        setattr(stats, f'{prefix}_m2', 0.0)
+        return
+
+    mean = getattr(stats, f'{prefix}_mean')
+    previous = mean + (mean - value) / count
+    setattr(stats, f'{prefix}_count', count)
+    setattr(stats, f'{prefix}_mean', previous)
+    setattr(stats, f'{prefix}_m2', max(getattr(stats, f'{prefix}_m2') - (value - previous) * (value - mean), 0.0))
+
+
+def _return(balance_before, balance_after):
+    if balance_before is None or balance_before <= 0:
+        return None
+    return float((balance_after - balance_before) / balance_before)
+
+
+def _record_balance(stats, balance_after):
+    stats.last_balance = balance_after
+    if balance_after > stats.peak_balance:
+        stats.peak_balance = balance_after
+
+    drawdown = stats.peak_balance - balance_after
+    if drawdown > stats.max_drawdown:
+        stats.max_drawdown = drawdown
+        stats.max_drawdown_percentage = float(drawdown / stats.peak_balance * 100) if stats.peak_balance > 0 else 0.0
+
+
+def _suffix_query(user_id, from_date=None):
+    query = db.session.query(
+        Transaction.balance_before, Transaction.balance_after,
+        Transaction.game_type, Transaction.betting_session_id
+    ).filter(Transaction.user_id == user_id)
+    if from_date is not None:
+        query = query.filter(Transaction.date >= from_date)
+    return query.order_by(Transaction.date, Transaction.id).yield_per(5000)
+
+
+def _prefix_state(stats, user_id, from_date, old_rows):
+    # (estado antes de from_date, drawdown máximo exato?). Se o pico e o drawdown
+    # máximo gravados não vieram do sufixo antigo, são os do prefixo
+    last_balance = db.session.query(Transaction.balance_after).filter(
+        Transaction.user_id == user_id,
+        Transaction.date < from_date,
+        Transaction.balance_after.isnot(None)
+    ).order_by(Transaction.date.desc(), Transaction.id.desc()).limit(1).scalar()
+    prefix = SimpleNamespace(
+        last_balance=last_balance if last_balance is not None else ZERO,
+        peak_balance=stats.peak_balance,
+        max_drawdown=stats.max_drawdown,
+        max_drawdown_percentage=stats.max_drawdown_percentage
+    )
+
+    old_balances = [after for _, after, _ in old_rows if after is not None]
+    if old_balances and max(old_balances) >= stats.peak_balance:
+        return _aggregate_prefix(prefix, user_id, from_date), True
+
+    max_drawdown = max((stats.peak_balance - balance for balance in old_balances), default=ZERO)
+    if stats.max_drawdown > 0 and max_drawdown >= stats.max_drawdown:
+        # Drawdown máximo no sufixo antigo: o do prefixo fica em aberto (ver apply_suffix_change)
+        prefix.max_drawdown, prefix.max_drawdown_percentage = ZERO, 0.0
+        return prefix, False
+    return prefix, True
+
+
+def _replay_suffix(stats, prefix, rows):
+    stats.last_balance = prefix.last_balance
+    stats.peak_balance = prefix.peak_balance
+    stats.max_drawdown = prefix.max_drawdown
+    stats.max_drawdown_percentage = prefix.max_drawdown_percentage
+    for _, after, _ in rows:
+        if after is not None:
+            _record_balance(stats, after)
+
+
+def _aggregate_prefix(prefix, user_id, from_date):
+    # Pico ou drawdown máximo antigos no sufixo: calcula os do prefixo no banco, com
+    # o máximo acumulado em janela sobre (date, id), sem trazer as linhas
+    rows = db.session.query(
+        Transaction.date, Transaction.id, Transaction.balance_after,
+        func.max(Transaction.balance_after).over(
+            order_by=(Transaction.date, Transaction.id), rows=(None, 0)
+        ).label('running_peak')
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.date < from_date,
+        Transaction.balance_after.isnot(None)
+    ).subquery()
+
+    # O pico parte de zero, como em _record_balance
+    peak = case((rows.c.running_peak > 0, rows.c.running_peak), else_=0)
+    drawdown = peak - rows.c.balance_after
+    worst = db.session.query(
+        select(func.max(rows.c.balance_after)).scalar_subquery(), peak, drawdown
+    ).order_by(drawdown.desc(), rows.c.date, rows.c.id).first()
+
+    if worst is None:
+        prefix.peak_balance, prefix.max_drawdown, prefix.max_drawdown_percentage = ZERO, ZERO, 0.0
+        return prefix
+
+    prefix.peak_balance = max(_money(worst[0]), ZERO)
+    prefix.max_drawdown = max(_money(worst[2]), ZERO)
+    worst_peak = _money(worst[1])
+    prefix.max_drawdown_percentage = (
+        float(prefix.max_drawdown / worst_peak * 100) if prefix.max_drawdown > 0 and worst_peak > 0 else 0.0
+    )
+    return prefix
+
+
+def _money(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def _std(count, m2):
+    return math.sqrt(m2 / (count - 1)) if count > 1 and m2 > 0 else 0.0
+
+
+def _reset(stats):
+    stats.return_count = 0
+    stats.return_mean = 0.0
+    stats.return_m2 = 0.0
+    stats.last_balance = ZERO
+    stats.peak_balance = ZERO
+    stats.max_drawdown = ZERO
+    stats.max_drawdown_percentage = 0.0
+    stats.session_count = 0
+    stats.session_mean = 0.0
+    stats.session_m2 = 0.0
+    stats.winning_sessions = 0
+    stats.current_streak = 0
+    stats.longest_win_streak = 0
+    stats.longest_loss_streak = 0
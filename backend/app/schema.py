@@ -0,0 +1,227 @@
+# schema.py
+"""
+Atualização do schema de bancos criados antes de colunas e índices novos.
+
+As tabelas são criadas com db.create_all(), que não altera tabelas já
+existentes. upgrade_schema compara cada tabela dos modelos com o banco e
+adiciona as colunas que faltam (ALTER TABLE ... ADD COLUMN), converte para
+jsonb as colunas json antigas no PostgreSQL (ALTER COLUMN ... TYPE jsonb),
+cria os índices que faltam e recria os que mudaram de colunas. É idempotente
+e roda só por flask upgrade-db (e pelo servidor de desenvolvimento em
+run.py), nunca na subida dos workers: create_app apenas avisa no log quando
+há alterações pendentes (pending_schema_changes).
+
+Cada alteração roda na sua própria transação; no PostgreSQL os índices são
+criados com CREATE INDEX CONCURRENTLY, fora de transação, sem bloquear as
+escritas em tabelas grandes como transactions.
+
+Colunas novas começam com o default do modelo (ou NULL). Valores derivados
+do histórico vêm dos comandos de reconstrução: flask rebuild-stats para os
+resultados de sessão em betting_stats; flask upgrade-db também preenche
+bet_odds/bet_type/bet_stake a partir do meta das transações antigas
+(backfill_promoted_meta).
+"""
+
+import re
+from sqlalchemy import inspect, literal, update
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from . import db
+from . import models  # noqa: F401 - registra as tabelas em db.metadata
+
+
+def prepare_database():
+    """
+    Tabelas novas (create_all), colunas e índices novos em tabelas antigas
+    (upgrade_schema) e índice de busca textual. Retorna as alterações.
+    """
+    from .search import ensure_search_index
+
+    db.create_all()
+    changes = upgrade_schema(db.engine)
+
+    if db.engine.dialect.name == 'postgresql':
+        # Índices de busca com CONCURRENTLY: cada comando na sua própria transação
+        with _autocommit(db.engine) as connection:
+            created = ensure_search_index(connection, concurrently=True)
+    else:
+        with db.engine.begin() as connection:
+            created = ensure_search_index(connection)
+    if created:
+        changes.append('transactions search index')
+    return changes
+
+
+def pending_schema_changes(connection):
+    """Alterações que upgrade_schema faria, sem executar nenhuma"""
+    return [name for name, _, _ in _schema_steps(connection)]
+
+
+def upgrade_schema(engine):
+    """
+    Alinha as tabelas existentes com os modelos. Tabelas inexistentes ficam
+    para o create_all. Cada alteração é confirmada sozinha, então uma falha
+    não desfaz as anteriores. Retorna a lista de alterações feitas
+    ('tabela.coluna' ou nome do índice).
+    """
+    with engine.connect() as connection:
+        steps = _schema_steps(connection)
+
+    changes = []
+    for name, statements, concurrent in steps:
+        with (_autocommit(engine) if concurrent else engine.begin()) as connection:
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+        changes.append(name)
+    return changes
+
+
+def _schema_steps(connection):
+    # (nome, comandos, fora de transação?) na ordem de execução: colunas antes dos índices
+    dialect = connection.dialect
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    column_steps, index_steps = [], []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        columns = {column['name']: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            current = columns.get(column.name)
+            if current is None:
+                column_steps.append((
+                    f'{table.name}.{column.name}', [_add_column_sql(dialect, table, column)], False
+                ))
+            elif _becomes_jsonb(dialect, column, current):
+                column_steps.append((
+                    f'{table.name}.{column.name} jsonb', [_jsonb_column_sql(table, column)], False
+                ))
+
+        indexes = {index['name']: index for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if not _applies_to(index, dialect):
+                continue
+
+            current = indexes.get(index.name)
+            if current is None:
+                index_steps.append((index.name, [_create_index_sql(dialect, index)], _concurrent(dialect)))
+            elif _index_changed(index, current):
+                index_steps.append((
+                    index.name,
+                    [_drop_index_sql(dialect, index), _create_index_sql(dialect, index)],
+                    _concurrent(dialect)
+                ))
+
+    return column_steps + index_steps
+
+
+def _add_column_sql(dialect, table, column):
+    definition = str(CreateColumn(column).compile(dialect=dialect))
+
+    # Default escalar do modelo vira DEFAULT do banco, preenchendo as linhas existentes
+    default = column.default
+    if column.server_default is None and default is not None and default.is_scalar:
+        value = literal(default.arg, type_=column.type).compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True}
+        )
+        definition += f' DEFAULT {value}'
+
+    if_not_exists = 'IF NOT EXISTS ' if dialect.name == 'postgresql' else ''
+    return f'ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{definition}'
+
+
+def _becomes_jsonb(dialect, column, current):
+    # Colunas json antigas no PostgreSQL: os índices GIN (jsonb_path_ops) exigem jsonb
+    if dialect.name != 'postgresql':
+        return False
+    expected = column.type.compile(dialect=dialect)
+    return expected == 'JSONB' and current['type'].compile(dialect=dialect) != expected
+
+
+def _jsonb_column_sql(table, column):
+    # Reescreve a tabela com lock exclusivo: roda antes dos índices, na sua transação
+    return (
+        f'ALTER TABLE {table.name} ALTER COLUMN {column.name} '
+        f'TYPE jsonb USING {column.name}::jsonb'
+    )
+
+
+def _concurrent(dialect):
+    return dialect.name == 'postgresql'
+
+
+def _create_index_sql(dialect, index):
+    sql = str(CreateIndex(index).compile(dialect=dialect))
+    if _concurrent(dialect):
+        # IF NOT EXISTS: outro upgrade-db rodando ao mesmo tempo pode ter criado o índice
+        sql = re.sub(r'^CREATE (UNIQUE )?INDEX ', r'CREATE \1INDEX CONCURRENTLY IF NOT EXISTS ', sql)
+    return sql
+
+
+def _drop_index_sql(dialect, index):
+    if _concurrent(dialect):
+        return f'DROP INDEX CONCURRENTLY IF EXISTS {index.name}'
+    return f'DROP INDEX {index.name}'
+
+
+def _autocommit(engine):
+    return engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+
+def _applies_to(index, dialect):
+    # Índices com ddl_if(dialect=...) só existem naquele banco
+    ddl_if = index._ddl_if
+    return ddl_if is None or ddl_if.dialect is None or dialect.name in (
+        (ddl_if.dialect,) if isinstance(ddl_if.dialect, str) else ddl_if.dialect
+    )
+
+
+def _index_changed(index, current):
+    # Só compara índices de colunas simples; índices de expressão ficam como estão
+    expected = [getattr(expression, 'name', None) for expression in index.expressions]
+    if None in expected or None in current.get('column_names', [None]):
+        return False
+    return expected != list(current['column_names']) or bool(index.unique) != bool(current.get('unique'))
+
+
+def backfill_promoted_meta(batch_size=1000):
+    """
+    Preenche bet_odds/bet_type/bet_stake das transações gravadas antes das
+    colunas existirem, a partir do meta (mesma regra das rotas de escrita),
+    em lotes com commit. Metas inválidas são ignoradas. Idempotente: só toca
+    linhas com as três colunas vazias. Retorna a quantidade de linhas
+    preenchidas.
+    """
+    from .models import Transaction
+    from .utils import validate_transaction_attributes, promote_meta_columns
+    from .versioning import bump_data_version
+
+    filled, last_id = 0, 0
+    while True:
+        rows = db.session.query(Transaction.id, Transaction.user_id, Transaction.meta).filter(
+            Transaction.id > last_id,
+            Transaction.bet_odds.is_(None),
+            Transaction.bet_type.is_(None),
+            Transaction.bet_stake.is_(None)
+        ).order_by(Transaction.id).limit(batch_size).all()
+        if not rows:
+            return filled
+        last_id = rows[-1].id
+
+        updates, user_ids = [], set()
+        for row in rows:
+            if not row.meta or not validate_transaction_attributes(None, row.meta)['is_valid']:
+                continue
+            values = promote_meta_columns(row.meta)
+            if any(value is not None for value in values.values()):
+                updates.append({'id': row.id, **values})
+                user_ids.add(row.user_id)
+
+        if updates:
+            # UPDATE em lote pela chave primária não passa pelo before_flush
+            db.session.execute(update(Transaction), updates)
+            bump_data_version(user_ids)
+            filled += len(updates)
+        db.session.commit()
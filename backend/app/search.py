@@ -0,0 +1,302 @@
+# search.py
+"""
+Busca textual em Transaction.description e Transaction.category.
+
+PostgreSQL: índice GIN sobre to_tsvector('portuguese', ...) para palavras
+(com prefixo, 'apost' encontra 'apostas') e índice GIN de trigramas (pg_trgm)
+para trechos no meio das palavras. Os dois são índices de expressão, então
+o banco os mantém sozinho a cada escrita.
+
+SQLite (desenvolvimento): tabela FTS5 de conteúdo externo (transactions_fts)
+sincronizada por triggers de INSERT/UPDATE/DELETE em transactions, o que
+cobre também as cargas em lote e a importação.
+
+Filtro por tags: containment (tags @> '["x"]') sobre o índice GIN
+jsonb_path_ops no PostgreSQL. No SQLite, que não indexa dentro de JSON, a
+tabela transaction_tags (uma linha por transação e tag, índice
+(user_id, tag)) é mantida por triggers como a tabela FTS5.
+"""
+
+import json
+import re
+from contextlib import nullcontext
+from flask import current_app
+from sqlalchemy import (
+    event, text, literal_column, column, and_, or_, func, cast, exists, literal, bindparam, String
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import DBAPIError
+
+from . import db
+from .models import Transaction
+
+# Configuração de idioma do full-text do PostgreSQL
+SEARCH_LANGUAGE = 'portuguese'
+
+# Tamanho mínimo de um termo para usar o índice de trigramas
+TRIGRAM_MIN_LENGTH = 3
+
+# Texto indexado; o mesmo SQL aparece nos índices e nas consultas para o
+# PostgreSQL reconhecer a expressão indexada
+SEARCH_DOCUMENT = "coalesce(transactions.description, '') || ' ' || coalesce(transactions.category, '')"
+
+# {concurrently}: 'CONCURRENTLY ' em flask upgrade-db (ver ensure_search_index)
+POSTGRESQL_FTS_INDEX = f"""
+    CREATE INDEX {{concurrently}}IF NOT EXISTS idx_transactions_search
+    ON transactions USING gin (to_tsvector('{SEARCH_LANGUAGE}'::regconfig, {SEARCH_DOCUMENT}))
+"""
+
+POSTGRESQL_TRIGRAM_INDEX = f"""
+    CREATE INDEX {{concurrently}}IF NOT EXISTS idx_transactions_search_trgm
+    ON transactions USING gin ((lower({SEARCH_DOCUMENT})) gin_trgm_ops)
+"""
+
+SQLITE_FTS_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+        description, category,
+        content='transactions', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+"""
+
+SQLITE_FTS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO transactions_fts (rowid, description, category)
+        VALUES (new.id, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+        VALUES ('delete', old.id, old.description, old.category);
+    END
+    """,
+    # Só quando o texto muda: o recálculo de saldos atualiza muitas linhas
+    """
+    CREATE TRIGGER IF NOT EXISTS transactions_fts_update
+    AFTER UPDATE OF description, category ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+        VALUES ('delete', old.id, old.description, old.category);
+        INSERT INTO transactions_fts (rowid, description, category)
+        VALUES (new.id, new.description, new.category);
+    END
+    """,
+)
+
+
+SQLITE_TAGS_TABLE = """
+    CREATE TABLE IF NOT EXISTS transaction_tags (
+        transaction_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        tag TEXT NOT NULL,
+        PRIMARY KEY (transaction_id, tag)
+    )
+"""
+
+SQLITE_TAGS_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_transaction_tags_user_tag
+    ON transaction_tags (user_id, tag, transaction_id)
+"""
+
+# Tags (texto) de uma linha de transactions; JSON inválido conta como sem tags
+SQLITE_TAGS_SELECT = """
+    SELECT {row}.id, {row}.user_id, tag.value
+    FROM {source}json_each(CASE WHEN json_valid({row}.tags) THEN {row}.tags ELSE '[]' END) AS tag
+    WHERE tag.type = 'text'
+"""
+
+SQLITE_TAGS_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS transaction_tags_insert AFTER INSERT ON transactions BEGIN
+        INSERT OR IGNORE INTO transaction_tags (transaction_id, user_id, tag)
+        {SQLITE_TAGS_SELECT.format(row='new', source='')};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS transaction_tags_delete AFTER DELETE ON transactions BEGIN
+        DELETE FROM transaction_tags WHERE transaction_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS transaction_tags_update AFTER UPDATE OF tags, user_id ON transactions BEGIN
+        DELETE FROM transaction_tags WHERE transaction_id = old.id;
+        INSERT OR IGNORE INTO transaction_tags (transaction_id, user_id, tag)
+        {SQLITE_TAGS_SELECT.format(row='new', source='')};
+    END
+    """,
+)
+
+SQLITE_TAGS_FILL = f"""
+    INSERT OR IGNORE INTO transaction_tags (transaction_id, user_id, tag)
+    {SQLITE_TAGS_SELECT.format(row='transactions', source='transactions, ')}
+"""
+
+
+def search_terms(query):
+    """Palavras da busca, sem operadores nem pontuação"""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def apply_search(query, search):
+    """
+    Restringe uma consulta de Transaction às linhas que contêm todos os termos
+    de `search` (prefixo de palavra; no PostgreSQL também trecho de palavra).
+    Levanta ValueError se a busca não tiver termos.
+    """
+    terms = search_terms(search)
+    if not terms:
+        raise ValueError('Informe o termo de busca (?q=)')
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return query.filter(_postgresql_condition(terms))
+    if dialect == 'sqlite':
+        return query.filter(_sqlite_condition(terms))
+
+    # Outros bancos: sem índice textual, ILIKE por termo
+    document = literal_column(SEARCH_DOCUMENT)
+    return query.filter(and_(*[document.ilike(f'%{_escape_like(term)}%', escape='\\') for term in terms]))
+
+
+def apply_tag_filter(query, tags, user_id=None):
+    """
+    Restringe uma consulta de Transaction às linhas que têm todas as `tags`.
+    No SQLite, informe o `user_id` da consulta para usar o índice de
+    transaction_tags; sem ele as tags de cada linha são lidas do JSON.
+    """
+    if not tags:
+        return query
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return query.filter(Transaction.tags.op('@>')(cast(literal(json.dumps(tags)), JSONB)))
+
+    if dialect == 'sqlite' and user_id is not None:
+        for tag in tags:
+            tagged = text(
+                'SELECT transaction_id FROM transaction_tags WHERE user_id = :tag_user_id AND tag = :tag'
+            ).bindparams(bindparam('tag_user_id', user_id), bindparam('tag', tag, unique=True))
+            query = query.filter(Transaction.id.in_(tagged.columns(column('transaction_id'))))
+        return query
+
+    if dialect == 'sqlite':
+        for tag in tags:
+            values = func.json_each(Transaction.tags).table_valued('value')
+            query = query.filter(exists().where(values.c.value == tag))
+        return query
+
+    # Outros bancos: busca no JSON serializado
+    for tag in tags:
+        query = query.filter(cast(Transaction.tags, String).like(f'%{json.dumps(tag)}%'))
+    return query
+
+
+def ensure_search_index(connection, concurrently=False):
+    """
+    Cria os índices de busca que ainda não existem. No SQLite, as tabelas
+    FTS5 e transaction_tags criadas agora são preenchidas com as transações
+    já gravadas. No PostgreSQL, concurrently=True cria os índices GIN sem
+    bloquear escritas; exige uma conexão em AUTOCOMMIT. Retorna True se algo
+    foi criado.
+    """
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        keyword = 'CONCURRENTLY ' if concurrently else ''
+        existing = {row[0] for row in connection.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'transactions'"
+        ))}
+        created = False
+
+        if 'idx_transactions_search' not in existing:
+            connection.execute(text(POSTGRESQL_FTS_INDEX.format(concurrently=keyword)))
+            created = True
+
+        if 'idx_transactions_search_trgm' not in existing:
+            statements = (
+                'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+                POSTGRESQL_TRIGRAM_INDEX.format(concurrently=keyword)
+            )
+            try:
+                # Em AUTOCOMMIT uma falha não aborta nada; dentro de uma transação, usa savepoint
+                with (nullcontext() if concurrently else connection.begin_nested()):
+                    for statement in statements:
+                        connection.execute(text(statement))
+                created = True
+            except DBAPIError as e:
+                # Sem permissão para a extensão: trechos de palavra continuam funcionando, sem índice
+                current_app.logger.warning(f'Trigram search index unavailable: {e}')
+        return created
+
+    if dialect == 'sqlite':
+        created = False
+        if not _sqlite_object_exists(connection, 'table', 'transactions_fts'):
+            connection.execute(text(SQLITE_FTS_TABLE))
+            for trigger in SQLITE_FTS_TRIGGERS:
+                connection.execute(text(trigger))
+            connection.execute(text("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')"))
+            created = True
+
+        # O trigger de UPDATE é criado por último: marca a tabela como completa
+        if not _sqlite_object_exists(connection, 'trigger', 'transaction_tags_update'):
+            connection.execute(text(SQLITE_TAGS_TABLE))
+            connection.execute(text(SQLITE_TAGS_INDEX))
+            for trigger in SQLITE_TAGS_TRIGGERS:
+                connection.execute(text(trigger))
+            connection.execute(text(SQLITE_TAGS_FILL))
+            created = True
+
+        return created
+
+    return False
+
+
+def rebuild_search_index(connection):
+    """Recria o conteúdo do índice a partir de transactions (apenas SQLite; no PostgreSQL, REINDEX)"""
+    ensure_search_index(connection)
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('REINDEX INDEX idx_transactions_search'))
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(text("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')"))
+        connection.execute(text('DELETE FROM transaction_tags'))
+        connection.execute(text(SQLITE_TAGS_FILL))
+
+
+@event.listens_for(Transaction.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    ensure_search_index(connection)
+
+
+def _postgresql_condition(terms):
+    document = literal_column(SEARCH_DOCUMENT)
+    language = literal_column(f"'{SEARCH_LANGUAGE}'::regconfig")
+
+    matches = func.to_tsvector(language, document).op('@@')(
+        func.to_tsquery(language, ' & '.join(f'{term}:*' for term in terms))
+    )
+
+    partial_terms = [term for term in terms if len(term) >= TRIGRAM_MIN_LENGTH]
+    if len(partial_terms) < len(terms):
+        return matches
+
+    lowered = func.lower(document)
+    partial = and_(*[lowered.like(f'%{_escape_like(term)}%', escape='\\') for term in partial_terms])
+    return or_(matches, partial)
+
+
+def _sqlite_condition(terms):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    rowids = text(
+        'SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH :search_match'
+    ).bindparams(search_match=match).columns(column('rowid'))
+    return Transaction.id.in_(rowids)
+
+
+def _sqlite_object_exists(connection, object_type, name):
+    return connection.execute(text(
+        'SELECT 1 FROM sqlite_master WHERE type = :type AND name = :name'
+    ), {'type': object_type, 'name': name}).first() is not None
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
@@ -0,0 +1,314 @@
+# simulation.py
+"""
+Simulação de Monte Carlo do risco de ruína sobre matrizes NumPy.
+
+Cada caminho é uma banca que aposta um valor fixo por rodada em um jogo de
+GAME_CONFIGURATIONS até atingir o stop loss (ou não conseguir mais cobrir a
+aposta), atingir a meta de lucro ou acabar as rodadas. Um lote de caminhos
+é simulado de uma vez, em blocos de rodadas: um sorteio uniforme por célula
+decide as vitórias, uma soma acumulada dá os saldos e o argmax sobre a
+máscara de absorção acha onde cada caminho parou.
+
+Os caminhos são divididos em lotes de tamanho fixo, cada um com seu próprio
+gerador derivado de uma única SeedSequence, então a mesma semente dá o
+mesmo resultado com os lotes rodando no processo ou no pool de processos.
+
+O orçamento de tempo é um prazo absoluto passado a cada lote, que o confere
+entre blocos de rodadas e desiste ao passar dele, inclusive nos processos
+do pool e no primeiro lote. O resultado informa quantos caminhos foram de
+fato simulados; se nenhum lote terminar a tempo, levanta SimulationTimeout.
+"""
+
+import atexit
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .config import GAME_CONFIGURATIONS
+
+# Caminhos por lote (uma tarefa do pool); fixo para as sementes serem reproduzíveis
+CHUNK_PATHS = 2000
+
+# Rodadas simuladas entre duas conferências do prazo
+ROUND_BLOCK = 100
+
+# Rodadas em que as faixas de percentis são informadas
+BAND_POINTS = 25
+BAND_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Multiplicador de pagamento por classe de volatilidade: a vitória devolve
+# aposta * pagamento, a derrota perde a aposta, e a probabilidade de vitória
+# é ajustada para o retorno esperado por rodada seguir a vantagem da casa
+VOLATILITY_PAYOUTS = {
+    'low': 1.5,
+    'medium': 2.0,
+    'high': 3.0,
+    'very_high': 10.0,
+}
+
+
+class SimulationTimeout(TimeoutError):
+    """Nenhum lote de caminhos terminou dentro do orçamento de tempo"""
+
+
+def game_model(game_type, bet_fraction=None):
+    """
+    Probabilidade de vitória, pagamento e fração apostada de um tipo de jogo.
+    bet_fraction é limitada aos multiplicadores mínimo/máximo do jogo (padrão:
+    o mínimo). Levanta ValueError para tipos de jogo desconhecidos.
+    """
+    config = GAME_CONFIGURATIONS.get(game_type)
+    if config is None:
+        raise ValueError(f'Unknown game type: {game_type}')
+
+    payout = VOLATILITY_PAYOUTS.get(config.get('volatility'), VOLATILITY_PAYOUTS['medium'])
+    house_edge = config.get('house_edge', 0) / 100
+    low, high = config.get('min_bet_multiplier', 0.01), config.get('max_bet_multiplier', 0.1)
+    fraction = low if bet_fraction is None else min(max(bet_fraction, low), high)
+
+    return {
+        'house_edge': house_edge,
+        'payout': payout,
+        'win_probability': (1 - house_edge) / payout,
+        'bet_fraction': fraction,
+    }
+
+
+def simulate_chunk(seed, paths, start_balance, stake, payout, win_probability,
+                   stop_level, target_level, rounds, band_rounds, deadline=None):
+    """
+    Simula um lote de caminhos. Retorna a rodada de absorção de cada caminho,
+    se ele quebrou ou atingiu a meta, o saldo final e o saldo em band_rounds
+    (congelado quando o caminho para). Com deadline (time.time() absoluto),
+    retorna None se o prazo passar antes do fim.
+    """
+    rng = np.random.default_rng(seed)
+    balance = np.full(paths, start_balance, dtype=np.float64)
+    lengths = np.full(paths, rounds, dtype=np.int64)
+    ruined = np.zeros(paths, dtype=bool)
+    target = np.zeros(paths, dtype=bool)
+    stopped = np.zeros(paths, dtype=bool)
+    final = np.zeros(paths, dtype=np.float64)
+    bands = np.empty((paths, band_rounds.size), dtype=np.float64)
+
+    for start in range(0, rounds, ROUND_BLOCK):
+        if deadline is not None and time.time() > deadline:
+            return None
+
+        width = min(ROUND_BLOCK, rounds - start)
+        wins = rng.random((paths, width)) < win_probability
+        block = balance[:, None] + np.cumsum(np.where(wins, stake * (payout - 1), -stake), axis=1)
+
+        ruined_at = (block <= stop_level) | (block < stake)
+        target_at = block >= target_level
+        absorbed = (ruined_at | target_at) & ~stopped[:, None]
+
+        hit = absorbed.any(axis=1)
+        first = absorbed.argmax(axis=1)
+        rows = np.flatnonzero(hit)
+        lengths[rows] = start + first[rows] + 1
+        ruined[rows] = ruined_at[rows, first[rows]]
+        target[rows] = target_at[rows, first[rows]]
+        final[rows] = block[rows, first[rows]]
+
+        # Faixas deste bloco: caminhos já parados ficam com o saldo final
+        in_block = np.flatnonzero((band_rounds >= start) & (band_rounds < start + width))
+        if in_block.size:
+            columns = band_rounds[in_block] - start
+            frozen = stopped[:, None] | (hit[:, None] & (first[:, None] <= columns[None, :]))
+            bands[:, in_block] = np.where(frozen, final[:, None], block[:, columns])
+
+        stopped |= hit
+        balance = block[:, -1]
+        if stopped.all():
+            # Todos absorvidos: as faixas seguintes repetem o saldo final
+            later = band_rounds >= start + width
+            bands[:, later] = final[:, None]
+            break
+
+    final = np.where(stopped, final, balance)
+    return {
+        'lengths': lengths,
+        'ruined': ruined,
+        'target': target,
+        'final': final.astype(np.float32),
+        'bands': bands.astype(np.float32),
+    }
+
+
+# Pool de processos compartilhado pelas requisições deste processo, criado no primeiro uso
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+atexit.register(_reset_executor)
+
+
+def simulate_risk_of_ruin(start_balance, stop_loss, profit_target, game_type='roulette',
+                          bet_fraction=None, paths=10000, rounds=500, seed=0, workers=1,
+                          parallel_threshold=20000, time_budget=None):
+    """
+    Estima a probabilidade de atingir stop_loss (um piso de saldo; 0 significa
+    quebrar só quando a aposta não puder mais ser coberta) antes de
+    profit_target (um nível de saldo; None para sem meta) em até `rounds`
+    apostas.
+
+    Usa o pool de processos quando paths >= parallel_threshold e workers > 1.
+    Com time_budget (segundos), nenhum lote passa do prazo: o resultado traz
+    os lotes concluídos até ele, em ordem. Levanta SimulationTimeout se
+    nenhum lote terminar a tempo.
+    """
+    started = time.perf_counter()
+    deadline = time.time() + time_budget if time_budget is not None else None
+    model = game_model(game_type, bet_fraction)
+    stake = start_balance * model['bet_fraction']
+    stop_level = max(stop_loss or 0.0, 0.0)
+    target_level = profit_target if profit_target and profit_target > start_balance else np.inf
+
+    band_rounds = np.unique(np.linspace(0, rounds - 1, min(BAND_POINTS, rounds)).astype(np.int64))
+    sizes = [min(CHUNK_PATHS, paths - offset) for offset in range(0, paths, CHUNK_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [
+        (chunk_seed, size, start_balance, stake, model['payout'], model['win_probability'],
+         stop_level, target_level, rounds, band_rounds, deadline)
+        for chunk_seed, size in zip(seeds, sizes)
+    ]
+
+    parallel = workers > 1 and paths >= parallel_threshold and len(args) > 1
+    chunks = _run_parallel(args, workers, deadline) if parallel else None
+    if chunks is None:
+        parallel = False
+        chunks = _run_serial(args)
+
+    if not chunks:
+        raise SimulationTimeout(f'No simulation chunk finished within {time_budget}s')
+
+    result = _summarize(chunks, band_rounds)
+    result.update({
+        'game_type': game_type,
+        'parameters': {
+            'start_balance': round(start_balance, 2),
+            'stake': round(stake, 2),
+            'bet_fraction': model['bet_fraction'],
+            'stop_loss': round(stop_level, 2),
+            'profit_target': round(target_level, 2) if np.isfinite(target_level) else None,
+            'rounds': rounds,
+            'house_edge': round(model['house_edge'] * 100, 2),
+            'payout': model['payout'],
+            'win_probability': round(model['win_probability'], 6),
+            'seed': seed,
+        },
+        'requested_paths': paths,
+        'truncated': result['paths'] < paths,
+        'workers': workers if parallel else 1,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+    return result
+
+
+def _run_serial(args):
+    # Cada lote confere o prazo sozinho: o primeiro que não termina encerra a série
+    chunks = []
+    for chunk_args in args:
+        chunk = simulate_chunk(*chunk_args)
+        if chunk is None:
+            break
+        chunks.append(chunk)
+    return chunks
+
+
+def _run_parallel(args, workers, deadline):
+    # Resultados lidos na ordem de envio, então um resultado truncado continua
+    # sendo um prefixo reproduzível dos lotes; None significa pool inutilizável.
+    # Lotes já em execução no pool param sozinhos no prazo, liberando os processos
+    try:
+        executor = _get_executor(workers)
+        futures = [executor.submit(simulate_chunk, *chunk_args) for chunk_args in args]
+    except (BrokenProcessPool, RuntimeError, OSError):
+        _reset_executor()
+        return None
+
+    chunks = []
+    try:
+        for future in futures:
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - time.time(), 0)
+            chunk = future.result(timeout=timeout)
+            if chunk is None:
+                break
+            chunks.append(chunk)
+    except FutureTimeoutError:
+        pass
+    except BrokenProcessPool:
+        _reset_executor()
+        return None
+    finally:
+        for future in futures:
+            future.cancel()
+    return chunks
+
+
+def _summarize(chunks, band_rounds):
+    lengths = np.concatenate([chunk['lengths'] for chunk in chunks])
+    ruined = np.concatenate([chunk['ruined'] for chunk in chunks])
+    target = np.concatenate([chunk['target'] for chunk in chunks])
+    final = np.concatenate([chunk['final'] for chunk in chunks])
+    bands = np.concatenate([chunk['bands'] for chunk in chunks])
+
+    paths = lengths.size
+    ruin_probability = float(ruined.mean())
+    target_probability = float(target.mean())
+    # Aproximação normal do intervalo de 95% da probabilidade de ruína
+    margin = 1.96 * np.sqrt(ruin_probability * (1 - ruin_probability) / paths)
+
+    band_values = np.percentile(bands, BAND_PERCENTILES, axis=0)
+    final_values = np.percentile(final, BAND_PERCENTILES)
+
+    return {
+        'paths': paths,
+        'ruin_probability': round(ruin_probability, 4),
+        'ruin_probability_interval': [
+            round(max(ruin_probability - float(margin), 0.0), 4),
+            round(min(ruin_probability + float(margin), 1.0), 4),
+        ],
+        'target_probability': round(target_probability, 4),
+        'unresolved_probability': round(1 - ruin_probability - target_probability, 4),
+        'expected_rounds': round(float(lengths.mean()), 2),
+        'expected_rounds_to_ruin': round(float(lengths[ruined].mean()), 2) if ruined.any() else None,
+        'expected_rounds_to_target': round(float(lengths[target].mean()), 2) if target.any() else None,
+        'final_balance': {
+            'mean': round(float(final.mean()), 2),
+            **{f'p{p}': round(float(value), 2) for p, value in zip(BAND_PERCENTILES, final_values)},
+        },
+        'bands': [
+            {
+                'round': int(round_index) + 1,
+                **{f'p{p}': round(float(value), 2) for p, value in zip(BAND_PERCENTILES, band_values[:, i])},
+            }
+            for i, round_index in enumerate(band_rounds)
+        ],
+    }
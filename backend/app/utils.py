@@ -1,5 +1,5 @@
 from decimal import Decimal, ROUND_HALF_UP
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, timezone
 from typing import Dict, List, Optional, Tuple
 import hashlib
 import secrets
@@ -190,6 +190,35 @@ def get_period_start_date(period: str) -> datetime:
     else:
         return now - timedelta(days=30)  # Default to 30 days
 
+def get_period_range(period: str) -> Tuple[datetime, datetime]:
+    """Half-open [start, end) range for the period containing now (see get_period_start_date)"""
+    start = get_period_start_date(period)
+    
+    if period == 'today':
+        end = start + timedelta(days=1)
+    elif period == 'week':
+        end = start + timedelta(weeks=1)
+    elif period in ('month', 'quarter'):
+        months = 1 if period == 'month' else 3
+        month_index = start.month - 1 + months
+        end = start.replace(year=start.year + month_index // 12, month=month_index % 12 + 1)
+    elif period == 'year':
+        end = start.replace(year=start.year + 1)
+    else:
+        end = datetime.utcnow()
+    
+    return start, end
+
+def parse_datetime_utc(value) -> datetime:
+    """Parse an ISO string (or datetime) into a naive UTC datetime. Raises ValueError/TypeError."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if not isinstance(value, datetime):
+        raise TypeError('Invalid date')
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 def format_duration(seconds: int) -> str:
     """Format duration in seconds to human readable format"""
     if seconds < 60:
@@ -277,6 +306,133 @@ def validate_transaction_amount(amount: Decimal, balance: Decimal, transaction_t
     
     return result
 
+TRANSACTION_TYPES = ('deposit', 'withdraw')
+
+def validate_transaction_payload(data: Dict, max_amount: Optional[Decimal] = None) -> Dict[str, any]:
+    """
+    Validate and normalize one transaction payload (bulk API / CSV import).
+    On success `transaction` holds type, amount (Decimal), date (naive UTC, or
+    None when missing) and the optional text fields.
+    """
+    result = {
+        'is_valid': True,
+        'errors': [],
+        'transaction': None
+    }
+    
+    if not isinstance(data, dict):
+        result['is_valid'] = False
+        result['errors'].append('Transaction must be an object')
+        return result
+    
+    tx_type = data.get('type')
+    if tx_type not in TRANSACTION_TYPES:
+        result['errors'].append('Type must be "deposit" or "withdraw"')
+    
+    amount = None
+    try:
+        amount = Decimal(str(data.get('amount'))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        if not amount.is_finite() or amount <= 0:
+            result['errors'].append('Amount must be greater than zero')
+        elif max_amount is not None and amount > max_amount:
+            result['errors'].append(f'Amount exceeds the maximum of {max_amount}')
+    except (ArithmeticError, ValueError, TypeError):
+        result['errors'].append('Invalid amount')
+    
+    tx_date = None
+    if data.get('date'):
+        try:
+            tx_date = parse_datetime_utc(data['date'])
+        except (ValueError, TypeError):
+            result['errors'].append('Invalid date format')
+    
+    attributes = validate_transaction_attributes(data.get('tags'), data.get('meta'))
+    result['errors'].extend(attributes['errors'])
+    
+    if result['errors']:
+        result['is_valid'] = False
+        return result
+    
+    result['transaction'] = {
+        'type': tx_type,
+        'amount': amount,
+        'date': tx_date,
+        'category': data.get('category') or None,
+        'description': data.get('description') or None,
+        'game_type': data.get('gameType', data.get('game_type')) or None,
+        'betting_session_id': data.get('bettingSessionId', data.get('betting_session_id')) or None,
+        'meta': attributes['meta'],
+        'tags': attributes['tags'],
+        **promote_meta_columns(attributes['meta']),
+    }
+    return result
+
+MAX_TRANSACTION_TAGS = 20
+MAX_TAG_LENGTH = 30
+
+def validate_transaction_attributes(tags, meta) -> Dict[str, any]:
+    """
+    Validate the optional tags (list of strings) and meta (object) of a
+    transaction. Promoted meta keys must have the type of their column:
+    odds and stake positive numbers, bet_type a short string.
+    On success `tags` holds the stripped, de-duplicated tags.
+    """
+    result = {
+        'is_valid': True,
+        'errors': [],
+        'tags': [],
+        'meta': {}
+    }
+    
+    if tags is not None:
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            result['errors'].append('Tags must be a list of strings')
+        else:
+            cleaned = list(dict.fromkeys(tag.strip() for tag in tags if tag.strip()))
+            if len(cleaned) > MAX_TRANSACTION_TAGS:
+                result['errors'].append(f'At most {MAX_TRANSACTION_TAGS} tags are allowed')
+            elif any(len(tag) > MAX_TAG_LENGTH for tag in cleaned):
+                result['errors'].append(f'Tags must have at most {MAX_TAG_LENGTH} characters')
+            result['tags'] = cleaned
+    
+    if meta is not None:
+        if not isinstance(meta, dict):
+            result['errors'].append('Meta must be an object')
+        else:
+            for key in ('odds', 'stake'):
+                if meta.get(key) is None:
+                    continue
+                try:
+                    value = Decimal(str(meta[key]))
+                    if isinstance(meta[key], bool) or not value.is_finite() or value <= 0:
+                        raise ValueError
+                except (ArithmeticError, ValueError, TypeError):
+                    result['errors'].append(f'Meta "{key}" must be a positive number')
+            bet_type = meta.get('bet_type')
+            if bet_type is not None and (not isinstance(bet_type, str) or len(bet_type.strip()) > 30):
+                result['errors'].append('Meta "bet_type" must be a string of at most 30 characters')
+            result['meta'] = meta
+    
+    if result['errors']:
+        result['is_valid'] = False
+    return result
+
+def promote_meta_columns(meta: Optional[Dict]) -> Dict[str, any]:
+    """
+    Values of the typed, indexed columns that mirror the hot meta keys
+    (odds -> bet_odds, bet_type -> bet_type, stake -> bet_stake) for an
+    already validated meta.
+    """
+    meta = meta or {}
+    odds, stake, bet_type = meta.get('odds'), meta.get('stake'), meta.get('bet_type')
+    if bet_type is not None:
+        bet_type = bet_type.strip().lower() or None
+    return {
+        'bet_odds': Decimal(str(odds)).quantize(Decimal('0.001'), rounding=ROUND_HALF_UP) if odds is not None else None,
+        'bet_type': bet_type,
+        'bet_stake': Decimal(str(stake)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if stake is not None else None,
+    }
+
 # === SECURITY UTILITIES ===
 
 def generate_session_id() -> str:
@@ -313,6 +469,10 @@ def parse_currency_input(input_str: str) -> Decimal:
     """Parse currency input string to Decimal"""
     # Remove currency symbols and spaces
     cleaned = re.sub(r'[R$\s]', '', input_str)
+    # The last separator is the decimal one ("1.234,56" or "1,234.56"); others group thousands
+    if ',' in cleaned and '.' in cleaned:
+        thousands = '.' if cleaned.rfind(',') > cleaned.rfind('.') else ','
+        cleaned = cleaned.replace(thousands, '')
     # Replace comma with dot for decimal separator
     cleaned = cleaned.replace(',', '.')
     
@@ -328,10 +488,12 @@ def calculate_moving_average(values: List[Decimal], window: int) -> List[Decimal
     if len(values) < window:
         return values
     
-    moving_averages = []
-    for i in range(len(values) - window + 1):
-        avg = sum(values[i:i+window]) / window
-        moving_averages.append(avg.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+    # Sliding sum: each step adds the new value and drops the oldest one
+    running = sum(values[:window], Decimal('0'))
+    moving_averages = [(running / window).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)]
+    for i in range(window, len(values)):
+        running += values[i] - values[i - window]
+        moving_averages.append((running / window).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
     
     return moving_averages
 
@@ -346,6 +508,42 @@ def calculate_volatility(returns: List[Decimal]) -> Decimal:
     
     return volatility.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
+def downsample_lttb(xs: List[float], ys: List[float], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns the indices of at
+    most `threshold` points (first and last always kept) that preserve the
+    visual shape of the series; xs must be increasing.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    
+    bucket_size = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    
+    for i in range(threshold - 2):
+        # Average point of the next bucket (the last one is just the final point)
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+        
+        # Point of the current bucket forming the largest triangle with a and the average
+        ax, ay = xs[a], ys[a]
+        best, best_area = next_start - 1, -1.0
+        for j in range(int(i * bucket_size) + 1, next_start):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        
+        selected.append(best)
+        a = best
+    
+    selected.append(n - 1)
+    return selected
+
 def generate_performance_insights(stats: Dict) -> List[str]:
     """Generate performance insights based on statistics"""
     insights = []
@@ -0,0 +1,98 @@
+# versioning.py
+"""
+Versão dos dados por usuário (user_balances.data_version).
+
+Todo flush que insere, altera ou remove linhas de um usuário (transações,
+objetivos, perfis, sessões) incrementa a versão dele na mesma transação do
+banco. Leituras usam a versão para ETag/Last-Modified, chaves de cache e
+sincronização, sem precisar olhar as tabelas de dados.
+"""
+
+from datetime import datetime
+from itertools import chain
+from sqlalchemy import event, text, bindparam
+
+from . import db
+from .models import Transaction, Objective, BettingProfile, BettingSession, UserBalance
+
+# Modelos cuja escrita muda o que o usuário vê nas rotas de leitura
+VERSIONED_MODELS = (Transaction, Objective, BettingProfile, BettingSession)
+
+
+def get_data_version(user_id):
+    """
+    (versão, data da última escrita) do usuário; (0, None) se ainda não houver
+    ledger. A versão 0 não identifica os dados: não use em caches nem ETags.
+    """
+    row = db.session.query(
+        UserBalance.data_version, UserBalance.data_updated_at
+    ).filter(UserBalance.user_id == user_id).first()
+
+    if row is None:
+        return 0, None
+    return row.data_version or 0, row.data_updated_at
+
+
+def bump_data_version(user_ids, session=None):
+    """
+    Incrementa a versão dos usuários informados. O incremento é feito no
+    banco (data_version = data_version + 1), então escritas concorrentes
+    nunca geram a mesma versão. Usuário sem ledger (anterior a ele) ganha o
+    registro aqui, já na versão 1, a menos que a própria escrita esteja
+    criando o ledger ou transações dele (cadastro, importação), caso em que
+    o registro vem dela.
+    """
+    from .ledger import rebuild_user_ledger
+
+    session = session or db.session
+    now = datetime.utcnow()
+    pending = {
+        obj.user_id for obj in session.new
+        if isinstance(obj, (UserBalance, Transaction))
+    }
+
+    with session.no_autoflush:
+        for user_id in set(user_ids):
+            ledger = session.get(UserBalance, user_id)
+            if ledger is None:
+                if user_id in pending:
+                    continue
+                ledger = rebuild_user_ledger(user_id, flush=False)
+                ledger.data_version = 1
+                ledger.data_updated_at = now
+                continue
+            ledger.data_version = UserBalance.data_version + 1
+            ledger.data_updated_at = now
+
+
+def bump_data_version_on(connection, user_ids):
+    """
+    bump_data_version para conexões fora da sessão do Flask-SQLAlchemy
+    (workers de reconstrução), na transação de `connection`.
+    """
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return
+
+    connection.execute(text("""
+        UPDATE user_balances
+        SET data_version = data_version + 1, data_updated_at = :now
+        WHERE user_id IN :user_ids
+    """).bindparams(
+        bindparam('user_ids', expanding=True), bindparam('now', type_=db.DateTime)
+    ), {'user_ids': user_ids, 'now': datetime.utcnow()})
+
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_versions_on_flush(session, flush_context, instances):
+    changed = chain(
+        session.new,
+        (obj for obj in session.dirty if session.is_modified(obj)),
+        session.deleted
+    )
+    user_ids = {
+        obj.user_id for obj in changed
+        if isinstance(obj, VERSIONED_MODELS) and obj.user_id is not None
+    }
+    if user_ids:
+        bump_data_version(user_ids, session)
@@ -17,6 +17,7 @@ from logging.handlers import RotatingFileHandler
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app, db
+from app.config import GAME_CONFIGURATIONS
 
 # Get configuration from environment
 config_name = os.getenv('FLASK_ENV', 'development')
@@ -89,19 +90,21 @@ def setup_application():
     with app.app_context():
         app.logger.info(f'BETTING MANAGEMENT APPLICATION starting in {config_name} mode')
         
-        # Create tables if they don't exist
+        # Development server only (one process): create tables and apply schema
+        # upgrades here. Deployments run "flask upgrade-db" before starting workers.
         try:
-            db.create_all()
-            app.logger.info('Database tables verified/created')
+            from app.schema import prepare_database
+            changes = prepare_database()
+            app.logger.info(f'Database tables verified/created ({len(changes)} schema changes)')
         except Exception as e:
-            app.logger.error(f'Failed to create tables: {str(e)}')
+            app.logger.error(f'Failed to prepare database: {str(e)}')
 
 @app.shell_context_processor
 def make_shell_context():
     """Add models and utilities to Flask shell context"""
     # Import models here to avoid circular imports
     try:
-        from app.models import User, BettingProfile, Transaction, Objective, BettingSession, BettingStats
+        from app.models import User, BettingProfile, Transaction, Objective, BettingSession, BettingStats, UserBalance
         return {
             'db': db,
             'User': User,
@@ -110,6 +113,7 @@ def make_shell_context():
             'Objective': Objective,
             'BettingSession': BettingSession,
             'BettingStats': BettingStats,
+            'UserBalance': UserBalance,
             'app': app,
             'datetime': datetime,
             'timedelta': timedelta,
@@ -133,7 +137,8 @@ def init_db(force):
             db.drop_all()
         
         click.echo('Creating database tables...')
-        db.create_all()
+        from app.schema import prepare_database
+        prepare_database()
         
         # Verify tables were created
         with app.app_context():
@@ -336,6 +341,348 @@ def seed_data(count):
         db.session.rollback()
         sys.exit(1)
 
+@app.cli.command()
+def upgrade_db():
+    """Add missing columns and indexes to existing tables and backfill derived data"""
+    try:
+        from app.schema import prepare_database, backfill_promoted_meta
+        from app.ledger import backfill_missing_ledgers
+        from app.categories import backfill_category_stats
+        from app.running_stats import backfill_running_stats
+
+        click.echo('🔧 Upgrading database schema...')
+        changes = prepare_database()
+
+        if changes:
+            for change in changes:
+                click.echo(f'   ✔ {change}')
+            click.echo(f'✅ Schema upgraded ({len(changes)} changes)')
+        else:
+            click.echo('✅ Schema already up to date')
+
+        click.echo('🔄 Backfilling bet_odds/bet_type/bet_stake from transaction meta...')
+        filled = backfill_promoted_meta()
+        click.echo(f'✅ {filled} transactions backfilled')
+
+        click.echo('🔄 Creating balance ledgers for users without one...')
+        ledgers, skipped = backfill_missing_ledgers()
+        click.echo(f'✅ {ledgers} ledgers created')
+        if skipped:
+            click.echo(f'⚠️  Skipped users with invalid transaction totals: {", ".join(map(str, skipped))}')
+
+        click.echo('🔄 Building category stats for users without them...')
+        categorized = backfill_category_stats()
+        click.echo(f'✅ Category stats built for {categorized} users')
+
+        click.echo('🔄 Building running stats for users without them...')
+        running = backfill_running_stats()
+        click.echo(f'✅ Running stats built for {running} users')
+        click.echo('   Run "flask rebuild-running-stats" once to drop cash deposits/withdrawals from existing returns')
+        click.echo('   Run "flask rebuild-stats" to backfill session results in betting_stats')
+        app.logger.info(f'Database schema upgraded: {len(changes)} changes, {filled} transactions backfilled, '
+                        f'{ledgers} ledgers created, category stats built for {categorized} users, '
+                        f'running stats built for {running} users')
+
+    except Exception as e:
+        click.echo(f'❌ Error upgrading schema: {str(e)}')
+        app.logger.error(f'Failed to upgrade schema: {str(e)}')
+        sys.exit(1)
+
+@app.cli.command()
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Rebuild only these users (repeatable)')
+def rebuild_balances(user_ids):
+    """Rebuild the materialized balance ledger from the transactions table"""
+    try:
+        from app.ledger import rebuild_all_ledgers
+
+        click.echo('🔄 Rebuilding balance ledger...')
+        rebuilt = rebuild_all_ledgers(list(user_ids) or None)
+
+        click.echo(f'✅ Balance ledger rebuilt for {rebuilt} users')
+        app.logger.info(f'Balance ledger rebuilt for {rebuilt} users')
+
+    except Exception as e:
+        click.echo(f'❌ Error rebuilding balances: {str(e)}')
+        app.logger.error(f'Failed to rebuild balances: {str(e)}')
+        db.session.rollback()
+        sys.exit(1)
+
+@app.cli.command()
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Rebuild only these users (repeatable)')
+def rebuild_running_stats(user_ids):
+    """Rebuild the per-user running stats (returns, drawdown, streaks) from the full history"""
+    try:
+        from app.running_stats import rebuild_all_running_stats
+
+        click.echo('🔄 Rebuilding running stats...')
+        rebuilt = rebuild_all_running_stats(list(user_ids) or None)
+
+        click.echo(f'✅ Running stats rebuilt for {rebuilt} users')
+        app.logger.info(f'Running stats rebuilt for {rebuilt} users')
+
+    except Exception as e:
+        click.echo(f'❌ Error rebuilding running stats: {str(e)}')
+        app.logger.error(f'Failed to rebuild running stats: {str(e)}')
+        db.session.rollback()
+        sys.exit(1)
+
+@app.cli.command()
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Rebuild only periods from this date (YYYY-MM-DD)')
+@click.option('--users', default=None, help='Comma-separated user ids (default: all users)')
+@click.option('--chunk-size', type=int, default=500, help='Users per worker job')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count, 1 on SQLite)')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None, help='Checkpoint file to resume an interrupted rebuild')
+def rebuild_stats(since, users, chunk_size, workers, checkpoint):
+    """Rebuild betting_stats and category_stats rollups in parallel worker processes"""
+    try:
+        import time
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        from app.models import User
+        from app.rollups import (
+            rebuild_stats_chunk, _init_rebuild_worker, load_checkpoint, save_checkpoint
+        )
+
+        since_date = since.date() if since else None
+
+        if users:
+            user_ids = sorted({int(user_id) for user_id in users.split(',') if user_id.strip()})
+        else:
+            user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+
+        completed = load_checkpoint(checkpoint, since_date)
+        pending = [user_id for user_id in user_ids if user_id not in completed]
+        if completed:
+            click.echo(f'⏩ Resuming: {len(user_ids) - len(pending)} users already rebuilt')
+
+        chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+
+        database_uri = db.engine.url.render_as_string(hide_password=False)
+        if db.engine.dialect.name == 'sqlite':
+            workers = 1  # SQLite serializes writers; parallel jobs would only contend for the lock
+        workers = workers or os.cpu_count() or 1
+
+        click.echo(f'📊 Rebuilding stats for {len(pending)} users in {len(chunks)} chunks with {workers} workers...')
+
+        # Workers open their own engines; don't share pooled connections across fork
+        db.session.remove()
+        db.engine.dispose()
+
+        started = time.perf_counter()
+        total_rows = 0
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_rebuild_worker, initargs=(database_uri,)) as executor:
+            futures = [executor.submit(rebuild_stats_chunk, chunk, since_date) for chunk in chunks]
+
+            for future in as_completed(futures):
+                chunk_user_ids, rows = future.result()
+                total_rows += rows
+                completed.update(chunk_user_ids)
+                if checkpoint:
+                    save_checkpoint(checkpoint, completed, since_date)
+
+                elapsed = time.perf_counter() - started
+                click.echo(f'   ✔ {len(completed)}/{len(user_ids)} users, {total_rows} rows ({total_rows / elapsed:.0f} rows/s)')
+
+        elapsed = time.perf_counter() - started
+        click.echo(f'✅ Stats rebuilt: {total_rows} rows for {len(pending)} users in {elapsed:.1f}s '
+                   f'({total_rows / elapsed if elapsed else 0:.0f} rows/s)')
+        app.logger.info(f'Stats rebuilt: {total_rows} rows, {len(pending)} users, {elapsed:.1f}s')
+
+    except Exception as e:
+        click.echo(f'❌ Error rebuilding stats: {str(e)}')
+        app.logger.error(f'Failed to rebuild stats: {str(e)}')
+        sys.exit(1)
+
+@app.cli.command()
+@click.option('--user-id', type=int, default=None, help='Export a single user (default: all users)')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', help='Output format')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), default=None, help='Output file (default: stdout)')
+@click.option('--chunk-size', type=int, default=1000, help='Rows fetched and written per chunk')
+def export_transactions(user_id, fmt, output, chunk_size):
+    """Stream transactions to CSV or NDJSON with constant memory"""
+    try:
+        import time
+        from app.export import build_export_query, iter_export
+
+        started = time.perf_counter()
+        stream = open(output, 'w', encoding='utf-8', newline='') if output else sys.stdout
+        written = 0
+
+        try:
+            for chunk in iter_export(build_export_query(user_id), fmt, chunk_size):
+                stream.write(chunk)
+                written += len(chunk)
+        finally:
+            if output:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        if output:
+            click.echo(f'✅ Exported transactions to {output} ({written / 1024:.1f} KB in {elapsed:.2f}s)')
+        app.logger.info(f'Transactions exported (user={user_id or "all"}, format={fmt}, {elapsed:.2f}s)')
+
+    except Exception as e:
+        click.echo(f'❌ Error exporting transactions: {str(e)}', err=True)
+        app.logger.error(f'Failed to export transactions: {str(e)}')
+        sys.exit(1)
+
+@app.cli.command()
+def rebuild_search_index():
+    """Create the transaction search index if missing and rebuild its contents"""
+    try:
+        from app.search import rebuild_search_index as rebuild_index
+
+        click.echo('🔎 Rebuilding transaction search index...')
+        with db.engine.begin() as connection:
+            rebuild_index(connection)
+
+        click.echo('✅ Transaction search index rebuilt')
+        app.logger.info('Transaction search index rebuilt')
+
+    except Exception as e:
+        click.echo(f'❌ Error rebuilding search index: {str(e)}')
+        app.logger.error(f'Failed to rebuild search index: {str(e)}')
+        sys.exit(1)
+
+@app.cli.command()
+@click.option('--user-id', type=int, default=None, help="Use this user's balance and active profile")
+@click.option('--balance', type=float, default=None, help='Starting balance (default: the user balance)')
+@click.option('--stop-loss', type=float, default=None, help='Stop-loss balance floor (default: profile stop loss)')
+@click.option('--target', type=float, default=None, help='Profit target balance (default: initial bank + profile target)')
+@click.option('--game', 'game_type', type=click.Choice(sorted(GAME_CONFIGURATIONS)), default='roulette', help='Game type')
+@click.option('--bet-fraction', type=float, default=None, help='Stake as a fraction of the starting balance')
+@click.option('--paths', type=int, default=50000, help='Number of simulated bankroll paths')
+@click.option('--rounds', type=int, default=500, help='Maximum bets per path')
+@click.option('--seed', type=click.IntRange(min=0), default=0, help='Random seed (same seed, same result)')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: SIMULATION_WORKERS)')
+@click.option('--time-budget', type=float, default=None, help='Stop after this many seconds (default: no limit)')
+def simulate_ruin(user_id, balance, stop_loss, target, game_type, bet_fraction, paths, rounds, seed, workers, time_budget):
+    """Estimate risk of ruin with a Monte Carlo simulation"""
+    try:
+        from app.simulation import simulate_risk_of_ruin
+
+        if user_id is not None:
+            from app.context import get_financial_context
+
+            context = get_financial_context(user_id)
+            profile = context.profile
+            if balance is None:
+                balance = float(context.balance)
+            if stop_loss is None and profile:
+                stop_loss = float(profile.stop_loss or 0)
+            if target is None and profile and profile.profit_target:
+                target = float(context.initial_bank + profile.profit_target)
+
+        if not balance or balance <= 0:
+            click.echo('❌ Provide --balance or a --user-id with a positive balance')
+            sys.exit(1)
+
+        click.echo(f'🎲 Simulating {paths} paths x {rounds} rounds of {game_type}...')
+        result = simulate_risk_of_ruin(
+            start_balance=balance,
+            stop_loss=stop_loss or 0.0,
+            profit_target=target,
+            game_type=game_type,
+            bet_fraction=bet_fraction,
+            paths=paths,
+            rounds=rounds,
+            seed=seed,
+            workers=workers or app.config.get('SIMULATION_WORKERS', 1),
+            parallel_threshold=app.config.get('SIMULATION_PARALLEL_THRESHOLD', 20000),
+            time_budget=time_budget
+        )
+
+        parameters = result['parameters']
+        low, high = result['ruin_probability_interval']
+        target_label = f'{parameters["profit_target"]:.2f}' if parameters['profit_target'] is not None else 'none'
+        click.echo(f'   Stake: {parameters["stake"]:.2f} | stop loss: {parameters["stop_loss"]:.2f} | target: {target_label}')
+        click.echo(f'   Ruin probability:   {result["ruin_probability"] * 100:.2f}% ({low * 100:.2f}%-{high * 100:.2f}%)')
+        click.echo(f'   Target probability: {result["target_probability"] * 100:.2f}%')
+        click.echo(f'   Expected rounds:    {result["expected_rounds"]:.1f}')
+        final = result['final_balance']
+        click.echo(f'   Final balance p5/p50/p95: {final["p5"]:.2f} / {final["p50"]:.2f} / {final["p95"]:.2f}')
+        if result['truncated']:
+            click.echo(f'⚠️  Time budget reached: {result["paths"]} of {paths} paths simulated')
+        click.echo(f'✅ Simulated {result["paths"]} paths with {result["workers"]} workers in {result["elapsed_ms"]:.0f} ms')
+
+    except Exception as e:
+        click.echo(f'❌ Error running simulation: {str(e)}')
+        app.logger.error(f'Failed to run risk-of-ruin simulation: {str(e)}')
+        sys.exit(1)
+
+@app.cli.command()
+@click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True, help='User that owns the imported transactions')
+@click.option('--batch-size', type=int, default=5000, help='Rows per COPY/INSERT batch')
+@click.option('--delimiter', default=',', help='CSV delimiter (use ";" for pt-BR spreadsheets)')
+@click.option('--skip-invalid', is_flag=True, help='Skip invalid rows instead of aborting the import')
+def import_transactions(csv_file, user_id, batch_size, delimiter, skip_invalid):
+    """Bulk import historical transactions from a CSV file"""
+    try:
+        import time
+        from app.models import User
+        from app.importer import (
+            iter_import_batches, begin_import, load_batch, finalize_import, ImportRowError, ImportBalanceError
+        )
+
+        if db.session.get(User, user_id) is None:
+            click.echo(f'❌ User {user_id} not found')
+            sys.exit(1)
+
+        click.echo(f'📥 Importing {csv_file} for user {user_id}...')
+        started = time.perf_counter()
+        loaded = 0
+        skipped = []
+        earliest = None
+
+        try:
+            # Concurrent API writes for this user wait until the import commits
+            begin_import(user_id)
+            with open(csv_file, encoding='utf-8-sig', newline='') as stream:
+                for rows, batch_skipped in iter_import_batches(stream, user_id, batch_size, delimiter, skip_invalid):
+                    loaded += load_batch(rows)
+                    skipped.extend(batch_skipped)
+                    if rows:
+                        batch_earliest = min(row['date'] for row in rows)
+                        earliest = batch_earliest if earliest is None else min(earliest, batch_earliest)
+
+                    elapsed = time.perf_counter() - started
+                    click.echo(f'   ✔ {loaded} rows loaded ({loaded / elapsed:.0f} rows/s)')
+
+            load_elapsed = time.perf_counter() - started
+            if loaded:
+                click.echo('🔄 Recomputing balances and stats...')
+                finalize_import(user_id, earliest)
+            db.session.commit()
+
+        except ImportRowError as e:
+            db.session.rollback()
+            click.echo(f'❌ Import aborted, nothing was saved. {str(e)}')
+            click.echo('   Fix the file or run again with --skip-invalid')
+            sys.exit(1)
+        except ImportBalanceError as e:
+            db.session.rollback()
+            click.echo(f'❌ Import aborted, nothing was saved. {str(e)}')
+            sys.exit(1)
+
+        elapsed = time.perf_counter() - started
+        click.echo(f'✅ Imported {loaded} transactions in {elapsed:.1f}s '
+                   f'(load {loaded / load_elapsed if load_elapsed else 0:.0f} rows/s, '
+                   f'total {loaded / elapsed if elapsed else 0:.0f} rows/s)')
+        for error in skipped[:20]:
+            click.echo(f'   ⚠️  Skipped: {str(error)}')
+        if len(skipped) > 20:
+            click.echo(f'   ⚠️  ... and {len(skipped) - 20} more skipped rows')
+        app.logger.info(f'Imported {loaded} transactions for user {user_id} ({len(skipped)} skipped, {elapsed:.1f}s)')
+
+    except SystemExit:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        click.echo(f'❌ Error importing transactions: {str(e)}')
+        app.logger.error(f'Failed to import transactions: {str(e)}')
+        sys.exit(1)
+
 @app.cli.command()
 def check_health():
     """Check application health and configuration"""
@@ -452,6 +799,13 @@ if __name__ == '__main__':
             print(f'   • flask init-db          # Initialize database')
             print(f'   • flask create-admin     # Create admin user')
             print(f'   • flask seed-data        # Add sample data')
+            print(f'   • flask upgrade-db       # Add new columns/indexes to existing tables')
+            print(f'   • flask rebuild-balances # Rebuild balance ledger')
+            print(f'   • flask rebuild-stats    # Rebuild analytics rollups')
+            print(f'   • flask rebuild-search-index # Rebuild transaction search index')
+            print(f'   • flask simulate-ruin    # Monte Carlo risk of ruin')
+            print(f'   • flask import-transactions # Import CSV history')
+            print(f'   • flask export-transactions # Export transactions (CSV/NDJSON)')
             print(f'   • flask check-health     # System health check')
             print(f'\nServer is starting...\n')
         
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from app.routes import generate_token  # noqa: E402
+from app.schema import prepare_database  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        prepare_database()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(client):
+    """Usuário cadastrado pela API com banca inicial de 1000: (id, headers)"""
+    response = client.post('/auth/register', json={
+        'name': 'Teste', 'email': 'teste@example.com', 'password': 'segredo123', 'initialBank': 1000
+    })
+    assert response.status_code == 201
+    user_id = response.get_json()['user']['id']
+    return user_id, {'Authorization': f'Bearer {generate_token(user_id)}'}
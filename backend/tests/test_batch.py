@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+import pytest
+from flask import jsonify
+
+from app import db
+from app.models import Objective, Transaction
+
+
+@pytest.fixture
+def app(app):
+    # Rota que altera a transação inicial e responde com erro sem desfazer a alteração
+    def failing_write(transaction_id):
+        db.session.get(Transaction, transaction_id).amount = Decimal('777.00')
+        return jsonify({'success': False, 'error': 'falhou'}), 400
+
+    app.add_url_rule(
+        '/test/failing-write/<int:transaction_id>', endpoint='main.test_failing_write',
+        view_func=failing_write, methods=['POST']
+    )
+    return app
+
+
+def _initial_transaction(app, user_id):
+    with app.app_context():
+        return Transaction.query.filter_by(user_id=user_id, is_initial_bank=True).one().id
+
+
+def test_failed_sub_request_is_rolled_back(app, client, user):
+    user_id, headers = user
+    transaction_id = _initial_transaction(app, user_id)
+
+    response = client.post('/batch', headers=headers, json={'requests': [
+        {'method': 'POST', 'path': f'/test/failing-write/{transaction_id}'},
+        {'method': 'POST', 'path': '/objectives', 'body': {'title': 'Meta', 'target_amount': 500, 'current_amount': 0}},
+    ]})
+
+    assert response.status_code == 200
+    assert [item['status'] for item in response.get_json()['responses']] == [400, 201]
+    with app.app_context():
+        assert db.session.get(Transaction, transaction_id).amount == Decimal('1000.00')
+        assert Objective.query.filter_by(user_id=user_id).count() == 1
+
+
+def test_invalid_update_does_not_change_transaction(app, client, user):
+    user_id, headers = user
+    transaction_id = _initial_transaction(app, user_id)
+
+    response = client.post('/batch', headers=headers, json={'requests': [
+        {'method': 'PUT', 'path': f'/transactions/{transaction_id}', 'body': {'amount': 999, 'date': 'ontem'}},
+        {'method': 'PUT', 'path': f'/transactions/{transaction_id}', 'body': {'amount': 'abc'}},
+        {'method': 'GET', 'path': '/balance'},
+    ]})
+
+    responses = response.get_json()['responses']
+    assert [item['status'] for item in responses] == [400, 400, 200]
+    assert responses[2]['body']['balance'] == '1000.00'
+    with app.app_context():
+        assert db.session.get(Transaction, transaction_id).amount == Decimal('1000.00')
@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+from app import db
+from app.ledger import backfill_missing_ledgers
+from app.models import UserBalance
+from app.versioning import get_data_version
+
+
+def _drop_ledger(app, user_id):
+    # Simula um usuário anterior ao ledger
+    with app.app_context():
+        UserBalance.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+        assert get_data_version(user_id) == (0, None)
+
+
+def test_write_creates_missing_ledger_and_bumps_version(app, client, user):
+    user_id, headers = user
+    _drop_ledger(app, user_id)
+
+    response = client.get('/objectives', headers=headers)
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+
+    response = client.post('/objectives', headers=headers, json={'title': 'Meta', 'target_amount': 500, 'current_amount': 0})
+    assert response.status_code == 201
+
+    with app.app_context():
+        assert get_data_version(user_id)[0] == 1
+        assert db.session.get(UserBalance, user_id).balance == Decimal('1000.00')
+
+    response = client.get('/objectives', headers=headers)
+    assert response.headers['ETag'].startswith(f'W/"{user_id}-1-')
+    assert len(response.get_json()['data']) == 1
+
+
+def test_backfill_creates_missing_ledgers(app, user):
+    user_id, _ = user
+    _drop_ledger(app, user_id)
+
+    with app.app_context():
+        assert backfill_missing_ledgers() == (1, [])
+        assert get_data_version(user_id)[0] == 1
+        assert backfill_missing_ledgers() == (0, [])